@@ -4,8 +4,8 @@ from .models import ChatMessage
 
 @admin.register(ChatMessage)
 class ChatMessageAdmin(admin.ModelAdmin):
-    list_display = ['user', 'user_message_preview', 'ai_response_preview', 'timestamp']
-    list_filter = ['timestamp', 'user']
+    list_display = ['user', 'user_message_preview', 'ai_response_preview', 'status', 'timestamp']
+    list_filter = ['status', 'timestamp', 'user']
     search_fields = ['user__username', 'user_message', 'ai_response']
     readonly_fields = ['timestamp']
     date_hierarchy = 'timestamp'
@@ -1,9 +1,20 @@
 from django.apps import AppConfig
 import logging
+import os
 
 logger = logging.getLogger(__name__)
 
 
+def _serves_requests():
+    """True in processes that will answer HTTP requests"""
+    import sys
+    
+    if 'runserver' in sys.argv:
+        # With the autoreloader, only the child process (RUN_MAIN) serves
+        return os.environ.get('RUN_MAIN') == 'true' or '--noreload' in sys.argv
+    return any(server in os.path.basename(sys.argv[0]) for server in ('gunicorn', 'uvicorn', 'daphne'))
+
+
 class ChatConfig(AppConfig):
     name = 'chat'
     default_auto_field = 'django.db.models.BigAutoField'
@@ -14,6 +25,7 @@ class ChatConfig(AppConfig):
         This runs once per process.
         """
         import sys
+        from django.conf import settings
         
         # Only start scheduler in the main process (not during migrations, etc.)
         if 'runserver' in sys.argv or 'gunicorn' in sys.argv[0]:
@@ -23,3 +35,22 @@ class ChatConfig(AppConfig):
                 logger.info("Chat app scheduler initialized")
             except Exception as e:
                 logger.error(f"Failed to start scheduler: {str(e)}")
+        
+        if _serves_requests():
+            # Load the model and index now rather than in the first chat request;
+            # /healthz/ready reports 503 until this finishes
+            if settings.RAG_WARMUP:
+                try:
+                    from .rag_service import get_rag_service
+                    get_rag_service().warm_up()
+                    logger.info("RAG service warm-up started")
+                except Exception as e:
+                    logger.error(f"Failed to start RAG warm-up: {str(e)}")
+            
+            # Resume background chats queued before a restart
+            try:
+                from .job_queue import get_job_queue
+                get_job_queue().start()
+                logger.info("Chat job queue initialized")
+            except Exception as e:
+                logger.error(f"Failed to start chat job queue: {str(e)}")
@@ -0,0 +1,314 @@
+"""
+Async (ASGI) variants of the chat and conversation endpoints.
+
+Served under /api/async/ alongside the DRF views. Under an ASGI server
+(e.g. ``uvicorn core.asgi:application``) a chat request waiting on
+Gemini holds no worker thread, so one process can keep many more chats
+in flight than it has threads. Encoding and search run on the RAG
+service's bounded executor, and for a new conversation the conversation
+is created concurrently with retrieval instead of before it (follow-ups
+need the conversation's memory first).
+
+Authentication uses the same JWT access tokens as the rest of the API.
+"""
+import asyncio
+import functools
+import json
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import Http404, JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from .models import ChatMessage, Conversation
+from .serializers import (
+    ChatJobSerializer,
+    ChatMessageSerializer,
+    ChatRequestSerializer,
+    ConversationSerializer,
+    ConversationDetailSerializer
+)
+from .job_queue import get_job_queue
+from .memory import conversation_history, remember_turn
+from .rag_service import UnknownCollection, get_rag_service
+from .views import queue_chat_job
+
+
+def async_jwt_required(*methods):
+    """Authenticate an async view with a JWT access token and restrict its HTTP methods"""
+    def decorator(view):
+        @csrf_exempt
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                return JsonResponse({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+            try:
+                result = await sync_to_async(JWTAuthentication().authenticate)(request)
+            except AuthenticationFailed as e:
+                return JsonResponse({'detail': str(e.detail)}, status=401)
+            if result is None:
+                return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+            request.user = result[0]
+            return await view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _parse_json(request):
+    try:
+        return json.loads(request.body or b'{}')
+    except ValueError:
+        return None
+
+
+async def _get_conversation(user, conversation_id):
+    try:
+        return await Conversation.objects.aget(id=conversation_id, user=user)
+    except Conversation.DoesNotExist:
+        raise Http404('No Conversation matches the given query.')
+
+
+@async_jwt_required('POST')
+async def chat(request):
+    """
+    Async chat endpoint
+
+    POST /async/chat
+    Body: same as /chat
+    Returns: same as /chat, including 202 with a job for "respond_async": true
+    or a "Prefer: respond-async" header
+    """
+    start_time = time.time()
+
+    data = _parse_json(request)
+    if data is None:
+        return JsonResponse({'error': 'Invalid JSON body'}, status=400)
+    serializer = ChatRequestSerializer(data=data)
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=400)
+
+    try:
+        rag_service = get_rag_service(serializer.validated_data.get('collection'))
+    except UnknownCollection as e:
+        return JsonResponse({'error': str(e)}, status=404)
+
+    if serializer.validated_data['respond_async'] or 'respond-async' in request.headers.get('Prefer', ''):
+        try:
+            body, status_code, headers = await sync_to_async(queue_chat_job)(
+                request.user, serializer.validated_data
+            )
+        except Http404 as e:
+            return JsonResponse({'detail': str(e)}, status=404)
+        return JsonResponse(body, status=status_code, headers=headers)
+
+    user_message = serializer.validated_data['message']
+    conversation_id = serializer.validated_data.get('conversation_id')
+    user = request.user
+    rag_timings = {}
+    stage_times = {}
+
+    async def setup_conversation():
+        conversation_start = time.time()
+        if conversation_id:
+            conversation = await _get_conversation(user, conversation_id)
+        else:
+            # Create new conversation with first message as title
+            title = user_message[:50] + ('...' if len(user_message) > 50 else '')
+            conversation = await Conversation.objects.acreate(user=user, title=title)
+        stage_times['conversation'] = time.time() - conversation_start
+        return conversation
+
+    async def generate(history):
+        rag_start = time.time()
+        answer = await rag_service.aget_response(
+            user_message,
+            retrieval_mode=serializer.validated_data.get('retrieval_mode'),
+            fusion=serializer.validated_data.get('fusion'),
+            timings=rag_timings,
+            history=history
+        )
+        stage_times['rag'] = time.time() - rag_start
+        return answer
+
+    rag_task = None
+    conversation = None
+    chat_message = None
+    try:
+        if conversation_id:
+            # A follow-up is answered with the conversation's memory
+            conversation = await setup_conversation()
+            history = await sync_to_async(conversation_history)(conversation)
+            rag_task = asyncio.ensure_future(generate(history))
+        else:
+            # Create the conversation while retrieval and generation run
+            rag_task = asyncio.ensure_future(generate(''))
+            conversation = await setup_conversation()
+        ai_response = await rag_task
+
+        db_start = time.time()
+        chat_message = await ChatMessage.objects.acreate(
+            conversation=conversation,
+            user=user,
+            user_message=user_message,
+            ai_response=ai_response
+        )
+        await sync_to_async(remember_turn)(conversation, rag_service)
+        db_time = time.time() - db_start
+    except Http404 as e:
+        if rag_task is not None:
+            rag_task.cancel()
+        return JsonResponse({'detail': str(e)}, status=404)
+    except Exception as e:
+        if rag_task is not None:
+            rag_task.cancel()
+        if conversation is not None and chat_message is None and not conversation_id:
+            # Don't leave the conversation created for this chat behind empty
+            await conversation.adelete()
+        return JsonResponse({'error': f'Failed to process chat: {str(e)}'}, status=500)
+
+    total_time = time.time() - start_time
+    conversation_time = stage_times['conversation']
+    rag_time = stage_times['rag']
+
+    cache_source = next(
+        (name for name in ('response', 'semantic') if f'{name}_cache_hit_ms' in rag_timings),
+        None
+    )
+    data = ChatMessageSerializer(chat_message).data
+    data['conversation_id'] = conversation.id
+    data['collection'] = rag_service.collection
+    data['from_cache'] = cache_source is not None
+    data['cache'] = cache_source
+    data['tokens'] = rag_timings.pop('tokens', None)
+    data['latency'] = {
+        'total_ms': round(total_time * 1000, 2),
+        'rag_processing_ms': round(rag_time * 1000, 2),
+        'database_ms': round((conversation_time + db_time) * 1000, 2),
+        'breakdown': {
+            # Runs concurrently with rag_query_ms
+            'conversation_setup_ms': round(conversation_time * 1000, 2),
+            'rag_query_ms': round(rag_time * 1000, 2),
+            'database_save_ms': round(db_time * 1000, 2)
+        },
+        'rag_breakdown': rag_timings
+    }
+    if cache_source:
+        breakdown = data['latency']['breakdown']
+        breakdown[f'{cache_source}_cache_ms'] = breakdown.pop('rag_query_ms')
+    return JsonResponse(data, status=201)
+
+
+# How often a long-poll re-reads the job; sleeping between reads holds no thread
+JOB_LONG_POLL_INTERVAL_SECONDS = 0.25
+
+
+@async_jwt_required('GET')
+async def chat_job_status(request, job_id):
+    """
+    Get the status and result of a background chat, long-polling
+
+    GET /async/chat/jobs/<job_id>?wait=<seconds>
+    Returns: same as /chat/jobs/<job_id>
+    With wait > 0 the request returns as soon as the job finishes, or after wait
+    seconds (capped at RAG_JOB_LONG_POLL_MAX_SECONDS) if it has not.
+    """
+    try:
+        wait = float(request.GET.get('wait', 0))
+    except ValueError:
+        return JsonResponse({'error': 'wait must be a number of seconds'}, status=400)
+    wait = min(max(wait, 0.0), settings.RAG_JOB_LONG_POLL_MAX_SECONDS)
+
+    unfinished = (ChatMessage.STATUS_PENDING, ChatMessage.STATUS_RUNNING)
+    try:
+        job = await ChatMessage.objects.aget(id=job_id, user=request.user)
+    except ChatMessage.DoesNotExist:
+        return JsonResponse({'detail': 'No ChatMessage matches the given query.'}, status=404)
+    # Restarted process with jobs still queued: make sure someone drains them
+    await sync_to_async(get_job_queue().start)()
+
+    deadline = time.monotonic() + wait
+    while job.status in unfinished:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        await asyncio.sleep(min(remaining, JOB_LONG_POLL_INTERVAL_SECONDS))
+        await job.arefresh_from_db()
+
+    data = await sync_to_async(lambda: ChatJobSerializer(job).data)()
+    return JsonResponse(data)
+
+
+@async_jwt_required('GET')
+async def conversations_list(request):
+    """
+    Get list of conversations for the authenticated user
+
+    GET /async/conversations
+    Returns: List of conversations
+    """
+    conversations = [
+        conversation async for conversation in Conversation.objects.filter(user=request.user)
+    ]
+    data = await sync_to_async(lambda: ConversationSerializer(conversations, many=True).data)()
+    return JsonResponse({'count': len(conversations), 'conversations': data})
+
+
+@async_jwt_required('GET')
+async def conversation_detail(request, conversation_id):
+    """
+    Get a specific conversation with all messages
+
+    GET /async/conversations/<id>
+    Returns: Conversation with messages
+    """
+    try:
+        conversation = await _get_conversation(request.user, conversation_id)
+    except Http404 as e:
+        return JsonResponse({'detail': str(e)}, status=404)
+    data = await sync_to_async(lambda: ConversationDetailSerializer(conversation).data)()
+    return JsonResponse(data)
+
+
+@async_jwt_required('DELETE')
+async def conversation_delete(request, conversation_id):
+    """
+    Delete a conversation and all its messages
+
+    DELETE /async/conversations/<id>/delete
+    Returns: Success message
+    """
+    try:
+        conversation = await _get_conversation(request.user, conversation_id)
+    except Http404 as e:
+        return JsonResponse({'detail': str(e)}, status=404)
+    await conversation.adelete()
+    return JsonResponse({'message': 'Conversation deleted successfully'})
+
+
+@async_jwt_required('PUT')
+async def conversation_rename(request, conversation_id):
+    """
+    Rename a conversation
+
+    PUT /async/conversations/<id>/rename
+    Body: {"title": "New Title"}
+    Returns: Updated conversation
+    """
+    try:
+        conversation = await _get_conversation(request.user, conversation_id)
+    except Http404 as e:
+        return JsonResponse({'detail': str(e)}, status=404)
+
+    data = _parse_json(request) or {}
+    title = str(data.get('title', '')).strip()
+    if not title:
+        return JsonResponse({'error': 'Title cannot be empty'}, status=400)
+
+    conversation.title = title
+    await conversation.asave()
+
+    data = await sync_to_async(lambda: ConversationSerializer(conversation).data)()
+    return JsonResponse(data)
@@ -0,0 +1,105 @@
+"""
+Micro-batching for query embeddings.
+
+Request threads hand their query to ``MicroBatcher.encode`` and block on
+a future. A single background thread takes the first waiting query,
+gathers whatever else arrives within ``max_wait_ms`` (up to
+``max_batch_size`` queries) and encodes them in one call, so concurrent
+requests share a forward pass instead of contending for the model. A
+query that arrives while no other caller is waiting is encoded straight
+away, so a lightly loaded server pays no batching delay.
+"""
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """
+    Coalesce concurrent ``encode_fn([text])`` calls into batched calls.
+
+    Args:
+        encode_fn (callable): Maps a list of texts to a 2-D array
+        max_batch_size (int): Most texts encoded in one call
+        max_wait_ms (float): How long to wait for more texts once one arrives
+    """
+
+    def __init__(self, encode_fn, max_batch_size=32, max_wait_ms=2.0):
+        self.encode_fn = encode_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._waiting = 0
+        self._waiting_lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+
+    def encode(self, text):
+        """Embedding of one text as a (1, d) float32 array"""
+        self._ensure_started()
+        future = Future()
+        with self._waiting_lock:
+            self._waiting += 1
+        try:
+            self._queue.put((text, future))
+            return future.result()
+        finally:
+            with self._waiting_lock:
+                self._waiting -= 1
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self._run, name='rag-encoder-batcher', daemon=True
+                    )
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                with self._waiting_lock:
+                    waiting = self._waiting
+                if waiting <= len(batch) and self._queue.empty():
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._encode_batch(batch)
+
+    def _encode_batch(self, batch):
+        texts = [text for text, _ in batch]
+        try:
+            matrix = np.asarray(self.encode_fn(texts), dtype='float32')
+        except Exception as e:
+            logger.warning(f"Batched encoding of {len(texts)} queries failed: {str(e)}")
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.items += len(batch)
+        for row, (_, future) in enumerate(batch):
+            future.set_result(matrix[row:row + 1])
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'items': self.items,
+            'mean_batch_size': round(self.items / self.batches, 2) if self.batches else 0.0,
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000,
+        }
@@ -0,0 +1,258 @@
+"""
+Token-aware chunking of knowledge base documents.
+
+``Chunker`` packs a document into chunks of about ``target_tokens``
+tokens instead of one chunk per paragraph, so headings are not indexed
+on their own and long paragraphs are not embedded (and sent to the LLM)
+whole. It works line by line on any iterable of lines, so a file is
+streamed rather than read into memory:
+
+- Headings (``#`` lines, or a short first line of a paragraph without
+  closing punctuation) start a new chunk and are repeated at the top of
+  every chunk of their section; chunks carry the heading as ``section``.
+- List items are kept whole, and a line introducing a list (ending in
+  ``:``) stays with its items.
+- Paragraphs are packed together up to the budget and split between
+  sentences when they overflow; a split inside a paragraph repeats the
+  last ``overlap_tokens`` of the previous chunk.
+
+Token counts are estimated (``count_tokens``) without a tokenizer, to
+within the accuracy needed for budgeting: one token per punctuation mark
+and per word, plus one per six characters of a long word.
+"""
+import re
+
+WORD_PATTERN = re.compile(r"\w+|[^\w\s]")
+SENTENCE_END = re.compile(r'(?<=[.!?])\s+(?=[A-Z0-9"\'(\[])')
+LIST_ITEM = re.compile(r'^\s*(?:[-*+•]|\d{1,3}[.)])\s+')
+MARKDOWN_HEADING = re.compile(r'^\s{0,3}#{1,6}\s+')
+TITLE_MAX_WORDS = 10
+
+
+def count_tokens(text):
+    """Estimated number of model tokens in ``text``"""
+    return sum(1 + (len(word) - 1) // 6 for word in WORD_PATTERN.findall(text))
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Longest prefix of ``text`` ending at a word of at most ``max_tokens`` tokens"""
+    tokens, end = 0, 0
+    for match in WORD_PATTERN.finditer(text):
+        tokens += 1 + (len(match.group()) - 1) // 6
+        if tokens > max_tokens:
+            break
+        end = match.end()
+    return text[:end]
+
+
+def split_sentences(text):
+    return [sentence for sentence in SENTENCE_END.split(text.strip()) if sentence]
+
+
+def _is_title(line):
+    """A short line without closing punctuation, e.g. "Django REST Framework" """
+    return len(line.split()) <= TITLE_MAX_WORDS and line[-1] not in '.!?:;,)'
+
+
+class Chunker:
+    """
+    Split document text into token-budgeted chunks.
+
+    Args:
+        target_tokens (int): Budget per chunk, headings included
+        overlap_tokens (int): Tokens repeated when a paragraph is split across chunks
+        min_tokens (int): Chunks smaller than this are merged across paragraph breaks
+    """
+
+    def __init__(self, target_tokens=180, overlap_tokens=30, min_tokens=40):
+        self.target_tokens = max(16, target_tokens)
+        self.overlap_tokens = max(0, min(overlap_tokens, self.target_tokens // 2))
+        self.min_tokens = max(0, min(min_tokens, self.target_tokens))
+
+    def chunk_text(self, text):
+        """Chunks of a whole document as a list of dicts with 'text', 'tokens' and 'section'"""
+        return list(self.chunk_lines(text.splitlines()))
+
+    def chunk_file(self, path, encoding='utf-8'):
+        """Stream the chunks of a file, reading it line by line"""
+        with open(path, 'r', encoding=encoding, errors='replace') as f:
+            yield from self.chunk_lines(f)
+
+    def chunk_lines(self, lines):
+        """Generate chunks from an iterable of lines"""
+        state = _ChunkState(self)
+        paragraph_start = True
+        for line in lines:
+            line = line.strip()
+            if not line:
+                yield from state.paragraph_break()
+                paragraph_start = True
+                continue
+
+            if MARKDOWN_HEADING.match(line):
+                yield from state.heading(MARKDOWN_HEADING.sub('', line).strip())
+            elif LIST_ITEM.match(line):
+                yield from state.add(line, 'item')
+            elif paragraph_start and _is_title(line):
+                yield from state.heading(line)
+            else:
+                for sentence in split_sentences(line):
+                    yield from state.add(sentence, 'intro' if sentence.endswith(':') else 'text')
+                state.line_break()
+            paragraph_start = False
+        yield from state.flush()
+
+
+class _ChunkState:
+    """Chunk being assembled; a unit is (text, tokens, kind, starts a new line)"""
+
+    def __init__(self, chunker):
+        self.chunker = chunker
+        self.section = None
+        self.section_unit = None
+        self.units = []
+        self.tokens = 0
+        self.content_tokens = 0
+        self.new_line = False
+
+    def heading(self, text):
+        yield from self.flush()
+        self.section = text
+        tokens = count_tokens(text)
+        if tokens <= self.chunker.target_tokens // 4:
+            self.section_unit = (text, tokens, 'heading', True)
+            self._start([])
+        else:
+            # Too long to repeat in every chunk: index it once as text
+            self.section_unit = None
+            self._start([])
+            yield from self.add(text, 'text')
+
+    def paragraph_break(self):
+        # Paragraph ends are the preferred split points, once a chunk has some substance
+        if self.content_tokens >= max(self.chunker.min_tokens, self.chunker.target_tokens // 2):
+            yield from self.flush()
+            self._start([])
+        self.new_line = True
+
+    def line_break(self):
+        self.new_line = True
+
+    def add(self, text, kind):
+        tokens = count_tokens(text)
+        budget = self.chunker.target_tokens - (self.section_unit[1] if self.section_unit else 0)
+        if tokens > budget:
+            # A single sentence or item over budget: split it between words,
+            # leaving room for the overlap
+            yield from self._add_long(text, kind, max(8, budget - self.chunker.overlap_tokens))
+            return
+
+        if self.content_tokens and self.tokens + tokens > self.chunker.target_tokens:
+            carried = self._overlap()
+            last = self.units[-1]
+            if last[2] == 'intro' and last[1] + tokens <= budget:
+                # Keep a list's introduction with its items
+                self.units.pop()
+                self.tokens -= last[1]
+                self.content_tokens -= last[1]
+                carried = [last]
+            yield from self.flush()
+            # Repeat only as much of the previous chunk as leaves room for this unit
+            while carried and self._carried_tokens(carried) + tokens > budget:
+                carried.pop(0)
+            self._start(carried)
+
+        self.units.append((text, tokens, kind, self.new_line or kind == 'item'))
+        self.tokens += tokens
+        self.content_tokens += tokens
+        self.new_line = kind in ('item', 'intro')
+
+    def _add_long(self, text, kind, budget):
+        words = []
+        for word in text.split():
+            if count_tokens(word) > budget:
+                # No spaces to split on (URLs, encoded data): cut every `budget` characters
+                words.extend(word[start:start + budget] for start in range(0, len(word), budget))
+            else:
+                words.append(word)
+        piece = []
+        piece_tokens = 0
+        for word in words:
+            word_tokens = count_tokens(word)
+            if piece and piece_tokens + word_tokens > budget:
+                yield from self.add(' '.join(piece), kind)
+                kind = 'text' if kind == 'item' else kind
+                piece, piece_tokens = [], 0
+            piece.append(word)
+            piece_tokens += word_tokens
+        if piece:
+            yield from self.add(' '.join(piece), kind)
+
+    @staticmethod
+    def _carried_tokens(units):
+        return sum(unit[1] for unit in units)
+
+    def _overlap(self):
+        """Trailing content units worth at most overlap_tokens, to repeat in the next chunk"""
+        carried = []
+        total = 0
+        for unit in reversed(self.units):
+            if unit[2] == 'heading' or total + unit[1] > self.chunker.overlap_tokens:
+                break
+            carried.insert(0, unit)
+            total += unit[1]
+        if not carried and self.units and self.units[-1][2] != 'heading':
+            # Last unit is longer than the overlap: repeat its final words instead
+            tail = []
+            for word in reversed(self.units[-1][0].split()):
+                tokens = count_tokens(word)
+                if total + tokens > self.chunker.overlap_tokens:
+                    break
+                tail.insert(0, word)
+                total += tokens
+            if tail:
+                carried = [(' '.join(tail), total, 'text', False)]
+        return carried
+
+    def _start(self, carried):
+        self.units = [self.section_unit] if self.section_unit else []
+        self.tokens = self.section_unit[1] if self.section_unit else 0
+        self.content_tokens = 0
+        for unit in carried:
+            self.units.append(unit)
+            self.tokens += unit[1]
+            self.content_tokens += unit[1]
+
+    def flush(self):
+        if self.content_tokens:
+            parts = []
+            for position, (text, _, _, new_line) in enumerate(self.units):
+                if position:
+                    parts.append('\n' if new_line or self.units[position - 1][2] == 'heading' else ' ')
+                parts.append(text)
+            yield {'text': ''.join(parts), 'tokens': self.tokens, 'section': self.section}
+        self.units = []
+        self.tokens = 0
+        self.content_tokens = 0
+
+
+def split_paragraphs(content):
+    """Legacy chunking: one chunk per blank-line separated paragraph"""
+    return [
+        chunk.strip()
+        for chunk in content.split('\n\n')
+        if chunk.strip()
+    ]
+
+
+def get_chunker():
+    """Chunker configured from settings, or None for paragraph chunking"""
+    from django.conf import settings
+
+    if settings.RAG_CHUNKER == 'paragraph':
+        return None
+    return Chunker(
+        target_tokens=settings.RAG_CHUNK_TOKENS,
+        overlap_tokens=settings.RAG_CHUNK_OVERLAP_TOKENS,
+        min_tokens=settings.RAG_CHUNK_MIN_TOKENS
+    )
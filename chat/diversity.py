@@ -0,0 +1,83 @@
+"""
+Diversification of retrieved chunks.
+
+Knowledge bases repeat themselves: the same paragraph appears in several
+documents or in overlapping chunks, and the nearest neighbours of a
+query are often copies of one text. Sending them all to the LLM spends
+prompt tokens on nothing new.
+
+``mmr`` picks chunks by Maximal Marginal Relevance: each pick maximises
+
+    lambda * relevance - (1 - lambda) * max cosine similarity to the picks so far
+
+over the stored embeddings of the candidates, and candidates at least
+``duplicate_threshold`` similar to a pick are dropped outright. The
+candidate similarity matrix is computed once, so each pick is a few
+vector operations.
+"""
+import numpy as np
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype='float32')
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def relevance_scores(hits, vectors, query_vector_fn):
+    """
+    Relevance of each hit on a comparable scale, from the score that ranked it.
+
+    Cross-encoder, fused and BM25 scores are min-max normalised to 0-1;
+    dense hits use the cosine similarity of their vector to the query.
+
+    Args:
+        hits (list): Hits, all carrying the same kind of score
+        vectors (ndarray): Embeddings of the hits, one row each
+        query_vector_fn (callable): Returns the query embedding; only
+            called for dense hits
+    """
+    for key in ('rerank_score', 'score'):
+        if all(key in hit for hit in hits):
+            scores = np.array([hit[key] for hit in hits], dtype='float32')
+            span = scores.max() - scores.min()
+            return (scores - scores.min()) / span if span > 0 else np.ones_like(scores)
+    query = _normalize(query_vector_fn()).reshape(-1)
+    return _normalize(vectors) @ query
+
+
+def mmr(vectors, relevance, k, lambda_=0.7, duplicate_threshold=0.95):
+    """
+    Select up to k diverse candidates by Maximal Marginal Relevance.
+
+    Args:
+        vectors (ndarray): Candidate embeddings, one row each
+        relevance (ndarray): Relevance of each candidate to the query
+        lambda_ (float): 1.0 ranks by relevance only, 0.0 by novelty only
+        duplicate_threshold (float): Cosine similarity at which a
+            candidate counts as a copy of a picked one; above 1 keeps them
+
+    Returns:
+        tuple: (candidate positions in pick order, number of candidates
+            dropped as near-duplicates)
+    """
+    vectors = _normalize(vectors)
+    relevance = np.asarray(relevance, dtype='float32')
+    similarity = vectors @ vectors.T
+
+    count = len(vectors)
+    selected = []
+    available = np.ones(count, dtype=bool)
+    duplicate = np.zeros(count, dtype=bool)
+    redundancy = np.zeros(count, dtype='float32')
+    while len(selected) < k and available.any():
+        scores = np.where(available, lambda_ * relevance - (1 - lambda_) * redundancy, -np.inf)
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+
+        near = similarity[best] >= duplicate_threshold
+        duplicate |= near & available
+        available &= ~near
+        np.maximum(redundancy, similarity[best], out=redundancy)
+    return selected, int(duplicate.sum())
@@ -0,0 +1,239 @@
+"""
+Embedding backends behind the RAG service.
+
+Every backend has ``encode(texts, batch_size=None)`` returning a float32
+matrix, and a ``name`` identifying its vector space: it keys the
+embedding cache and the index snapshot, so switching to a backend whose
+vectors differ re-encodes the knowledge base instead of mixing spaces.
+
+Backends (``RAG_EMBEDDING_BACKEND``):
+    sentence-transformers  RAG_EMBEDDING_MODEL in PyTorch
+    onnx                   the same model exported to ONNX by
+                           ``manage.py export_onnx_model``, run by
+                           onnxruntime; optionally int8-quantized
+    hashing                deterministic feature hashing, no model: for
+                           tests and offline development
+
+``threads`` sets the backend's own intra-op thread pool (PyTorch or
+onnxruntime); 0 keeps the library default of one thread per core.
+Heavy libraries, numpy included, are imported when a backend is created
+or used, not with this module: the views import it through the RAG
+service.
+"""
+import functools
+import hashlib
+import importlib.util
+import json
+import os
+import re
+
+EMBEDDING_BACKENDS = ('sentence-transformers', 'onnx', 'hashing')
+
+# Modules each backend needs at runtime
+BACKEND_MODULES = {
+    'sentence-transformers': ('sentence_transformers',),
+    'onnx': ('onnxruntime', 'tokenizers'),
+    'hashing': (),
+}
+
+ONNX_CONFIG_NAME = 'embedding_config.json'
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+
+def backend_available(backend):
+    """Whether a backend's libraries are installed, checked without importing them"""
+    if backend not in BACKEND_MODULES:
+        raise ValueError(f"Unknown embedding backend '{backend}'. Choose: {', '.join(EMBEDDING_BACKENDS)}")
+    try:
+        return all(importlib.util.find_spec(name) is not None for name in BACKEND_MODULES[backend])
+    except (ImportError, ValueError):
+        return False
+
+
+def onnx_model_file(quantized):
+    return 'model_int8.onnx' if quantized else 'model.onnx'
+
+
+class SentenceTransformerBackend:
+    """RAG_EMBEDDING_MODEL run by sentence-transformers (PyTorch, eager mode)"""
+
+    def __init__(self, model_name, threads=0, batch_size=32):
+        if threads:
+            import torch
+            torch.set_num_threads(threads)
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(model_name)
+        self.name = model_name
+        self.threads = threads
+        self.batch_size = batch_size
+
+    def encode(self, texts, batch_size=None):
+        import numpy as np
+
+        return np.asarray(
+            self.model.encode(list(texts), batch_size=batch_size or self.batch_size, show_progress_bar=False),
+            dtype='float32'
+        )
+
+
+class OnnxBackend:
+    """
+    A sentence-transformers model exported to ONNX, run by onnxruntime.
+
+    ``model_dir`` holds ``model.onnx`` and/or ``model_int8.onnx``,
+    ``tokenizer.json`` and ``embedding_config.json`` with the pooling
+    ('mean' or 'cls'), normalisation, maximum sequence length and source
+    model name. Each batch is padded only to its longest text, and texts
+    are sorted by length first so batches hold similar lengths.
+    """
+
+    def __init__(self, model_dir, quantized=False, threads=0, batch_size=32):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        with open(os.path.join(model_dir, ONNX_CONFIG_NAME), 'r', encoding='utf-8') as f:
+            self.config = json.load(f)
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(model_dir, onnx_model_file(quantized)), options, providers=['CPUExecutionProvider']
+        )
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, 'tokenizer.json'))
+        self.tokenizer.enable_truncation(max_length=self.config['max_length'])
+        self.tokenizer.enable_padding(pad_id=self.config.get('pad_id', 0), pad_token=self.config.get('pad_token', '[PAD]'))
+
+        self.name = f"{self.config['model_name']}@onnx{'-int8' if quantized else ''}"
+        self.threads = threads
+        self.batch_size = batch_size
+
+    def encode(self, texts, batch_size=None):
+        import numpy as np
+
+        texts = list(texts)
+        batch_size = batch_size or self.batch_size
+        if not texts:
+            return np.zeros((0, self.config['dimension']), dtype='float32')
+
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        embeddings = np.empty((len(texts), self.config['dimension']), dtype='float32')
+        for start in range(0, len(texts), batch_size):
+            rows = order[start:start + batch_size]
+            embeddings[rows] = self._encode_batch([texts[i] for i in rows])
+        return embeddings
+
+    def _encode_batch(self, texts):
+        import numpy as np
+
+        encodings = self.tokenizer.encode_batch(texts)
+        mask = np.array([encoding.attention_mask for encoding in encodings], dtype='int64')
+        feeds = {
+            'input_ids': np.array([encoding.ids for encoding in encodings], dtype='int64'),
+            'attention_mask': mask,
+        }
+        if 'token_type_ids' in self.input_names:
+            feeds['token_type_ids'] = np.array([encoding.type_ids for encoding in encodings], dtype='int64')
+        hidden = self.session.run(None, feeds)[0]
+
+        if self.config['pooling'] == 'cls':
+            pooled = hidden[:, 0]
+        else:
+            weights = mask[:, :, None].astype('float32')
+            pooled = (hidden * weights).sum(axis=1) / np.maximum(weights.sum(axis=1), 1e-9)
+        if self.config['normalize']:
+            pooled = pooled / np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+        return pooled
+
+
+class HashingBackend:
+    """
+    Deterministic bag-of-words vectors by feature hashing.
+
+    Each word adds +/-1 to one of ``dimension`` buckets chosen by its
+    BLAKE2 hash, and rows are L2-normalised, so texts sharing words are
+    close. The same text always gets the same vector in every process.
+    """
+
+    def __init__(self, dimension=384, threads=0, batch_size=32):
+        self.dimension = dimension
+        self.name = f"hashing-{dimension}"
+        self.threads = threads
+        self.batch_size = batch_size
+
+    @functools.lru_cache(maxsize=65536)
+    def _bucket(self, word):
+        value = int.from_bytes(hashlib.blake2b(word.encode('utf-8'), digest_size=8).digest(), 'little')
+        return value % self.dimension, 1.0 if value >> 63 else -1.0
+
+    def encode(self, texts, batch_size=None):
+        import numpy as np
+
+        texts = list(texts)
+        embeddings = np.zeros((len(texts), self.dimension), dtype='float32')
+        for row, text in enumerate(texts):
+            for word in TOKEN_PATTERN.findall(text.lower()):
+                bucket, sign = self._bucket(word)
+                embeddings[row, bucket] += sign
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings / np.maximum(norms, 1e-12)
+
+
+def backend_config(settings=None, **overrides):
+    """
+    Plain dict describing the configured backend.
+
+    Picklable, so process pools can create the same backend with
+    :func:`create_backend` without Django settings.
+    """
+    if settings is None:
+        from django.conf import settings
+    config = {
+        'backend': settings.RAG_EMBEDDING_BACKEND,
+        'model_name': settings.RAG_EMBEDDING_MODEL,
+        'onnx_model_dir': settings.RAG_ONNX_MODEL_DIR,
+        'onnx_quantized': settings.RAG_ONNX_QUANTIZED,
+        'hashing_dimension': settings.RAG_HASHING_DIMENSION,
+        'threads': settings.RAG_EMBEDDING_THREADS,
+        'batch_size': settings.RAG_EMBEDDING_BATCH_SIZE,
+    }
+    config.update(overrides)
+    return config
+
+
+def backend_name(config):
+    """Name the backend described by ``config`` will have, without loading it"""
+    backend = config['backend']
+    if backend == 'sentence-transformers':
+        return config['model_name']
+    if backend == 'onnx':
+        with open(os.path.join(config['onnx_model_dir'], ONNX_CONFIG_NAME), 'r', encoding='utf-8') as f:
+            model_name = json.load(f)['model_name']
+        return f"{model_name}@onnx{'-int8' if config['onnx_quantized'] else ''}"
+    if backend == 'hashing':
+        return f"hashing-{config['hashing_dimension']}"
+    raise ValueError(f"Unknown embedding backend '{backend}'. Choose: {', '.join(EMBEDDING_BACKENDS)}")
+
+
+def create_backend(config):
+    """Instantiate the backend described by :func:`backend_config`"""
+    backend = config['backend']
+    common = {'threads': config['threads'], 'batch_size': config['batch_size']}
+    if backend == 'sentence-transformers':
+        return SentenceTransformerBackend(config['model_name'], **common)
+    if backend == 'onnx':
+        return OnnxBackend(config['onnx_model_dir'], quantized=config['onnx_quantized'], **common)
+    if backend == 'hashing':
+        return HashingBackend(config['hashing_dimension'], **common)
+    raise ValueError(f"Unknown embedding backend '{backend}'. Choose: {', '.join(EMBEDDING_BACKENDS)}")
+
+
+def load_embedding_backend(**overrides):
+    """The embedding backend selected in settings (``overrides`` replace config keys)"""
+    return create_backend(backend_config(**overrides))
@@ -0,0 +1,62 @@
+"""
+Rank fusion for hybrid (dense + lexical) retrieval.
+
+Each input is a ranked list of hits (dicts with at least 'id' and
+'text'), best first. The fused list carries a 'score' (higher is
+better) and the per-retriever rank or score that produced it.
+"""
+
+FUSION_METHODS = ('rrf', 'weighted')
+
+
+def reciprocal_rank_fusion(ranked_lists, k=60, weights=None):
+    """
+    Reciprocal-rank fusion: score(d) = sum_i w_i / (k + rank_i(d)).
+
+    Only ranks are used, so retrievers with incomparable score scales
+    (L2 distances, BM25) combine without normalisation.
+    """
+    weights = weights or [1.0] * len(ranked_lists)
+    fused = {}
+    for weight, hits in zip(weights, ranked_lists):
+        for rank, hit in enumerate(hits, start=1):
+            entry = fused.get(hit['id'])
+            if entry is None:
+                entry = fused[hit['id']] = {'id': hit['id'], 'text': hit['text'], 'score': 0.0}
+            entry['score'] += weight / (k + rank)
+    return sorted(fused.values(), key=lambda entry: entry['score'], reverse=True)
+
+
+def weighted_score_fusion(dense_hits, lexical_hits, dense_weight=0.5):
+    """
+    Convex combination of min-max normalised scores.
+
+    Dense hits are scored by negated distance, lexical hits by BM25; a
+    chunk missing from one list gets 0 from that retriever.
+    """
+    fused = {}
+    for weight, hits, raw in (
+        (dense_weight, dense_hits, [-hit['distance'] for hit in dense_hits]),
+        (1.0 - dense_weight, lexical_hits, [hit['score'] for hit in lexical_hits]),
+    ):
+        if not hits:
+            continue
+        low, high = min(raw), max(raw)
+        span = (high - low) or 1.0
+        for hit, value in zip(hits, raw):
+            entry = fused.get(hit['id'])
+            if entry is None:
+                entry = fused[hit['id']] = {'id': hit['id'], 'text': hit['text'], 'score': 0.0}
+            entry['score'] += weight * (value - low) / span if high > low else weight
+    return sorted(fused.values(), key=lambda entry: entry['score'], reverse=True)
+
+
+def fuse(dense_hits, lexical_hits, method='rrf', rrf_k=60, dense_weight=0.5):
+    """Fuse dense and lexical hits with the named method"""
+    if method == 'rrf':
+        return reciprocal_rank_fusion(
+            [dense_hits, lexical_hits], k=rrf_k, weights=[dense_weight, 1.0 - dense_weight]
+        )
+    if method == 'weighted':
+        return weighted_score_fusion(dense_hits, lexical_hits, dense_weight)
+    raise ValueError(f"Unknown fusion method '{method}'. Choose: {', '.join(FUSION_METHODS)}")
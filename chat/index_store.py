@@ -0,0 +1,496 @@
+"""
+On-disk storage for the RAG index.
+
+Chunk embeddings are cached per chunk under a content-addressed key
+(hash of the model name and chunk text), so unchanged chunks are never
+re-encoded. The embedding matrix and its chunk table are written as a
+versioned snapshot that later processes can load instead of rebuilding.
+
+Snapshot layout (one directory per version):
+    meta.json       format/KB version, model name, dimension, chunk count
+    embeddings.npy  float32 matrix, opened with ``np.memmap``
+    norms.npy       squared L2 norm of every row
+    chunks.bin      chunk text as one UTF-8 blob
+    offsets.npy     int64 byte offsets into chunks.bin (num_chunks + 1)
+    ids.npy         stable int64 chunk ID of every row, ascending
+    doc_rows.npy    int32 position in documents.json of every row
+    tokens.npy      int32 estimated token count of every chunk (``count_tokens``);
+                    snapshots written before it existed fall back to counting
+    documents.json  [{'id': ..., 'version': ...}] for every document
+    sections.json   distinct section headings (optional)
+    section_rows.npy  int32 position in sections.json of every row, -1 for none
+    journal.jsonl   changes applied on top of the snapshot (see knowledge_index)
+    index-*.faiss   trained ANN indexes, built on first use per type/parameters
+    vectors-*.faiss quantized copies of the embeddings (float16, int8, PQ),
+                    built on first use per storage type; embeddings.npy
+                    stays float32 for exact re-scoring and compaction
+    *.faiss.lock    held while one process builds the matching file; the
+                    others wait and then read it
+
+With the ``mmap`` layout every worker maps the same files read-only, so
+the OS page cache holds a single copy shared by all processes.
+"""
+import contextlib
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+import logging
+
+import numpy as np
+
+from . import vector_index
+from .chunking import count_tokens
+from .vector_index import MemmapFlatIndex, build_flat_index
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process deployments only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the snapshot layout changes so old snapshots are rebuilt
+SNAPSHOT_FORMAT_VERSION = 3
+
+# 'mmap' shares the snapshot files across workers; 'memory' copies them
+# into each process (FAISS IndexFlatL2 plus a list of str)
+LAYOUTS = ('mmap', 'memory')
+
+# Number of snapshot versions kept on disk (current one included)
+SNAPSHOTS_TO_KEEP = 2
+
+
+def chunk_key(text, model_name):
+    """Content-addressed key of a chunk embedding"""
+    return hashlib.sha256(f"{model_name}\0{text}".encode('utf-8')).hexdigest()
+
+
+def knowledge_base_version(chunks, model_name):
+    """Version string identifying an exact list of chunks for a model"""
+    digest = hashlib.sha256()
+    for chunk in chunks:
+        digest.update(chunk_key(chunk, model_name).encode('ascii'))
+    return digest.hexdigest()[:16]
+
+
+def _model_slug(model_name):
+    return ''.join(c if c.isalnum() or c in '-_.' else '_' for c in model_name)
+
+
+def _atomic_write_bytes(path, data):
+    """Write a file so readers never observe a partial write"""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+@contextlib.contextmanager
+def _build_lock(path):
+    """Exclusive cross-process lock for building the file at ``path``"""
+    with open(path + '.lock', 'a') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class EmbeddingCache:
+    """
+    Per-chunk embedding cache stored as one ``.npy`` file per chunk.
+
+    Files are sharded by the first two hex digits of the key to keep
+    directories small.
+    """
+
+    def __init__(self, index_dir, model_name):
+        self.model_name = model_name
+        self.root = os.path.join(index_dir, 'embeddings', _model_slug(model_name))
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], f"{key}.npy")
+
+    def contains(self, text):
+        return os.path.exists(self._path(chunk_key(text, self.model_name)))
+
+    def get(self, text):
+        path = self._path(chunk_key(text, self.model_name))
+        try:
+            return np.load(path)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, text, vector):
+        path = self._path(chunk_key(text, self.model_name))
+        buffer = io.BytesIO()
+        np.save(buffer, np.asarray(vector, dtype='float32'))
+        _atomic_write_bytes(path, buffer.getvalue())
+
+    def encode(self, texts, encode_fn):
+        """
+        Return embeddings for texts, encoding only the cache misses.
+
+        Args:
+            texts (list[str]): Chunks to embed
+            encode_fn (callable): Batch encoder, e.g. ``model.encode``
+
+        Returns:
+            tuple: (float32 matrix, number of hits, number of misses)
+        """
+        vectors = [self.get(text) for text in texts]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+
+        if missing:
+            encoded = np.asarray(encode_fn([texts[i] for i in missing]), dtype='float32')
+            for i, vector in zip(missing, encoded):
+                self.put(texts[i], vector)
+                vectors[i] = vector
+
+        if not vectors:
+            return np.zeros((0, 0), dtype='float32'), 0, 0
+
+        matrix = np.vstack(vectors).astype('float32')
+        return matrix, len(texts) - len(missing), len(missing)
+
+
+def _snapshots_root(index_dir):
+    return os.path.join(index_dir, 'snapshots')
+
+
+def _current_pointer(index_dir):
+    return os.path.join(index_dir, 'CURRENT')
+
+
+def current_snapshot_dir(index_dir):
+    """Directory of the snapshot CURRENT points to, or None"""
+    try:
+        with open(_current_pointer(index_dir), 'r', encoding='utf-8') as f:
+            name = f.read().strip()
+    except OSError:
+        return None
+    path = os.path.join(_snapshots_root(index_dir), name)
+    return path if os.path.isdir(path) else None
+
+
+def read_snapshot_meta(index_dir):
+    """Metadata of the current snapshot, or None if there is none"""
+    snapshot_dir = current_snapshot_dir(index_dir)
+    if snapshot_dir is None:
+        return None
+    try:
+        with open(os.path.join(snapshot_dir, 'meta.json'), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class ChunkStore:
+    """
+    Read-only sequence of chunk texts backed by a UTF-8 blob and offsets.
+
+    Chunks are decoded on access, so only the pages actually read are
+    brought into memory and they are shared through the page cache.
+    """
+
+    def __init__(self, blob, offsets):
+        self._blob = blob
+        self._offsets = offsets
+
+    @classmethod
+    def open(cls, directory):
+        offsets = np.load(os.path.join(directory, 'offsets.npy'), mmap_mode='r')
+        blob_path = os.path.join(directory, 'chunks.bin')
+        if os.path.getsize(blob_path) == 0:
+            blob = b''
+        else:
+            blob = np.memmap(blob_path, dtype='uint8', mode='r')
+        return cls(blob, offsets)
+
+    @staticmethod
+    def write(directory, chunks):
+        """Write chunks.bin and offsets.npy for a list of strings"""
+        offsets = np.zeros(len(chunks) + 1, dtype='int64')
+        with open(os.path.join(directory, 'chunks.bin'), 'wb') as f:
+            position = 0
+            for i, chunk in enumerate(chunks):
+                data = chunk.encode('utf-8')
+                f.write(data)
+                position += len(data)
+                offsets[i + 1] = position
+        np.save(os.path.join(directory, 'offsets.npy'), offsets)
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('chunk index out of range')
+        start, end = int(self._offsets[i]), int(self._offsets[i + 1])
+        return bytes(self._blob[start:end]).decode('utf-8')
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    @property
+    def nbytes(self):
+        return len(self._blob) + int(self._offsets.nbytes)
+
+
+def save_snapshot(index_dir, chunks, embeddings, ids, doc_rows, documents,
+                  model_name, kb_version, next_chunk_id, sections=None, storage='float32'):
+    """
+    Write a new snapshot and make it current.
+
+    The snapshot is assembled in a temporary directory and published by
+    atomically replacing the CURRENT pointer, so concurrent readers see
+    either the old or the new snapshot, never a mix.
+
+    Args:
+        chunks (list[str]): Chunk texts, one per row
+        embeddings (np.ndarray): float32 matrix, one row per chunk
+        ids (np.ndarray): Stable chunk IDs, ascending
+        doc_rows (np.ndarray): Position in ``documents`` of every row
+        documents (list[dict]): [{'id': str, 'version': str or None}]
+        next_chunk_id (int): First ID not yet handed out
+        sections (list): Section heading (or None) of every row, if known
+        storage (str): Embedding storage the snapshot is searched with, recorded in meta.json
+    """
+    root = _snapshots_root(index_dir)
+    os.makedirs(root, exist_ok=True)
+    name = f"{int(time.time() * 1000)}-{kb_version}"
+    tmp_dir = tempfile.mkdtemp(dir=root, prefix='.tmp-')
+    embeddings = np.ascontiguousarray(embeddings, dtype='float32')
+
+    try:
+        meta = {
+            'format_version': SNAPSHOT_FORMAT_VERSION,
+            'kb_version': kb_version,
+            'model_name': model_name,
+            'dimension': int(embeddings.shape[1]) if embeddings.ndim == 2 else 0,
+            'num_chunks': len(chunks),
+            'next_chunk_id': int(next_chunk_id),
+            'storage': storage,
+            'created_at': time.time(),
+        }
+        ChunkStore.write(tmp_dir, chunks)
+        np.save(os.path.join(tmp_dir, 'embeddings.npy'), embeddings)
+        np.save(
+            os.path.join(tmp_dir, 'norms.npy'),
+            np.einsum('ij,ij->i', embeddings, embeddings)
+        )
+        np.save(os.path.join(tmp_dir, 'ids.npy'), np.asarray(ids, dtype='int64'))
+        np.save(os.path.join(tmp_dir, 'doc_rows.npy'), np.asarray(doc_rows, dtype='int32'))
+        np.save(
+            os.path.join(tmp_dir, 'tokens.npy'),
+            np.fromiter((count_tokens(chunk) for chunk in chunks), dtype='int32', count=len(chunks))
+        )
+        with open(os.path.join(tmp_dir, 'documents.json'), 'w', encoding='utf-8') as f:
+            json.dump(documents, f, ensure_ascii=False)
+        if sections is not None and any(sections):
+            _write_sections(tmp_dir, sections)
+        open(os.path.join(tmp_dir, 'journal.jsonl'), 'w').close()
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, indent=2)
+        os.replace(tmp_dir, os.path.join(root, name))
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    _atomic_write_bytes(_current_pointer(index_dir), name.encode('utf-8'))
+    _prune_snapshots(index_dir, keep=name)
+    return os.path.join(root, name)
+
+
+def _write_sections(directory, sections):
+    names = []
+    positions = {}
+    rows = np.full(len(sections), -1, dtype='int32')
+    for row, section in enumerate(sections):
+        if section:
+            if section not in positions:
+                positions[section] = len(names)
+                names.append(section)
+            rows[row] = positions[section]
+    with open(os.path.join(directory, 'sections.json'), 'w', encoding='utf-8') as f:
+        json.dump(names, f, ensure_ascii=False)
+    np.save(os.path.join(directory, 'section_rows.npy'), rows)
+
+
+def _read_sections(directory):
+    """(names, rows) of a snapshot written with sections, else None"""
+    try:
+        with open(os.path.join(directory, 'sections.json'), 'r', encoding='utf-8') as f:
+            names = json.load(f)
+        rows = np.load(os.path.join(directory, 'section_rows.npy'), mmap_mode='r')
+    except OSError:
+        return None
+    return names, rows
+
+
+def _read_token_counts(directory):
+    try:
+        return np.load(os.path.join(directory, 'tokens.npy'), mmap_mode='r')
+    except OSError:
+        return None
+
+
+def tokens_of_row(base, row):
+    """Estimated token count of a snapshot row"""
+    if base['tokens'] is None:
+        return count_tokens(base['chunks'][row])
+    return int(base['tokens'][row])
+
+
+def section_of_row(base, row):
+    """Section heading of a snapshot row, or None"""
+    if base['sections'] is None:
+        return None
+    names, rows = base['sections']
+    position = int(rows[row])
+    return names[position] if position >= 0 else None
+
+
+def _prune_snapshots(index_dir, keep):
+    root = _snapshots_root(index_dir)
+    names = sorted(
+        (n for n in os.listdir(root) if not n.startswith('.')),
+        reverse=True
+    )
+    stale = [n for n in names if n != keep][SNAPSHOTS_TO_KEEP - 1:]
+    for name in stale:
+        shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+
+def open_snapshot_dir(snapshot_dir, layout='mmap', index_type='flat', index_params=None,
+                      storage='float32', rescore_factor=0):
+    """
+    Open a snapshot directory with the given memory layout and index type.
+
+    Approximate indexes and quantized embeddings are built from the
+    snapshot embeddings the first time a type/parameter combination is
+    requested and saved next to them, so later processes only read the
+    file.
+
+    Args:
+        storage (str): Embedding storage of the flat index (see ``vector_index``)
+        rescore_factor (int): With lossy storage or IVF-PQ, re-rank
+            ``k * rescore_factor`` candidates by exact distance; 0 disables
+
+    Returns:
+        dict: {'index', 'index_type', 'storage', 'chunks', 'ids', 'doc_rows',
+            'documents', 'sections', 'tokens', 'meta', 'path'} where ``index`` has a
+            FAISS-style ``search`` over the rows
+    """
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unknown index layout '{layout}'. Choose: {', '.join(LAYOUTS)}")
+
+    with open(os.path.join(snapshot_dir, 'meta.json'), 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    with open(os.path.join(snapshot_dir, 'documents.json'), 'r', encoding='utf-8') as f:
+        documents = json.load(f)
+
+    num_vectors = meta['num_chunks']
+    requested_storage = storage
+    index_type = vector_index.effective_index_type(index_type, num_vectors, index_params)
+    embeddings_path = os.path.join(snapshot_dir, 'embeddings.npy')
+
+    storage = 'float32'
+    if index_type != 'flat':
+        index = _open_ann_index(snapshot_dir, layout, index_type, index_params, num_vectors)
+    elif vector_index.effective_storage(requested_storage, num_vectors, meta['dimension'], index_params) != 'float32':
+        storage = requested_storage
+        index = _open_quantized_index(snapshot_dir, layout, storage, index_params, num_vectors)
+    elif layout == 'mmap':
+        embeddings = np.load(embeddings_path, mmap_mode='r')
+        norms = np.load(os.path.join(snapshot_dir, 'norms.npy'), mmap_mode='r')
+        index = MemmapFlatIndex(embeddings, norms)
+    else:
+        index = build_flat_index(np.load(embeddings_path))
+
+    if rescore_factor and (storage != 'float32' or index_type == 'ivf_pq'):
+        index = vector_index.RescoringIndex(index, load_embeddings(snapshot_dir), rescore_factor)
+
+    if layout == 'mmap':
+        chunks = ChunkStore.open(snapshot_dir)
+    else:
+        chunks = list(ChunkStore.open(snapshot_dir))
+
+    return {
+        'index': index,
+        'index_type': index_type,
+        'storage': storage,
+        'chunks': chunks,
+        'ids': np.load(os.path.join(snapshot_dir, 'ids.npy'), mmap_mode='r'),
+        'doc_rows': np.load(os.path.join(snapshot_dir, 'doc_rows.npy'), mmap_mode='r'),
+        'documents': documents,
+        'sections': _read_sections(snapshot_dir),
+        'tokens': _read_token_counts(snapshot_dir),
+        'meta': meta,
+        'path': snapshot_dir,
+    }
+
+
+def _open_ann_index(snapshot_dir, layout, index_type, index_params, num_vectors):
+    import faiss
+
+    path = os.path.join(
+        snapshot_dir, vector_index.index_file_name(index_type, num_vectors, index_params)
+    )
+    if not os.path.exists(path):
+        # Workers opening a new snapshot together build it once; the rest
+        # wait for the lock and read the finished file
+        with _build_lock(path):
+            if not os.path.exists(path):
+                start = time.perf_counter()
+                index = vector_index.build_ann_index(load_embeddings(snapshot_dir), index_type, index_params)
+                _atomic_write_bytes(path, faiss.serialize_index(index).tobytes())
+                logger.info(
+                    f"Built {index_type} index for {num_vectors} vectors in "
+                    f"{(time.perf_counter() - start) * 1000:.0f}ms"
+                )
+                if layout == 'memory':
+                    return index
+
+    index = vector_index.read_ann_index(path, mmap=(layout == 'mmap'))
+    return vector_index.configure_search(index, index_type, index_params)
+
+
+def _open_quantized_index(snapshot_dir, layout, storage, index_params, num_vectors):
+    import faiss
+
+    path = os.path.join(snapshot_dir, vector_index.storage_file_name(storage, index_params))
+    if not os.path.exists(path):
+        with _build_lock(path):
+            if not os.path.exists(path):
+                start = time.perf_counter()
+                index = vector_index.build_storage_index(load_embeddings(snapshot_dir), storage, index_params)
+                _atomic_write_bytes(path, faiss.serialize_index(index).tobytes())
+                logger.info(
+                    f"Built {storage} embedding storage for {num_vectors} vectors in "
+                    f"{(time.perf_counter() - start) * 1000:.0f}ms"
+                )
+                if layout == 'memory':
+                    return index
+    return vector_index.read_ann_index(path, mmap=(layout == 'mmap'))
+
+
+def load_embeddings(snapshot_dir):
+    """Memory-mapped float32 embedding matrix of a snapshot"""
+    return np.load(os.path.join(snapshot_dir, 'embeddings.npy'), mmap_mode='r')
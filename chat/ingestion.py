@@ -0,0 +1,321 @@
+"""
+Parallel ingestion of many documents into the knowledge index.
+
+``IngestionPipeline.run`` takes the files found by ``discover_files`` and:
+
+1. parses and chunks them in a process pool (the chunker is pure Python,
+   so threads would take turns on the GIL);
+2. embeds the chunks in large batches, either in this process, where the
+   model's own thread pool spreads each batch over every core, or split
+   across ``embed_processes`` model replicas that share the cores;
+3. appends every finished document, with its chunks, their section
+   headings and token counts, to a checkpoint file. The embeddings are in
+   the on-disk embedding cache by then, so a run that is interrupted
+   skips the checkpointed files next time and re-encodes nothing;
+4. publishes all documents as one new snapshot with
+   ``KnowledgeIndex.upsert_documents`` and deletes the checkpoint.
+
+Document IDs are file paths relative to the directory given (or to the
+common directory of the files a glob matched), with an optional prefix.
+"""
+import glob
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+
+from . import index_store
+from .chunking import Chunker, count_tokens, split_paragraphs
+from .embeddings import create_backend
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EXTENSIONS = ('.txt', '.md')
+
+# Texts per model.encode() forward pass inside one embedding batch
+ENCODE_MICRO_BATCH = 64
+
+
+def discover_files(inputs, extensions=DEFAULT_EXTENSIONS, prefix=''):
+    """
+    Expand directories (recursively), glob patterns and file paths.
+
+    Returns:
+        list: (document ID, path) pairs sorted by document ID
+    """
+    extensions = tuple(ext.lower() for ext in extensions)
+    found = {}
+    for spec in inputs:
+        if os.path.isdir(spec):
+            root = spec
+            paths = [
+                os.path.join(directory, name)
+                for directory, _, names in os.walk(spec)
+                for name in names
+                if name.lower().endswith(extensions)
+            ]
+        else:
+            paths = [path for path in glob.glob(spec, recursive=True) if os.path.isfile(path)]
+            if not paths:
+                raise FileNotFoundError(f"No files match {spec}")
+            root = os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in paths])
+
+        for path in paths:
+            relative = os.path.relpath(os.path.abspath(path), os.path.abspath(root))
+            doc_id = prefix + relative.replace(os.sep, '/')
+            if found.get(doc_id, path) != path:
+                raise ValueError(f"Document ID {doc_id} matches both {found[doc_id]} and {path}")
+            found[doc_id] = path
+    return sorted(found.items())
+
+
+def _chunk_file(path, chunker_options):
+    """Process pool task: chunks of one file as dicts with 'text', 'section' and 'tokens'"""
+    if chunker_options is None:
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            return [
+                {'text': text, 'section': None, 'tokens': count_tokens(text)}
+                for text in split_paragraphs(f.read())
+            ]
+    return list(Chunker(**chunker_options).chunk_file(path))
+
+
+_embedder = None
+
+
+def _load_embedder(embedding_config, threads):
+    """Embedding pool initializer: load one model replica per process"""
+    global _embedder
+    _embedder = create_backend(dict(embedding_config, threads=threads))
+
+
+def _embed_texts(texts):
+    return _embedder.encode(texts, batch_size=ENCODE_MICRO_BATCH)
+
+
+class IngestCheckpoint:
+    """
+    Append-only JSON lines record of documents already chunked and embedded.
+
+    The first line holds the run configuration (model and chunker); a
+    checkpoint written with a different configuration is ignored.
+    """
+
+    def __init__(self, path, config):
+        self.path = path
+        self.config = config
+
+    def load(self):
+        """{doc_id: record} of checkpointed documents"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                lines = f.readlines()
+        except OSError:
+            return {}
+        if not lines or json.loads(lines[0]).get('config') != self.config:
+            if lines:
+                logger.warning(f"Ignoring ingestion checkpoint {self.path} written with other settings")
+            return {}
+
+        records = {}
+        for line in lines[1:]:
+            if not line.endswith('\n'):
+                break  # torn write from an interrupted run
+            record = json.loads(line)
+            records[record['doc']] = record
+        return records
+
+    def append(self, records):
+        if not os.path.exists(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, 'w', encoding='utf-8') as f:
+                f.write(json.dumps({'config': self.config}) + '\n')
+        else:
+            self._drop_torn_line()
+        payload = ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _drop_torn_line(self):
+        with open(self.path, 'rb+') as f:
+            data = f.read()
+            if data and not data.endswith(b'\n'):
+                f.truncate(data.rfind(b'\n') + 1)
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class IngestionPipeline:
+    """
+    Chunk, embed and publish many files into a KnowledgeIndex.
+
+    Args:
+        index (KnowledgeIndex): Target index; its embedding cache is filled as chunks are embedded
+        encode_fn (callable): Batch encoder used when ``embed_processes`` is 1
+        chunker_options (dict): ``Chunker`` arguments, or None for paragraph chunking
+        workers (int): Chunking processes (default: all cores)
+        batch_size (int): Chunks collected before each embedding batch
+        embed_processes (int): Model replicas to embed with; more than 1 creates
+            the backend described by ``embedding_config`` in each process and
+            splits the cores between them
+        checkpoint_path (str): Checkpoint file (default: ``ingest_checkpoint.jsonl`` in the index directory)
+        progress (callable): Called with a stats dict after every embedding batch
+    """
+
+    def __init__(self, index, encode_fn, chunker_options, workers=None, batch_size=1024,
+                 embed_processes=1, embedding_config=None, checkpoint_path=None, progress=None):
+        self.index = index
+        self.encode_fn = encode_fn
+        self.chunker_options = chunker_options
+        self.cores = os.cpu_count() or 1
+        self.workers = max(1, workers or self.cores)
+        self.batch_size = max(1, batch_size)
+        self.embed_processes = max(1, embed_processes)
+        self.embedding_config = embedding_config
+        self.progress = progress
+        self.checkpoint = IngestCheckpoint(
+            checkpoint_path or os.path.join(index.index_dir, 'ingest_checkpoint.jsonl'),
+            {'model': index.model_name, 'chunker': chunker_options}
+        )
+        # spawn, not fork: the parent has the model's thread pools running
+        self._context = multiprocessing.get_context('spawn')
+        self._embed_pool = None
+
+    def run(self, files, restart=False):
+        """
+        Ingest (document ID, path) pairs, resuming from the checkpoint.
+
+        Returns:
+            dict: run statistics, including the publish counts of
+                ``KnowledgeIndex.upsert_documents`` under 'index'
+        """
+        if restart:
+            self.checkpoint.remove()
+        done = self.checkpoint.load()
+        pending = []
+        for doc_id, path in files:
+            stat = os.stat(path)
+            source = {'path': path, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+            record = done.get(doc_id)
+            if record is None or any(record.get(key) != value for key, value in source.items()):
+                pending.append((doc_id, source))
+
+        stats = {
+            'files': len(files),
+            'resumed': len(files) - len(pending),
+            'processed': 0,
+            'failed': 0,
+            'chunks': 0,
+            'encoded': 0,
+            'cached': 0,
+            'cores': self.cores,
+            'started': time.perf_counter(),
+        }
+        try:
+            batch, batch_chunks = [], 0
+            with ProcessPoolExecutor(max_workers=self.workers, mp_context=self._context) as pool:
+                for record in self._chunk_all(pool, pending, stats):
+                    batch.append(record)
+                    batch_chunks += len(record['chunks'])
+                    if batch_chunks >= self.batch_size:
+                        self._embed_batch(batch, stats)
+                        batch, batch_chunks = [], 0
+                if batch:
+                    self._embed_batch(batch, stats)
+        finally:
+            if self._embed_pool is not None:
+                self._embed_pool.shutdown()
+                self._embed_pool = None
+
+        stats['embed_seconds'] = time.perf_counter() - stats.pop('started')
+        stats['index'] = self._publish([doc_id for doc_id, _ in files])
+        self.checkpoint.remove()
+        return stats
+
+    def _chunk_all(self, pool, pending, stats):
+        """Yield checkpoint records as files finish chunking, a bounded window at a time"""
+        queue = iter(pending)
+        window = self.workers * 4
+        in_flight = {}
+        while True:
+            for doc_id, source in itertools.islice(queue, window - len(in_flight)):
+                future = pool.submit(_chunk_file, source['path'], self.chunker_options)
+                in_flight[future] = (doc_id, source)
+            if not in_flight:
+                return
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                doc_id, source = in_flight.pop(future)
+                try:
+                    chunks = future.result()
+                except OSError as e:
+                    logger.error(f"Skipping {source['path']}: {str(e)}")
+                    stats['failed'] += 1
+                    continue
+                yield {'doc': doc_id, **source, 'chunks': chunks}
+
+    def _embed_batch(self, records, stats):
+        """Embed the cache misses of a batch of documents, then checkpoint the documents"""
+        cache = self.index.cache
+        texts = list(dict.fromkeys(chunk['text'] for record in records for chunk in record['chunks']))
+        missing = [text for text in texts if not cache.contains(text)]
+        if missing:
+            for text, vector in zip(missing, self._encode(missing)):
+                cache.put(text, vector)
+        self.checkpoint.append(records)
+
+        stats['processed'] += len(records)
+        stats['chunks'] += sum(len(record['chunks']) for record in records)
+        stats['encoded'] += len(missing)
+        stats['cached'] += len(texts) - len(missing)
+        if self.progress is not None:
+            elapsed = time.perf_counter() - stats['started']
+            rate = stats['chunks'] / elapsed if elapsed > 0 else 0.0
+            self.progress(dict(stats, elapsed=elapsed, chunks_per_second=rate,
+                               chunks_per_second_per_core=rate / self.cores))
+
+    def _encode(self, texts):
+        if self.embed_processes == 1:
+            return np.asarray(self.encode_fn(texts), dtype='float32')
+
+        if self._embed_pool is None:
+            threads = max(1, self.cores // self.embed_processes)
+            self._embed_pool = ProcessPoolExecutor(
+                max_workers=self.embed_processes,
+                mp_context=self._context,
+                initializer=_load_embedder,
+                initargs=(self.embedding_config, threads)
+            )
+        size = -(-len(texts) // self.embed_processes)
+        slices = [texts[start:start + size] for start in range(0, len(texts), size)]
+        return np.vstack(list(self._embed_pool.map(_embed_texts, slices)))
+
+    def _publish(self, doc_ids):
+        """Write the checkpointed documents that changed into a new snapshot"""
+        records = self.checkpoint.load()
+        documents, sections = {}, {}
+        for doc_id in doc_ids:
+            record = records.get(doc_id)
+            if record is None:
+                continue
+            texts = [chunk['text'] for chunk in record['chunks']]
+            version = index_store.knowledge_base_version(texts, self.index.model_name)
+            if self.index.documents.get(doc_id, {}).get('version') == version:
+                continue
+            documents[doc_id] = (texts, version)
+            sections[doc_id] = [chunk['section'] for chunk in record['chunks']]
+
+        if not documents:
+            return {'documents': 0, 'added': 0, 'deleted': 0, 'unchanged': 0, 'encoded': 0}
+        result = self.index.upsert_documents(documents, sections)
+        result['documents'] = len(documents)
+        return result
@@ -0,0 +1,237 @@
+"""
+Database-backed queue for background chat requests.
+
+``POST /api/chat`` with ``"respond_async": true`` (or a ``Prefer:
+respond-async`` header) saves a pending ChatMessage and returns 202 with
+its ID. The message row is the job: worker threads claim pending rows
+with a conditional UPDATE, run retrieval and generation, and store the
+answer on the row. Nothing lives only in memory, so queued jobs survive a
+restart and several processes can share the queue without a broker. Jobs
+left ``running`` by a process that died are requeued after
+``RAG_JOB_STALE_SECONDS``, up to ``RAG_JOB_MAX_ATTEMPTS`` tries.
+"""
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Count, F
+from django.utils import timezone
+
+from .memory import conversation_history, remember_turn
+from .models import ChatMessage
+from .rag_service import get_rag_service
+
+logger = logging.getLogger(__name__)
+
+
+class ChatJobQueue:
+    """
+    Bounded pool of worker threads draining pending ChatMessages.
+
+    Args:
+        workers (int): Worker threads in this process
+        max_pending (int): Pending jobs beyond which new submissions are refused
+        poll_interval (float): Seconds between checks for jobs queued by other processes
+        stale_after (float): Seconds after which a running job is considered abandoned
+        max_attempts (int): Tries before an abandoned job is marked failed
+    """
+
+    def __init__(self, workers=2, max_pending=100, poll_interval=1.0, stale_after=600, max_attempts=3):
+        self.workers = max(1, workers)
+        self.max_pending = max_pending
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self.max_attempts = max_attempts
+        self._threads = []
+        self._start_lock = threading.Lock()
+        self._wakeup = threading.Condition()
+        self._finished = {}
+        self._finished_lock = threading.Lock()
+        self._last_stale_check = 0.0
+        self.completed = 0
+        self.failed = 0
+
+    def start(self):
+        """Start the worker threads once per process"""
+        if self._threads:
+            return
+        with self._start_lock:
+            if self._threads:
+                return
+            for number in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f'rag-chat-job-{number}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            logger.info(f"Chat job queue started with {self.workers} workers")
+
+    def is_full(self):
+        # Approximate under concurrent submissions; the bound is a safety valve, not a quota
+        return ChatMessage.objects.filter(status=ChatMessage.STATUS_PENDING).count() >= self.max_pending
+
+    def submit(self, conversation, user, message, options=None):
+        """Record a pending ChatMessage and wake a worker; returns the message"""
+        self.start()
+        job = ChatMessage.objects.create(
+            conversation=conversation,
+            user=user,
+            user_message=message,
+            ai_response='',
+            status=ChatMessage.STATUS_PENDING,
+            options=options or {}
+        )
+        with self._wakeup:
+            self._wakeup.notify()
+        return job
+
+    def wait(self, job, timeout):
+        """
+        Long-poll: block until ``job`` finishes or ``timeout`` seconds pass.
+
+        Jobs run by this process wake the waiter directly; jobs run by other
+        processes are noticed on the next database poll. Returns the job
+        reloaded from the database.
+        """
+        deadline = time.monotonic() + timeout
+        with self._finished_lock:
+            event = self._finished.setdefault(job.id, threading.Event())
+        try:
+            while job.status in (ChatMessage.STATUS_PENDING, ChatMessage.STATUS_RUNNING):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                event.wait(min(remaining, self.poll_interval))
+                job.refresh_from_db()
+        finally:
+            with self._finished_lock:
+                if self._finished.get(job.id) is event:
+                    del self._finished[job.id]
+        return job
+
+    def requeue_stale(self):
+        """Return abandoned running jobs to the queue, or fail them after too many tries"""
+        self._last_stale_check = time.monotonic()
+        now = timezone.now()
+        stale = ChatMessage.objects.filter(
+            status=ChatMessage.STATUS_RUNNING,
+            started_at__lt=now - timedelta(seconds=self.stale_after)
+        )
+        failed = stale.filter(attempts__gte=self.max_attempts).update(
+            status=ChatMessage.STATUS_FAILED,
+            error=f'Gave up after {self.max_attempts} attempts',
+            completed_at=now
+        )
+        requeued = stale.update(status=ChatMessage.STATUS_PENDING, started_at=None)
+        if failed or requeued:
+            logger.warning(f"Chat job queue: requeued {requeued} abandoned jobs, failed {failed}")
+        return requeued
+
+    def _work(self):
+        while True:
+            try:
+                close_old_connections()
+                if time.monotonic() - self._last_stale_check > self.stale_after / 2:
+                    self.requeue_stale()
+                job_id = self._claim_next()
+                if job_id is None:
+                    with self._wakeup:
+                        self._wakeup.wait(self.poll_interval)
+                    continue
+                self._run(job_id)
+            except Exception as e:
+                logger.error(f"Chat job worker error: {str(e)}")
+                time.sleep(self.poll_interval)
+
+    def _claim_next(self):
+        """Mark the oldest pending job running and return its ID (None if the queue is empty)"""
+        candidates = ChatMessage.objects.filter(
+            status=ChatMessage.STATUS_PENDING
+        ).order_by('id').values_list('id', flat=True)[:self.workers + 1]
+        for job_id in candidates:
+            # Another worker or process may claim the same row; only one UPDATE matches
+            claimed = ChatMessage.objects.filter(id=job_id, status=ChatMessage.STATUS_PENDING).update(
+                status=ChatMessage.STATUS_RUNNING,
+                started_at=timezone.now(),
+                attempts=F('attempts') + 1
+            )
+            if claimed:
+                return job_id
+        return None
+
+    def _run(self, job_id):
+        job = ChatMessage.objects.filter(id=job_id).first()
+        if job is None:
+            # Conversation deleted while the job was queued
+            return
+
+        rag_timings = {}
+        start = time.time()
+        try:
+            rag_service = get_rag_service(job.options.get('collection'))
+            ai_response = rag_service.get_response(
+                job.user_message,
+                retrieval_mode=job.options.get('retrieval_mode'),
+                fusion=job.options.get('fusion'),
+                timings=rag_timings,
+                history=conversation_history(job.conversation, before_id=job.id)
+            )
+        except Exception as e:
+            logger.error(f"Chat job {job_id} failed: {str(e)}")
+            fields = {'status': ChatMessage.STATUS_FAILED, 'error': f'Failed to process chat: {str(e)}'}
+            self.failed += 1
+        else:
+            fields = {'status': ChatMessage.STATUS_COMPLETED, 'ai_response': ai_response}
+            self.completed += 1
+
+        ChatMessage.objects.filter(id=job_id, status=ChatMessage.STATUS_RUNNING).update(
+            completed_at=timezone.now(),
+            latency={
+                'rag_processing_ms': round((time.time() - start) * 1000, 2),
+                'tokens': rag_timings.pop('tokens', None),
+                'rag_breakdown': rag_timings,
+            },
+            **fields
+        )
+        if fields['status'] == ChatMessage.STATUS_COMPLETED:
+            remember_turn(job.conversation, rag_service)
+        with self._finished_lock:
+            event = self._finished.get(job_id)
+        if event is not None:
+            event.set()
+
+    def stats(self):
+        counts = dict.fromkeys((ChatMessage.STATUS_PENDING, ChatMessage.STATUS_RUNNING), 0)
+        for row in ChatMessage.objects.filter(status__in=list(counts)).values('status').annotate(n=Count('id')):
+            counts[row['status']] = row['n']
+        return {
+            'workers': self.workers,
+            'workers_alive': sum(thread.is_alive() for thread in self._threads),
+            'pending': counts[ChatMessage.STATUS_PENDING],
+            'running': counts[ChatMessage.STATUS_RUNNING],
+            'max_pending': self.max_pending,
+            'completed': self.completed,
+            'failed': self.failed,
+        }
+
+
+# Global instance
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    """Get or create the process-wide chat job queue"""
+    global _job_queue
+    if _job_queue is None:
+        with _job_queue_lock:
+            if _job_queue is None:
+                _job_queue = ChatJobQueue(
+                    workers=settings.RAG_JOB_WORKERS,
+                    max_pending=settings.RAG_JOB_QUEUE_MAX_PENDING,
+                    poll_interval=settings.RAG_JOB_POLL_SECONDS,
+                    stale_after=settings.RAG_JOB_STALE_SECONDS,
+                    max_attempts=settings.RAG_JOB_MAX_ATTEMPTS
+                )
+    return _job_queue
@@ -0,0 +1,932 @@
+"""
+Live, incrementally updatable knowledge index.
+
+The current snapshot (see ``index_store``) is the immutable base layer.
+Chunk additions, updates and deletions are appended to the snapshot's
+journal and applied in memory: new vectors go to a small delta that is
+searched by brute force, and deleted base rows are masked out. Every
+chunk is addressed by a stable integer ID rather than its position.
+
+All processes sharing ``RAG_INDEX_DIR`` replay the same journal, so a
+change made by one worker (or by ``manage.py ingest_kb``) reaches the
+others on their next refresh. Once masked rows reach the configured
+fraction of the index, a background compaction writes a new snapshot
+without them and truncates the journal.
+"""
+import contextlib
+import hashlib
+import json
+import os
+import threading
+import time
+import logging
+
+import numpy as np
+
+from . import index_store, vector_index
+from .chunking import count_tokens
+from .lexical_index import BM25Index
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process deployments only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_NAME = 'journal.jsonl'
+
+
+@contextlib.contextmanager
+def store_lock(index_dir):
+    """Exclusive cross-process lock for writers of an index directory"""
+    os.makedirs(index_dir, exist_ok=True)
+    with open(os.path.join(index_dir, 'LOCK'), 'a') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class _View:
+    """
+    Searchable state of the index.
+
+    Readers grab ``KnowledgeIndex._view`` once per call; writers build a
+    modified copy and swap the reference, so searches never lock.
+
+    The delta is append-only: each added chunk takes the next slot, and
+    deleting or replacing one only drops its ID from ``delta_positions``,
+    leaving a dead slot until the next compaction. A writer's copy
+    collects new vectors in ``_pending`` and :meth:`finish` stacks them
+    onto ``delta_vectors`` once per batch, so a batch of n additions
+    costs O(n) rather than a matrix copy per chunk.
+    """
+
+    def __init__(self, base):
+        self.base = base
+        self.base_ids = base['ids']
+        self.base_deleted = np.zeros(len(base['ids']), dtype=bool)
+        self.delta_ids = []
+        self.delta_texts = []
+        self.delta_docs = []
+        self.delta_sections = []
+        self.delta_tokens = []
+        self.delta_vectors = np.zeros((0, base['meta']['dimension']), dtype='float32')
+        self.delta_positions = {}
+        self.delta_live = np.zeros(0, dtype='int64')
+        self._pending = []
+
+    def copy(self):
+        view = _View.__new__(_View)
+        view.base = self.base
+        view.base_ids = self.base_ids
+        view.base_deleted = self.base_deleted.copy()
+        view.delta_ids = list(self.delta_ids)
+        view.delta_texts = list(self.delta_texts)
+        view.delta_docs = list(self.delta_docs)
+        view.delta_sections = list(self.delta_sections)
+        view.delta_tokens = list(self.delta_tokens)
+        view.delta_vectors = self.delta_vectors
+        view.delta_positions = dict(self.delta_positions)
+        view.delta_live = self.delta_live
+        view._pending = []
+        return view
+
+    def add_delta(self, chunk_id, text, doc_id, section, tokens, vector):
+        self.delta_positions[chunk_id] = len(self.delta_ids)
+        self.delta_ids.append(chunk_id)
+        self.delta_texts.append(text)
+        self.delta_docs.append(doc_id)
+        self.delta_sections.append(section)
+        self.delta_tokens.append(tokens)
+        self._pending.append(np.asarray(vector, dtype='float32'))
+
+    def finish(self):
+        """Stack the vectors added to this copy and list the live slots, before publishing it"""
+        if self._pending:
+            self.delta_vectors = np.vstack([self.delta_vectors, np.stack(self._pending)])
+            self._pending = []
+        self.delta_live = np.fromiter(sorted(self.delta_positions.values()), dtype='int64')
+
+    def locate(self, chunk_id):
+        """('delta', slot), ('base', row) or None for a live chunk ID"""
+        slot = self.delta_positions.get(chunk_id)
+        if slot is not None:
+            return 'delta', slot
+        row = int(np.searchsorted(self.base_ids, chunk_id))
+        if row < len(self.base_ids) and self.base_ids[row] == chunk_id and not self.base_deleted[row]:
+            return 'base', row
+        return None
+
+
+class KnowledgeIndex:
+    """
+    Snapshot plus journal, searchable by embedding and addressable by chunk ID.
+
+    Use :meth:`open` to load (or build) the index for a directory.
+    """
+
+    def __init__(self, index_dir, model_name, encode_fn, layout='mmap',
+                 compaction_threshold=0.2, max_pending_chunks=10000,
+                 index_type='flat', index_params=None, storage='float32', rescore_factor=0):
+        self.index_dir = index_dir
+        self.model_name = model_name
+        self.encode_fn = encode_fn
+        self.layout = layout
+        self.index_type = index_type
+        self.index_params = index_params
+        self.storage = storage
+        self.rescore_factor = rescore_factor
+        self.compaction_threshold = compaction_threshold
+        self.max_pending_chunks = max_pending_chunks
+        self.cache = index_store.EmbeddingCache(index_dir, model_name)
+        self.documents = {}
+        self.next_chunk_id = 0
+        self.ops_applied = 0
+        self._view = None
+        self._snapshot_dir = None
+        self._journal_offset = 0
+        self._lock = threading.RLock()
+        self._compaction_thread = None
+        self._lexical = None
+        self._lexical_lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # Loading
+
+    @classmethod
+    def open(cls, index_dir, model_name, encode_fn, sources=None, layout='mmap',
+             rebuild=False, **options):
+        """
+        Load the current snapshot and journal, building one if needed.
+
+        Args:
+            sources (dict): {document_id: list of chunk texts} kept in sync
+                with the index, e.g. the knowledge base file. Only changed
+                documents are updated, through the journal.
+            rebuild (bool): Build a new snapshot from ``sources`` only,
+                dropping every other document
+
+        Returns:
+            tuple: (KnowledgeIndex, info dict with source and timings)
+        """
+        start = time.perf_counter()
+        knowledge_index = cls(index_dir, model_name, encode_fn, layout, **options)
+        sources = sources or {}
+        info = {'layout': layout, 'cache_hits': 0, 'cache_misses': 0}
+
+        with store_lock(index_dir):
+            meta = index_store.read_snapshot_meta(index_dir)
+            same_format = (
+                meta is not None
+                and meta.get('format_version') == index_store.SNAPSHOT_FORMAT_VERSION
+            )
+            if same_format and meta.get('model_name') == model_name and not rebuild:
+                knowledge_index._load_current()
+                info['source'] = 'snapshot'
+            else:
+                documents, sections = {}, {}
+                if same_format and not rebuild:
+                    # Embedding model changed: re-encode every stored document
+                    documents, sections = cls._stored_documents(index_dir, meta['model_name'], layout)
+                for doc_id, chunks in sources.items():
+                    documents[doc_id] = (chunks, index_store.knowledge_base_version(chunks, model_name))
+                    sections.pop(doc_id, None)
+                hits, misses = knowledge_index._build(documents, sections)
+                info.update({'source': 'built', 'cache_hits': hits, 'cache_misses': misses})
+
+            for doc_id, chunks in sources.items():
+                version = index_store.knowledge_base_version(chunks, model_name)
+                if knowledge_index.documents.get(doc_id, {}).get('version') != version:
+                    result = knowledge_index._upsert_document_locked(doc_id, chunks, version)
+                    info['source'] = 'snapshot+sync'
+                    info['cache_misses'] += result['encoded']
+
+        info['kb_version'] = knowledge_index.version
+        info['num_chunks'] = len(knowledge_index)
+        info['elapsed_ms'] = round((time.perf_counter() - start) * 1000, 2)
+        knowledge_index._maybe_schedule_compaction()
+        return knowledge_index, info
+
+    @classmethod
+    def _stored_documents(cls, index_dir, model_name, layout):
+        """({doc_id: (chunks, None)}, {doc_id: sections}) of the current snapshot and journal"""
+        def cached_only(texts):
+            raise LookupError('embedding missing from cache')
+
+        previous = cls(index_dir, model_name, cached_only, layout)
+        try:
+            previous._load_current()
+        except (LookupError, OSError, ValueError) as e:
+            logger.warning(f"Could not read previous RAG index, rebuilding from sources only: {str(e)}")
+            return {}, {}
+
+        documents, sections = {}, {}
+        for chunk_id, text in previous.iter_chunks():
+            chunk = previous.get_chunk(chunk_id)
+            documents.setdefault(chunk['document'], ([], None))[0].append(text)
+            sections.setdefault(chunk['document'], []).append(chunk['section'])
+        return documents, sections
+
+    def _build(self, documents, sections=None):
+        """Write a fresh snapshot from {doc_id: (chunks, version)} and optional {doc_id: sections}"""
+        sections = sections or {}
+        texts, doc_rows, doc_list, row_sections = [], [], [], []
+        for position, (doc_id, (chunks, version)) in enumerate(documents.items()):
+            doc_list.append({'id': doc_id, 'version': version})
+            texts.extend(chunks)
+            doc_rows.extend([position] * len(chunks))
+            row_sections.extend(sections.get(doc_id) or [None] * len(chunks))
+
+        embeddings, hits, misses = self.cache.encode(texts, self.encode_fn)
+        if not texts:
+            embeddings = np.zeros((0, self._dimension()), dtype='float32')
+
+        ids = np.arange(len(texts), dtype='int64')
+        kb_version = index_store.knowledge_base_version(texts, self.model_name)
+        index_store.save_snapshot(
+            self.index_dir, texts, embeddings, ids, doc_rows, doc_list,
+            self.model_name, kb_version, next_chunk_id=len(texts), sections=row_sections,
+            storage=self.storage
+        )
+        self._load_current()
+        return hits, misses
+
+    def _dimension(self):
+        return int(np.asarray(self.encode_fn(['dimension probe'])).shape[1])
+
+    def _load_current(self):
+        """(Re)load the current snapshot and replay its journal"""
+        snapshot_dir = index_store.current_snapshot_dir(self.index_dir)
+        base = index_store.open_snapshot_dir(
+            snapshot_dir, self.layout, self.index_type, self.index_params,
+            self.storage, self.rescore_factor
+        )
+        with self._lock:
+            lexical_in_use = self._lexical is not None
+            self._lexical = None
+            self._snapshot_dir = snapshot_dir
+            self._view = _View(base)
+            self.documents = {doc['id']: {'version': doc.get('version')} for doc in base['documents']}
+            self.next_chunk_id = base['meta'].get('next_chunk_id', len(base['ids']))
+            self.ops_applied = 0
+            self._journal_offset = 0
+            self._replay_journal()
+            if lexical_in_use:
+                self._build_lexical()
+
+    # ------------------------------------------------------------------
+    # Journal
+
+    @property
+    def journal_path(self):
+        return os.path.join(self._snapshot_dir, JOURNAL_NAME)
+
+    @property
+    def version(self):
+        """KB version: snapshot version plus the number of journal entries applied"""
+        base_version = self._view.base['meta']['kb_version']
+        return f"{base_version}+{self.ops_applied}" if self.ops_applied else base_version
+
+    def refresh(self):
+        """Pick up a new snapshot or journal entries written by other processes"""
+        with self._lock:
+            if index_store.current_snapshot_dir(self.index_dir) != self._snapshot_dir:
+                self._load_current()
+                return True
+            try:
+                size = os.path.getsize(self.journal_path)
+            except OSError:
+                return False
+            if size > self._journal_offset:
+                self._replay_journal()
+                return True
+        return False
+
+    def _replay_journal(self):
+        try:
+            with open(self.journal_path, 'rb') as f:
+                f.seek(self._journal_offset)
+                data = f.read()
+        except OSError:
+            return
+
+        # Only consume complete lines; a writer may be mid-append
+        end = data.rfind(b'\n') + 1
+        records = [json.loads(line) for line in data[:end].splitlines() if line.strip()]
+        self._journal_offset += end
+        if not records:
+            return
+
+        texts = [r['text'] for r in records if r['op'] == 'add']
+        vectors = {}
+        if texts:
+            matrix, _, _ = self.cache.encode(texts, self.encode_fn)
+            vectors = dict(zip(texts, matrix))
+
+        self._apply_all(records, vectors)
+
+    def _append(self, records, vectors):
+        """Write records to the journal and apply them (store lock held)"""
+        payload = ''.join(json.dumps(r, ensure_ascii=False) + '\n' for r in records)
+        with open(self.journal_path, 'a', encoding='utf-8') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        self._journal_offset = os.path.getsize(self.journal_path)
+        self._apply_all(records, vectors)
+
+    def _apply_all(self, records, vectors):
+        """Apply records to a copy of the view and publish it"""
+        view = self._view.copy()
+        for record in records:
+            self._apply(view, record, vectors)
+        view.finish()
+        self._view = view
+
+    def _apply(self, view, record, vectors):
+        op = record['op']
+        if op == 'add':
+            self._unindex_lexical(view, record['id'])
+            self._delete_from_view(view, record['id'])
+            if self._lexical is not None:
+                with self._lexical_lock:
+                    self._lexical.add(record['id'], record['text'])
+            view.add_delta(
+                record['id'], record['text'], record['doc'], record.get('section'),
+                # Journals written before token counts were recorded are counted on replay
+                record['tokens'] if 'tokens' in record else count_tokens(record['text']),
+                vectors[record['text']]
+            )
+            self.documents.setdefault(record['doc'], {'version': None})
+            self.next_chunk_id = max(self.next_chunk_id, record['id'] + 1)
+        elif op == 'delete':
+            for chunk_id in record['ids']:
+                self._unindex_lexical(view, chunk_id)
+                self._delete_from_view(view, chunk_id)
+        elif op == 'document':
+            if record.get('deleted'):
+                self.documents.pop(record['doc'], None)
+            else:
+                self.documents[record['doc']] = {'version': record.get('version')}
+        self.ops_applied += 1
+
+    @staticmethod
+    def _delete_from_view(view, chunk_id):
+        location = view.locate(chunk_id)
+        if location is None:
+            return False
+        kind, position = location
+        if kind == 'base':
+            view.base_deleted[position] = True
+        else:
+            del view.delta_positions[chunk_id]
+        return True
+
+    def _unindex_lexical(self, view, chunk_id):
+        if self._lexical is None:
+            return
+        location = view.locate(chunk_id)
+        if location is not None:
+            with self._lexical_lock:
+                self._lexical.remove(chunk_id, self._hit(view, *location, None)['text'])
+
+    # ------------------------------------------------------------------
+    # Reading
+
+    def __len__(self):
+        view = self._view
+        return int(len(view.base_ids) - view.base_deleted.sum()) + len(view.delta_positions)
+
+    def __iter__(self):
+        for _, text in self.iter_chunks():
+            yield text
+
+    def iter_chunks(self):
+        """Yield (chunk_id, text) for every live chunk"""
+        view = self._view
+        chunks = view.base['chunks']
+        for row in range(len(view.base_ids)):
+            if not view.base_deleted[row]:
+                yield int(view.base_ids[row]), chunks[row]
+        for slot in view.delta_live:
+            yield view.delta_ids[slot], view.delta_texts[slot]
+
+    def get_chunk(self, chunk_id):
+        """{'id', 'text', 'document', 'section'} for a live chunk ID, or None"""
+        view = self._view
+        location = view.locate(chunk_id)
+        if location is None:
+            return None
+        kind, position = location
+        if kind == 'delta':
+            return {
+                'id': chunk_id,
+                'text': view.delta_texts[position],
+                'document': view.delta_docs[position],
+                'section': view.delta_sections[position],
+            }
+        documents = view.base['documents']
+        return {
+            'id': chunk_id,
+            'text': view.base['chunks'][position],
+            'document': documents[int(view.base['doc_rows'][position])]['id'],
+            'section': index_store.section_of_row(view.base, position),
+        }
+
+    def document_chunk_ids(self, doc_id):
+        """Live chunk IDs belonging to a document"""
+        view = self._view
+        ids = []
+        positions = [i for i, doc in enumerate(view.base['documents']) if doc['id'] == doc_id]
+        if positions:
+            rows = np.flatnonzero(np.isin(view.base['doc_rows'], positions) & ~view.base_deleted)
+            ids.extend(int(view.base_ids[row]) for row in rows)
+        ids.extend(view.delta_ids[slot] for slot in view.delta_live if view.delta_docs[slot] == doc_id)
+        return ids
+
+    def token_counts(self, chunk_ids):
+        """
+        Estimated token counts of chunks, counted when they were written.
+
+        Returns:
+            list: one count per ID, None for chunks that are not live
+        """
+        view = self._view
+        counts = []
+        for chunk_id in chunk_ids:
+            location = view.locate(chunk_id)
+            if location is None:
+                counts.append(None)
+            elif location[0] == 'delta':
+                counts.append(view.delta_tokens[location[1]])
+            else:
+                counts.append(index_store.tokens_of_row(view.base, location[1]))
+        return counts
+
+    def vectors(self, chunk_ids):
+        """
+        Stored float32 embeddings of live chunks, one row per ID.
+
+        Snapshot rows are read from the memory-mapped embeddings.npy, so
+        this is exact whatever storage the search index uses.
+
+        Raises:
+            KeyError: if a chunk is not live (e.g. deleted since it was found)
+            OSError: if the snapshot's embeddings.npy was pruned after a newer
+                snapshot replaced it
+        """
+        view = self._view
+        base = view.base
+        vectors = np.empty((len(chunk_ids), view.delta_vectors.shape[1]), dtype='float32')
+        rows, positions = [], []
+        for i, chunk_id in enumerate(chunk_ids):
+            location = view.locate(chunk_id)
+            if location is None:
+                raise KeyError(chunk_id)
+            kind, position = location
+            if kind == 'delta':
+                vectors[i] = view.delta_vectors[position]
+            else:
+                rows.append(position)
+                positions.append(i)
+        if rows:
+            if 'embeddings' not in base:
+                base['embeddings'] = index_store.load_embeddings(base['path'])
+            vectors[positions] = base['embeddings'][rows]
+        return vectors
+
+    def search(self, query_vectors, k):
+        """
+        Nearest live chunks for each query vector.
+
+        Returns:
+            list[list[dict]]: per query, up to k {'id', 'distance', 'text'}
+                ordered by increasing squared L2 distance
+        """
+        view = self._view
+        queries = np.ascontiguousarray(query_vectors, dtype='float32')
+        base_hits = self._search_base(view, queries, k)
+
+        results = []
+        for q, hits in enumerate(base_hits):
+            candidates = [('base', row, distance) for row, distance in hits]
+            if len(view.delta_live):
+                diff = view.delta_vectors[view.delta_live] - queries[q]
+                distances = np.einsum('ij,ij->i', diff, diff)
+                candidates.extend(('delta', int(slot), float(d)) for slot, d in zip(view.delta_live, distances))
+            candidates.sort(key=lambda candidate: candidate[2])
+            results.append([self._hit(view, *candidate) for candidate in candidates[:k]])
+        return results
+
+    def search_lexical(self, query, k):
+        """
+        BM25 keyword search over live chunks.
+
+        The inverted index is built on first use and then kept in step
+        with the journal, so deployments that only search by embedding
+        never pay for it.
+
+        Returns:
+            list[dict]: up to k {'id', 'score', 'text'}, best first
+        """
+        lexical = self._lexical or self._build_lexical()
+        with self._lexical_lock:
+            ranked = lexical.search(query, k)
+
+        view = self._view
+        hits = []
+        for chunk_id, score in ranked:
+            location = view.locate(chunk_id)
+            if location is not None:
+                hit = self._hit(view, *location, None)
+                del hit['distance']
+                hit['score'] = score
+                hits.append(hit)
+        return hits
+
+    def _build_lexical(self):
+        with self._lock:
+            if self._lexical is None:
+                start = time.perf_counter()
+                self._lexical = BM25Index.build(self.iter_chunks())
+                logger.info(
+                    f"Built BM25 index over {len(self._lexical)} chunks "
+                    f"in {(time.perf_counter() - start) * 1000:.0f}ms"
+                )
+            return self._lexical
+
+    @staticmethod
+    def _hit(view, kind, position, distance):
+        if kind == 'delta':
+            return {'id': view.delta_ids[position], 'distance': distance, 'text': view.delta_texts[position]}
+        return {
+            'id': int(view.base_ids[position]),
+            'distance': distance,
+            'text': view.base['chunks'][position],
+        }
+
+    @staticmethod
+    def _search_base(view, queries, k):
+        """Per query, up to k (row, distance) pairs of live snapshot rows"""
+        index = view.base['index']
+        if index.ntotal == 0:
+            return [[] for _ in range(len(queries))]
+
+        # Over-fetch until every query has k live rows or the index is exhausted
+        fetch = k
+        while True:
+            fetch = min(fetch, index.ntotal)
+            distances, rows = index.search(queries, fetch)
+            hits = []
+            for q in range(len(queries)):
+                hits.append([
+                    (int(row), float(distance))
+                    for row, distance in zip(rows[q], distances[q])
+                    if row >= 0 and not view.base_deleted[row]
+                ])
+            if fetch >= index.ntotal or all(len(h) >= k for h in hits):
+                return [h[:k] for h in hits]
+            fetch *= 4
+
+    def stats(self):
+        view = self._view
+        base_rows = len(view.base_ids)
+        deleted = int(view.base_deleted.sum())
+        return {
+            'kb_version': self.version,
+            'snapshot': os.path.basename(self._snapshot_dir),
+            'layout': self.layout,
+            'index_type': view.base['index_type'],
+            'storage': view.base['storage'],
+            'rescore_factor': self.rescore_factor,
+            'live_chunks': len(self),
+            'documents': len(self.documents),
+            'snapshot_rows': base_rows,
+            'deleted_rows': deleted,
+            'pending_chunks': len(view.delta_positions),
+            'journal_entries': self.ops_applied,
+            'deleted_fraction': round(deleted / base_rows, 4) if base_rows else 0.0,
+            'lexical_terms': self._lexical.vocabulary_size if self._lexical is not None else None,
+            'memory_bytes': self.memory_bytes(),
+        }
+
+    def memory_bytes(self):
+        """
+        Approximate memory of the searched vectors, chunk text, row arrays
+        and pending changes. With the mmap layout this is what the index
+        can pull into the page cache, not private memory of this process.
+        """
+        view = self._view
+        base = view.base
+        if 'memory_bytes' not in base:
+            # The snapshot never changes; measuring some FAISS indexes serializes them
+            chunks = base['chunks']
+            if isinstance(chunks, index_store.ChunkStore):
+                text_bytes = chunks.nbytes
+            else:
+                text_bytes = sum(len(text) for text in chunks)
+            base['memory_bytes'] = int(
+                vector_index.index_memory_bytes(base['index'])
+                + text_bytes + base['ids'].nbytes + base['doc_rows'].nbytes
+            )
+        return int(
+            base['memory_bytes']
+            + view.base_deleted.nbytes
+            + view.delta_vectors.nbytes
+            + sum(len(text) for text in view.delta_texts)
+        )
+
+    # ------------------------------------------------------------------
+    # Writing
+
+    def _encode(self, texts):
+        if not texts:
+            return {}, 0
+        matrix, _, misses = self.cache.encode(texts, self.encode_fn)
+        return dict(zip(texts, matrix)), misses
+
+    @staticmethod
+    def _add_record(chunk_id, doc_id, text, section=None):
+        record = {'op': 'add', 'id': chunk_id, 'doc': doc_id, 'text': text, 'tokens': count_tokens(text)}
+        if section:
+            record['section'] = section
+        return record
+
+    def add_chunks(self, doc_id, texts, sections=None):
+        """Add chunks (with optional section headings) to a document; returns their new chunk IDs"""
+        sections = sections or [None] * len(texts)
+        with store_lock(self.index_dir), self._lock:
+            self.refresh()
+            vectors, _ = self._encode(texts)
+            ids = list(range(self.next_chunk_id, self.next_chunk_id + len(texts)))
+            records = [
+                self._add_record(cid, doc_id, text, section)
+                for cid, text, section in zip(ids, texts, sections)
+            ]
+            if doc_id not in self.documents:
+                records.insert(0, {'op': 'document', 'doc': doc_id, 'version': None})
+            self._append(records, vectors)
+        self._maybe_schedule_compaction()
+        return ids
+
+    def update_chunk(self, chunk_id, text):
+        """Replace the text (and embedding) of a chunk, keeping its ID"""
+        with store_lock(self.index_dir), self._lock:
+            self.refresh()
+            chunk = self.get_chunk(chunk_id)
+            if chunk is None:
+                raise KeyError(f"Chunk {chunk_id} not found")
+            vectors, _ = self._encode([text])
+            self._append([self._add_record(chunk_id, chunk['document'], text, chunk['section'])], vectors)
+        self._maybe_schedule_compaction()
+
+    def delete_chunks(self, chunk_ids):
+        """Delete chunks by ID; returns how many existed"""
+        with store_lock(self.index_dir), self._lock:
+            self.refresh()
+            existing = [cid for cid in chunk_ids if self._view.locate(cid) is not None]
+            if existing:
+                self._append([{'op': 'delete', 'ids': existing}], {})
+        self._maybe_schedule_compaction()
+        return len(existing)
+
+    def upsert_document(self, doc_id, texts, version=None, sections=None):
+        """
+        Make a document consist of exactly these chunks.
+
+        Unchanged chunks keep their IDs and embeddings; only new or edited
+        chunks are encoded.
+
+        Args:
+            sections (list): Section heading (or None) of each chunk
+
+        Returns:
+            dict: counts of added, deleted, unchanged and encoded chunks
+        """
+        with store_lock(self.index_dir), self._lock:
+            self.refresh()
+            result = self._upsert_document_locked(doc_id, texts, version, sections)
+        self._maybe_schedule_compaction()
+        return result
+
+    def _upsert_document_locked(self, doc_id, texts, version, sections=None):
+        existing = {}
+        for chunk_id in self.document_chunk_ids(doc_id):
+            existing.setdefault(self.get_chunk(chunk_id)['text'], []).append(chunk_id)
+
+        # Walk the chunks in order so each new one keeps its own section,
+        # even when several chunks share a text
+        to_add = []
+        for text, section in zip(texts, sections or [None] * len(texts)):
+            have = existing.get(text)
+            if have:
+                have.pop(0)
+            else:
+                to_add.append((text, section))
+        to_delete = [chunk_id for ids in existing.values() for chunk_id in ids]
+
+        vectors, encoded = self._encode([text for text, _ in to_add])
+        records = []
+        if to_delete:
+            records.append({'op': 'delete', 'ids': to_delete})
+        for offset, (text, section) in enumerate(to_add):
+            records.append(self._add_record(self.next_chunk_id + offset, doc_id, text, section))
+        records.append({'op': 'document', 'doc': doc_id, 'version': version})
+        self._append(records, vectors)
+
+        return {
+            'added': len(to_add),
+            'deleted': len(to_delete),
+            'unchanged': len(texts) - len(to_add),
+            'encoded': encoded,
+        }
+
+    def delete_document(self, doc_id):
+        """Delete a document and all of its chunks; returns the chunk count"""
+        with store_lock(self.index_dir), self._lock:
+            self.refresh()
+            ids = self.document_chunk_ids(doc_id)
+            if doc_id not in self.documents and not ids:
+                return 0
+            records = [{'op': 'delete', 'ids': ids}] if ids else []
+            records.append({'op': 'document', 'doc': doc_id, 'deleted': True})
+            self._append(records, {})
+        self._maybe_schedule_compaction()
+        return len(ids)
+
+    # ------------------------------------------------------------------
+    # Compaction
+
+    def needs_compaction(self):
+        view = self._view
+        base_rows = len(view.base_ids)
+        deleted = int(view.base_deleted.sum())
+        if base_rows and deleted / base_rows >= self.compaction_threshold:
+            return True
+        # Dead delta slots count too: they hold memory until compaction
+        return len(view.delta_ids) >= self.max_pending_chunks
+
+    def _maybe_schedule_compaction(self):
+        if not self.needs_compaction():
+            return
+        with self._lock:
+            if self._compaction_thread is not None and self._compaction_thread.is_alive():
+                return
+            self._compaction_thread = threading.Thread(
+                target=self._compact_in_background, name='rag-index-compaction', daemon=True
+            )
+            self._compaction_thread.start()
+
+    def _compact_in_background(self):
+        try:
+            self.compact()
+        except Exception as e:
+            logger.error(f"Index compaction failed: {str(e)}")
+
+    def compact(self):
+        """
+        Fold the journal into a new snapshot without deleted rows.
+
+        Embeddings are copied from the current snapshot and the delta, so
+        nothing is re-encoded.
+
+        Returns:
+            dict: rows dropped and kept
+        """
+        with store_lock(self.index_dir):
+            self.refresh()
+            view = self._view
+            if view.base_deleted.sum() == 0 and not view.delta_ids:
+                return {'dropped': 0, 'kept': len(self)}
+
+            ids, texts, doc_names, sections, embeddings = self._live_rows(view)
+            kb_version = hashlib.sha256(self.version.encode('utf-8')).hexdigest()[:16]
+            self._save_rows(ids, texts, doc_names, sections, embeddings, kb_version)
+            dropped = int(view.base_deleted.sum())
+            self._load_current()
+
+        logger.info(f"Compacted RAG index: dropped {dropped} rows, kept {len(ids)}")
+        return {'dropped': dropped, 'kept': len(ids)}
+
+    def upsert_documents(self, documents, sections=None):
+        """
+        Upsert many documents at once by writing one new snapshot.
+
+        The bulk counterpart of :meth:`upsert_document` for ingestion runs,
+        where journaling thousands of documents would grow the in-memory
+        delta one chunk at a time. Chunks of other documents, and unchanged
+        chunks of these ones, keep their IDs and embeddings; new chunks are
+        read from the embedding cache or encoded. The journal is folded in
+        as by :meth:`compact`.
+
+        Args:
+            documents (dict): {doc_id: (list of chunk texts, version)}
+            sections (dict): {doc_id: section heading (or None) of each chunk}
+
+        Returns:
+            dict: counts of added, deleted, unchanged and encoded chunks
+        """
+        sections = sections or {}
+        with store_lock(self.index_dir):
+            self.refresh()
+            ids, texts, doc_names, row_sections, embeddings = self._live_rows(self._view)
+
+            keep, reusable = [], {}
+            for row, doc_id in enumerate(doc_names):
+                if doc_id in documents:
+                    reusable.setdefault((doc_id, texts[row]), []).append(row)
+                else:
+                    keep.append(row)
+
+            new_chunks = []
+            for doc_id, (chunks, _) in documents.items():
+                for text, section in zip(chunks, sections.get(doc_id) or [None] * len(chunks)):
+                    rows = reusable.get((doc_id, text))
+                    if rows:
+                        row = rows.pop(0)
+                        row_sections[row] = section
+                        keep.append(row)
+                    else:
+                        new_chunks.append((doc_id, text, section))
+
+            vectors, encoded = self._encode(list(dict.fromkeys(text for _, text, _ in new_chunks)))
+            new_ids = np.arange(self.next_chunk_id, self.next_chunk_id + len(new_chunks), dtype='int64')
+            self.next_chunk_id += len(new_chunks)
+            for doc_id, (_, version) in documents.items():
+                self.documents[doc_id] = {'version': version}
+
+            all_texts = [texts[row] for row in keep] + [text for _, text, _ in new_chunks]
+            all_vectors = [embeddings[keep]] if keep else []
+            all_vectors += [vectors[text][None, :] for _, text, _ in new_chunks]
+            self._save_rows(
+                np.concatenate([ids[keep], new_ids]),
+                all_texts,
+                [doc_names[row] for row in keep] + [doc_id for doc_id, _, _ in new_chunks],
+                [row_sections[row] for row in keep] + [section for _, _, section in new_chunks],
+                np.vstack(all_vectors) if all_vectors else np.zeros((0, self._dimension()), dtype='float32'),
+                index_store.knowledge_base_version(all_texts, self.model_name),
+            )
+            self._load_current()
+
+        deleted = sum(len(rows) for rows in reusable.values())
+        logger.info(
+            f"Upserted {len(documents)} documents into a new snapshot: "
+            f"{len(new_chunks)} chunks added, {deleted} deleted"
+        )
+        return {
+            'added': len(new_chunks),
+            'deleted': deleted,
+            'unchanged': sum(len(chunks) for chunks, _ in documents.values()) - len(new_chunks),
+            'encoded': encoded,
+        }
+
+    @staticmethod
+    def _live_rows(view):
+        """(ids, texts, document IDs, sections, embeddings) of every live chunk, snapshot rows first"""
+        live_rows = np.flatnonzero(~view.base_deleted)
+        slots = view.delta_live
+        base = view.base
+        base_documents = base['documents']
+        ids = np.concatenate([
+            np.asarray(view.base_ids)[live_rows],
+            np.asarray(view.delta_ids, dtype='int64')[slots],
+        ])
+        embeddings = np.vstack([
+            np.asarray(index_store.load_embeddings(base['path'])[live_rows]),
+            view.delta_vectors[slots],
+        ])
+        texts = [base['chunks'][row] for row in live_rows] + [view.delta_texts[slot] for slot in slots]
+        doc_names = [base_documents[int(base['doc_rows'][row])]['id'] for row in live_rows]
+        doc_names += [view.delta_docs[slot] for slot in slots]
+        sections = [index_store.section_of_row(base, row) for row in live_rows]
+        sections += [view.delta_sections[slot] for slot in slots]
+        return ids, texts, doc_names, sections, embeddings
+
+    def _save_rows(self, ids, texts, doc_names, sections, embeddings, kb_version):
+        """Write rows in any order as the new snapshot (store lock held)"""
+        order = np.argsort(ids, kind='stable')
+        doc_list = [{'id': doc_id, 'version': doc['version']} for doc_id, doc in self.documents.items()]
+        doc_positions = {doc['id']: position for position, doc in enumerate(doc_list)}
+        for name in doc_names:
+            if name not in doc_positions:
+                doc_positions[name] = len(doc_list)
+                doc_list.append({'id': name, 'version': None})
+
+        index_store.save_snapshot(
+            self.index_dir,
+            [texts[i] for i in order],
+            embeddings[order],
+            ids[order],
+            [doc_positions[doc_names[i]] for i in order],
+            doc_list,
+            self.model_name,
+            kb_version,
+            self.next_chunk_id,
+            sections=[sections[i] for i in order],
+            storage=self.storage,
+        )
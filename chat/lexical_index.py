@@ -0,0 +1,140 @@
+"""
+Lexical (keyword) retrieval for the RAG service.
+
+``BM25Index`` keeps an inverted index of term -> {chunk key: term
+frequency} plus per-chunk lengths, built once when the knowledge base
+is loaded and updated in place as chunks are added or removed. A query
+only touches the postings of its own terms, so its cost depends on how
+common those terms are rather than on the size of the corpus.
+"""
+import heapq
+import math
+import re
+from collections import Counter
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+STOPWORDS = frozenset("""
+a about above after again against all am an and any are as at be because been
+before being below between both but by can could did do does doing down during
+each few for from further had has have having he her here hers herself him
+himself his how i if in into is it its itself just me more most my myself no
+nor not now of off on once only or other our ours ourselves out over own same
+she should so some such than that the their theirs them themselves then there
+these they this those through to too under until up very was we were what when
+where which while who whom why will with would you your yours yourself
+yourselves
+""".split())
+
+
+def tokenize(text):
+    """Lowercase word tokens with stopwords and possessive suffixes removed"""
+    return [
+        token for token in (
+            token[:-2] if token.endswith("'s") else token
+            for token in TOKEN_PATTERN.findall(text.lower())
+        )
+        if token and token not in STOPWORDS
+    ]
+
+
+class BM25Index:
+    """
+    Okapi BM25 over an inverted index.
+
+    Chunks are identified by an opaque hashable key (a list position or a
+    stable chunk ID). ``k1`` controls term-frequency saturation and ``b``
+    the strength of document length normalisation.
+    """
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings = {}
+        self._lengths = {}
+        self._total_length = 0
+
+    @classmethod
+    def build(cls, items, **params):
+        """Build an index from an iterable of (key, text) pairs"""
+        index = cls(**params)
+        for key, text in items:
+            index.add(key, text)
+        return index
+
+    def __len__(self):
+        return len(self._lengths)
+
+    def __contains__(self, key):
+        return key in self._lengths
+
+    @property
+    def vocabulary_size(self):
+        return len(self._postings)
+
+    def add(self, key, text):
+        """Index a chunk, replacing any previous text under the same key"""
+        if key in self._lengths:
+            self.remove(key)
+
+        tokens = tokenize(text)
+        postings = self._postings
+        for token, count in Counter(tokens).items():
+            if token in postings:
+                postings[token][key] = count
+            else:
+                postings[token] = {key: count}
+
+        self._lengths[key] = len(tokens)
+        self._total_length += len(tokens)
+
+    def remove(self, key, text=None):
+        """
+        Drop a chunk from the index.
+
+        Passing the chunk's text limits the work to its own terms;
+        otherwise every posting list is scanned.
+        """
+        length = self._lengths.pop(key, None)
+        if length is None:
+            return False
+        self._total_length -= length
+
+        terms = set(tokenize(text)) if text is not None else list(self._postings)
+        for token in terms:
+            postings = self._postings.get(token)
+            if postings is not None and postings.pop(key, None) is not None and not postings:
+                del self._postings[token]
+        return True
+
+    def search(self, query, top_k=3):
+        """
+        Score chunks containing any query term.
+
+        Returns:
+            list: Up to ``top_k`` (key, score) pairs, best first
+        """
+        num_docs = len(self._lengths)
+        if not num_docs or top_k <= 0:
+            return []
+
+        k1 = self.k1
+        avg_length = self._total_length / num_docs or 1.0
+        length_norm = k1 * (1 - self.b)
+        length_scale = k1 * self.b / avg_length
+        lengths = self._lengths
+
+        scores = {}
+        for token in set(tokenize(query)):
+            postings = self._postings.get(token)
+            if not postings:
+                continue
+            df = len(postings)
+            idf = math.log(1 + (num_docs - df + 0.5) / (df + 0.5))
+            weight = idf * (k1 + 1)
+            for key, tf in postings.items():
+                scores[key] = scores.get(key, 0.0) + weight * tf / (
+                    tf + length_norm + length_scale * lengths[key]
+                )
+
+        return heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
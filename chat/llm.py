@@ -0,0 +1,327 @@
+"""
+LLM backends used by the RAG service.
+
+``GeminiClient`` is the production backend. The service creates one per
+process and shares it across collections and requests, so the model
+object, its generation config and the connections to the API are set up
+once rather than for every answer. Two transports are available:
+
+    sdk   google-generativeai with a single ``GenerativeModel``; the SDK
+          keeps its API client, and the connection under it, between calls
+    rest  the Gemini REST API called directly over a pool of keep-alive
+          HTTP connections (stdlib only, no SDK needed); ``api_base`` can
+          point it at a proxy or a local mock server
+
+``FakeLLM`` is a deterministic offline backend for tests, local
+development and benchmarks (``RAG_LLM_BACKEND=fake``). It answers with
+the start of the prompt's context, streamed word by word with a
+configurable delay, so streaming clients can be exercised without an
+API key or network access. An optional delay per prompt token stands in
+for the model reading the prompt, so benchmarks see latency grow with
+prompt size. The async methods sleep on the event loop
+instead of a thread, like a real network-bound client.
+"""
+import asyncio
+import http.client
+import json
+import ssl
+import threading
+import time
+from urllib.parse import quote, urlsplit
+
+from .chunking import count_tokens
+
+GEMINI_TRANSPORTS = ('sdk', 'rest')
+
+
+class FakeLLM:
+    """
+    Deterministic streaming stand-in for an LLM.
+
+    Args:
+        token_delay_ms (float): Pause before each streamed token
+        max_words (int): Length of the answer in words
+        prompt_delay_ms (float): Pause before the first token per 1000 prompt tokens
+    """
+
+    name = 'fake'
+
+    def __init__(self, token_delay_ms=20.0, max_words=60, prompt_delay_ms=0.0):
+        self.token_delay = token_delay_ms / 1000
+        self.max_words = max_words
+        self.prompt_delay = prompt_delay_ms / 1000
+
+    def _prompt_delay(self, prompt):
+        return self.prompt_delay * count_tokens(prompt) / 1000 if self.prompt_delay else 0.0
+
+    def answer(self, prompt):
+        if 'Context:' in prompt:
+            context = prompt.split('Context:', 1)[1].split('Question:', 1)[0]
+        else:
+            context = prompt
+        words = context.split()[:self.max_words]
+        return 'Based on the knowledge base: ' + ' '.join(words) if words else 'No context available.'
+
+    def generate(self, prompt):
+        """Complete answer text"""
+        return ''.join(self.stream(prompt))
+
+    def stream(self, prompt):
+        """Yield the answer in word-sized pieces"""
+        if self.prompt_delay:
+            time.sleep(self._prompt_delay(prompt))
+        for position, word in enumerate(self.answer(prompt).split(' ')):
+            if self.token_delay:
+                time.sleep(self.token_delay)
+            yield word if position == 0 else ' ' + word
+
+    async def agenerate(self, prompt):
+        """Complete answer text, without blocking the event loop"""
+        pieces = []
+        async for piece in self.astream(prompt):
+            pieces.append(piece)
+        return ''.join(pieces)
+
+    async def astream(self, prompt):
+        if self.prompt_delay:
+            await asyncio.sleep(self._prompt_delay(prompt))
+        for position, word in enumerate(self.answer(prompt).split(' ')):
+            if self.token_delay:
+                await asyncio.sleep(self.token_delay)
+            yield word if position == 0 else ' ' + word
+
+
+class GeminiError(Exception):
+    """The Gemini API refused a request or returned no answer"""
+
+
+class ConnectionPool:
+    """
+    Keep-alive HTTP(S) connections to one host, shared by threads.
+
+    A connection is used by one request at a time and put back once its
+    response has been read to the end; connections the server closes, or
+    whose response was abandoned part-way, are discarded. A request that
+    fails on a reused connection because the server dropped it while idle
+    is retried once on a new one.
+
+    Args:
+        base_url (str): Scheme, host, port and path prefix of every request
+        size (int): Idle connections kept for reuse
+        timeout (float): Socket timeout in seconds
+    """
+
+    def __init__(self, base_url, size=8, timeout=60.0):
+        parts = urlsplit(base_url)
+        if parts.scheme not in ('http', 'https'):
+            raise ValueError(f"Unsupported URL scheme in {base_url!r}")
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.prefix = parts.path.rstrip('/')
+        self.size = max(0, size)
+        self.timeout = timeout
+        self._ssl_context = ssl.create_default_context() if self.scheme == 'https' else None
+        self._idle = []
+        self._lock = threading.Lock()
+        self._stats = {'requests': 0, 'connections_opened': 0, 'connections_reused': 0, 'retries': 0}
+
+    def _connect(self):
+        if self._ssl_context is not None:
+            return http.client.HTTPSConnection(
+                self.host, self.port, timeout=self.timeout, context=self._ssl_context
+            )
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def _acquire(self):
+        """(connection, True if it was reused)"""
+        with self._lock:
+            self._stats['requests'] += 1
+            if self._idle:
+                self._stats['connections_reused'] += 1
+                return self._idle.pop(), True
+            self._stats['connections_opened'] += 1
+        return self._connect(), False
+
+    def request(self, method, path, body=None, headers=None):
+        """
+        Send a request on a pooled connection.
+
+        Returns:
+            tuple: (connection, response); pass both to ``release`` once
+                the response has been read
+        """
+        while True:
+            connection, reused = self._acquire()
+            try:
+                connection.request(method, self.prefix + path, body=body, headers=headers or {})
+                return connection, connection.getresponse()
+            except ConnectionError:
+                # Covers RemoteDisconnected: the server closed an idle connection
+                connection.close()
+                if not reused:
+                    raise
+                with self._lock:
+                    self._stats['retries'] += 1
+            except Exception:
+                connection.close()
+                raise
+
+    def release(self, connection, response, reusable=True):
+        """Return a connection to the pool, or close it if it cannot carry another request"""
+        if reusable and not response.will_close and response.isclosed():
+            with self._lock:
+                if len(self._idle) < self.size:
+                    self._idle.append(connection)
+                    return
+        connection.close()
+
+    def close(self):
+        """Close the idle connections"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, 'idle_connections': len(self._idle)}
+
+
+def _response_text(data, required=True):
+    """
+    Answer text of a GenerateContentResponse (REST JSON), skipping thought parts.
+
+    Args:
+        required (bool): Raise if there is no candidate; stream chunks may
+            carry only usage metadata, so a blocked prompt is the only error
+    """
+    candidates = data.get('candidates') or []
+    if not candidates:
+        reason = (data.get('promptFeedback') or {}).get('blockReason')
+        if reason:
+            raise GeminiError(f"Prompt blocked: {reason}")
+        if required:
+            raise GeminiError('No answer candidates')
+        return ''
+    parts = (candidates[0].get('content') or {}).get('parts') or []
+    return ''.join(part.get('text', '') for part in parts if not part.get('thought'))
+
+
+class GeminiClient:
+    """
+    Long-lived Gemini client, created once and shared by every request.
+
+    Args:
+        api_key (str): Gemini API key
+        model (str): Model name, e.g. 'gemini-2.5-flash'
+        transport (str): 'sdk' (google-generativeai) or 'rest' (pooled HTTP)
+        api_base (str): REST endpoint including the API version (rest only)
+        max_output_tokens (int): Cap on answer tokens; 0 keeps the model default
+        temperature (float): Sampling temperature; None keeps the model default
+        pool_size (int): Keep-alive connections kept for reuse (rest only)
+        timeout (float): Request timeout in seconds (rest only)
+    """
+
+    name = 'gemini'
+
+    def __init__(self, api_key, model, transport='sdk', api_base='https://generativelanguage.googleapis.com/v1beta',
+                 max_output_tokens=0, temperature=None, pool_size=8, timeout=60.0):
+        if transport not in GEMINI_TRANSPORTS:
+            raise ValueError(f"Unknown Gemini transport {transport!r}; expected one of {GEMINI_TRANSPORTS}")
+        self.model_name = model
+        self.transport = transport
+        self.generation_config = {}
+        if max_output_tokens:
+            self.generation_config['max_output_tokens'] = max_output_tokens
+        if temperature is not None:
+            self.generation_config['temperature'] = temperature
+        self.model = None
+        self.pool = None
+        if transport == 'sdk':
+            import google.generativeai as genai
+
+            genai.configure(api_key=api_key)
+            self.model = genai.GenerativeModel(model, generation_config=self.generation_config or None)
+        else:
+            self.pool = ConnectionPool(api_base, size=pool_size, timeout=timeout)
+            self._path = f"/models/{quote(model, safe='')}"
+            self._headers = {'Content-Type': 'application/json', 'x-goog-api-key': api_key}
+
+    def _body(self, prompt):
+        body = {'contents': [{'role': 'user', 'parts': [{'text': prompt}]}]}
+        if self.generation_config:
+            body['generationConfig'] = {
+                'maxOutputTokens' if key == 'max_output_tokens' else key: value
+                for key, value in self.generation_config.items()
+            }
+        return json.dumps(body).encode('utf-8')
+
+    def _post(self, method, prompt):
+        """(connection, response) of a REST call, after checking its status"""
+        connection, response = self.pool.request(
+            'POST', f"{self._path}:{method}", body=self._body(prompt), headers=self._headers
+        )
+        if response.status >= 400:
+            payload = response.read()
+            self.pool.release(connection, response)
+            try:
+                message = json.loads(payload)['error']['message']
+            except (ValueError, KeyError, TypeError):
+                message = payload[:200].decode('utf-8', 'replace')
+            raise GeminiError(f"HTTP {response.status}: {message}")
+        return connection, response
+
+    def generate(self, prompt):
+        """Complete answer text"""
+        if self.model is not None:
+            return self.model.generate_content(prompt).text
+        connection, response = self._post('generateContent', prompt)
+        payload = response.read()
+        self.pool.release(connection, response)
+        return _response_text(json.loads(payload))
+
+    def stream(self, prompt):
+        """Yield the answer as the model produces it"""
+        if self.model is not None:
+            for chunk in self.model.generate_content(prompt, stream=True):
+                if chunk.text:
+                    yield chunk.text
+            return
+
+        connection, response = self._post('streamGenerateContent?alt=sse', prompt)
+        completed = False
+        try:
+            for line in response:
+                if line.startswith(b'data:'):
+                    text = _response_text(json.loads(line[5:]), required=False)
+                    if text:
+                        yield text
+            # Lets http.client mark a Content-Length response finished
+            response.read()
+            completed = True
+        finally:
+            # A stream abandoned part-way leaves unread data on the connection
+            self.pool.release(connection, response, reusable=completed)
+
+    async def agenerate(self, prompt):
+        """
+        Complete answer text from a coroutine.
+
+        The SDK awaits the network on the event loop; the REST transport
+        waits on a thread of the loop's default executor.
+        """
+        if self.model is not None:
+            response = await self.model.generate_content_async(prompt)
+            return response.text
+        return await asyncio.to_thread(self.generate, prompt)
+
+    def stats(self):
+        stats = {'model': self.model_name, 'transport': self.transport, 'generation_config': self.generation_config}
+        if self.pool is not None:
+            stats['connections'] = self.pool.stats()
+        return stats
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
@@ -0,0 +1,125 @@
+"""
+Django management command to benchmark the vector index types.
+Usage: python manage.py benchmark_ann [--sizes 10000 100000 1000000] [--types flat ivf_flat ivf_pq hnsw]
+
+For every synthetic corpus size and index type it reports build time,
+index memory, recall@k against the exact flat scan, and p50/p99 latency
+of single-query searches. Search-time tunables can be swept with
+--nprobe and --ef-search to trace the speed/recall curve.
+"""
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from chat import vector_index
+
+
+def synthetic_corpus(num_vectors, dim, num_queries, seed=0):
+    """Clustered, L2-normalised vectors resembling sentence embeddings"""
+    rng = np.random.default_rng(seed)
+    num_centers = max(10, num_vectors // 1000)
+    centers = rng.standard_normal((num_centers, dim)).astype('float32')
+
+    def sample(count):
+        points = centers[rng.integers(0, num_centers, size=count)]
+        points = points + 0.35 * rng.standard_normal((count, dim)).astype('float32')
+        return points / np.linalg.norm(points, axis=1, keepdims=True)
+
+    return sample(num_vectors).astype('float32'), sample(num_queries).astype('float32')
+
+
+class Command(BaseCommand):
+    help = 'Benchmark recall@k, latency and memory of flat, IVF-Flat, IVF-PQ and HNSW indexes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000],
+                            help='Corpus sizes to test (default: 10000 100000; try 1000000)')
+        parser.add_argument('--types', nargs='+', default=list(vector_index.INDEX_TYPES),
+                            choices=vector_index.INDEX_TYPES, help='Index types to test')
+        parser.add_argument('--dim', type=int, default=384, help='Vector dimension (default: 384)')
+        parser.add_argument('--queries', type=int, default=200, help='Number of queries (default: 200)')
+        parser.add_argument('--k', type=int, default=10, help='Neighbours per query for recall@k (default: 10)')
+        parser.add_argument('--nprobe', type=int, nargs='+',
+                            help='IVF nprobe values to sweep (default: RAG_IVF_NPROBE)')
+        parser.add_argument('--ef-search', type=int, nargs='+',
+                            help='HNSW efSearch values to sweep (default: RAG_HNSW_EF_SEARCH)')
+
+    def handle(self, *args, **options):
+        try:
+            import faiss  # noqa: F401
+        except ImportError:
+            raise CommandError('faiss is required for the approximate index types')
+
+        params = vector_index.resolve_params(settings.RAG_INDEX_PARAMS)
+        k = options['k']
+
+        self.stdout.write(self.style.SUCCESS('=' * 96))
+        self.stdout.write(self.style.SUCCESS('Vector Index Benchmark'))
+        self.stdout.write(self.style.SUCCESS('=' * 96))
+
+        for size in options['sizes']:
+            self.stdout.write(f"\nGenerating {size} x {options['dim']} vectors...")
+            corpus, queries = synthetic_corpus(size, options['dim'], options['queries'])
+
+            exact = vector_index.MemmapFlatIndex(corpus)
+            _, truth = exact.search(queries, k)
+
+            self.stdout.write(
+                f"{'Type':<10}{'Tunable':<16}{'Build':>10}{'Memory':>12}"
+                f"{'Recall@' + str(k):>12}{'p50':>12}{'p99':>12}{'QPS':>10}"
+            )
+            self.stdout.write('-' * 96)
+
+            for index_type in options['types']:
+                effective = vector_index.effective_index_type(index_type, size, params)
+                start = time.perf_counter()
+                if index_type == 'flat':
+                    index = exact
+                else:
+                    index = vector_index.build_ann_index(corpus, index_type, params)
+                build_s = time.perf_counter() - start
+                memory_mb = vector_index.index_memory_bytes(index) / (1024 * 1024)
+
+                for label, tuned in self._tunables(effective, params, options):
+                    vector_index.configure_search(index, effective, tuned)
+                    recall, p50, p99, qps = self._measure(index, queries, truth, k)
+                    name = index_type if effective == index_type else f"{index_type}*"
+                    self.stdout.write(
+                        f"{name:<10}{label:<16}{build_s:>9.2f}s{memory_mb:>9.1f} MB"
+                        f"{recall:>12.4f}{p50:>10.3f}ms{p99:>10.3f}ms{qps:>10.0f}"
+                    )
+
+        self.stdout.write('')
+        self.stdout.write('* corpus too small to train this type; fell back to flat')
+        self.stdout.write(self.style.SUCCESS('=' * 96))
+
+    def _tunables(self, index_type, params, options):
+        if index_type in ('ivf_flat', 'ivf_pq'):
+            for nprobe in options['nprobe'] or [params['nprobe']]:
+                yield f"nprobe={nprobe}", dict(params, nprobe=nprobe)
+        elif index_type == 'hnsw':
+            for ef_search in options['ef_search'] or [params['ef_search']]:
+                yield f"efSearch={ef_search}", dict(params, ef_search=ef_search)
+        else:
+            yield '-', params
+
+    def _measure(self, index, queries, truth, k):
+        latencies = []
+        found = 0
+        for q in range(len(queries)):
+            start = time.perf_counter()
+            _, rows = index.search(queries[q:q + 1], k)
+            latencies.append((time.perf_counter() - start) * 1000)
+            found += len(set(rows[0].tolist()) & set(truth[q].tolist()))
+
+        latencies = np.array(latencies)
+        recall = found / (len(queries) * k)
+        total_s = latencies.sum() / 1000
+        return (
+            recall,
+            float(np.percentile(latencies, 50)),
+            float(np.percentile(latencies, 99)),
+            len(queries) / total_s if total_s else 0.0,
+        )
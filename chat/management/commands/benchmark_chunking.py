@@ -0,0 +1,142 @@
+"""
+Django management command to report chunk sizes and chunking throughput.
+Usage: python manage.py benchmark_chunking [--file PATH] [--synthetic-mb 500] [--target 180] [--compare]
+
+Streams the knowledge base (or any text file) through the token-aware
+chunker and prints the chunk-size distribution in estimated tokens and
+the throughput in MB/s and chunks/s. --synthetic-mb repeats the input
+into a scratch file of that size first, to measure throughput and memory
+on a large file. --compare also shows the old one-chunk-per-paragraph
+split of the same file.
+"""
+import os
+import resource
+import statistics
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from chat.chunking import Chunker, count_tokens, split_paragraphs
+
+
+class Command(BaseCommand):
+    help = 'Report chunk-size distribution and throughput of the knowledge base chunker'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', type=str, default=settings.RAG_KNOWLEDGE_BASE_PATH,
+                            help='Text file to chunk (default: RAG_KNOWLEDGE_BASE_PATH)')
+        parser.add_argument('--synthetic-mb', type=int, default=0,
+                            help='Repeat the file into a scratch file of this many MB first')
+        parser.add_argument('--target', type=int, default=settings.RAG_CHUNK_TOKENS,
+                            help='Token budget per chunk (default: RAG_CHUNK_TOKENS)')
+        parser.add_argument('--overlap', type=int, default=settings.RAG_CHUNK_OVERLAP_TOKENS,
+                            help='Overlap tokens (default: RAG_CHUNK_OVERLAP_TOKENS)')
+        parser.add_argument('--min', type=int, default=settings.RAG_CHUNK_MIN_TOKENS,
+                            help='Minimum chunk tokens (default: RAG_CHUNK_MIN_TOKENS)')
+        parser.add_argument('--compare', action='store_true',
+                            help='Also report paragraph chunking (reads the whole file into memory)')
+
+    def handle(self, *args, **options):
+        path = options['file']
+        if not os.path.exists(path):
+            raise CommandError(f"File not found: {path}")
+
+        scratch = None
+        if options['synthetic_mb']:
+            scratch = self._make_synthetic(path, options['synthetic_mb'])
+            path = scratch
+
+        try:
+            size_mb = os.path.getsize(path) / (1024 * 1024)
+            chunker = Chunker(options['target'], options['overlap'], options['min'])
+
+            self.stdout.write(self.style.SUCCESS('=' * 70))
+            self.stdout.write(self.style.SUCCESS('Chunking Benchmark'))
+            self.stdout.write(self.style.SUCCESS('=' * 70))
+            self.stdout.write(f"File: {path} ({size_mb:.1f} MB)")
+            self.stdout.write(
+                f"Chunker: target {chunker.target_tokens}, overlap {chunker.overlap_tokens}, "
+                f"min {chunker.min_tokens} tokens"
+            )
+
+            rss_before = self._max_rss_mb()
+            start = time.perf_counter()
+            sizes = [chunk['tokens'] for chunk in chunker.chunk_file(path)]
+            elapsed = time.perf_counter() - start
+            self._report('token windows', sizes, chunker.target_tokens, chunker.min_tokens)
+            self.stdout.write(
+                f"  Throughput:   {size_mb / elapsed:.1f} MB/s, {len(sizes) / elapsed:,.0f} chunks/s "
+                f"({elapsed:.2f}s)"
+            )
+            self.stdout.write(f"  Peak RSS growth: {self._max_rss_mb() - rss_before:.0f} MB")
+
+            if options['compare']:
+                start = time.perf_counter()
+                with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                    paragraphs = split_paragraphs(f.read())
+                sizes = [count_tokens(paragraph) for paragraph in paragraphs]
+                elapsed = time.perf_counter() - start
+                self._report('paragraphs', sizes, chunker.target_tokens, chunker.min_tokens)
+                self.stdout.write(
+                    f"  Throughput:   {size_mb / elapsed:.1f} MB/s, {len(sizes) / elapsed:,.0f} chunks/s "
+                    f"({elapsed:.2f}s)"
+                )
+            self.stdout.write(self.style.SUCCESS('=' * 70))
+        finally:
+            if scratch:
+                os.remove(scratch)
+
+    def _make_synthetic(self, path, size_mb):
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            sample = f.read().rstrip('\n') + '\n\n'
+        if not sample.strip():
+            raise CommandError(f"{path} is empty")
+        fd, scratch = tempfile.mkstemp(suffix='.txt', prefix='chunking-')
+        target = size_mb * 1024 * 1024
+        written = 0
+        self.stdout.write(f"Writing {size_mb} MB synthetic file...")
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            while written < target:
+                f.write(sample)
+                written += len(sample.encode('utf-8'))
+        return scratch
+
+    @staticmethod
+    def _max_rss_mb():
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    def _report(self, label, sizes, target, min_tokens):
+        self.stdout.write('')
+        self.stdout.write(self.style.SUCCESS(f"{label.capitalize()}: {len(sizes):,} chunks, {sum(sizes):,} tokens"))
+        if not sizes:
+            return
+        ordered = sorted(sizes)
+
+        def percentile(p):
+            return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+        self.stdout.write(
+            f"  Tokens:       min {ordered[0]}, p10 {percentile(0.10)}, p50 {percentile(0.50)}, "
+            f"p90 {percentile(0.90)}, max {ordered[-1]}"
+        )
+        self.stdout.write(
+            f"  Mean:         {statistics.fmean(sizes):.1f} (stdev {statistics.pstdev(sizes):.1f})"
+        )
+        self.stdout.write(
+            f"  Under min:    {sum(size < min_tokens for size in sizes) / len(sizes):.1%}   "
+            f"Over target: {sum(size > target for size in sizes) / len(sizes):.1%}"
+        )
+
+        # Histogram in eighths of the target, with one overflow bucket
+        width = max(1, target // 8)
+        buckets = [0] * 9
+        for size in sizes:
+            buckets[min(8, size // width)] += 1
+        peak = max(buckets)
+        for number, count in enumerate(buckets):
+            low = number * width
+            label = f"{low}-{low + width - 1}" if number < 8 else f">={low}"
+            bar = '#' * (round(40 * count / peak) if peak else 0)
+            self.stdout.write(f"  {label:>10} {count:>9,} {bar}")
@@ -0,0 +1,146 @@
+"""
+Django management command to measure prompt size and latency against conversation length.
+Usage: python manage.py benchmark_conversation_memory [--turns 1 5 10 25 50 100] [--strategies none full memory] [--prompt-ms 100]
+
+Plays one conversation per strategy, a new question every turn, and
+reports at each --turns checkpoint the history, context and prompt
+tokens of that turn's prompt and the time spent loading the history,
+answering and updating the memory:
+
+- none: no history, every question stands alone
+- full: every earlier turn replayed verbatim
+- memory: the rolling summary plus the last RAG_MEMORY_RECENT_TURNS
+  turns (chat/memory.py), updated after every turn
+
+Answers come from a fake LLM that waits --prompt-ms per 1000 prompt
+tokens before answering, so generation time follows prompt size as it
+does with a real model. A throwaway user is created for the run and
+deleted afterwards, together with its conversations. Answer caches are
+bypassed.
+"""
+import time
+import uuid
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from chat.llm import FakeLLM
+from chat.management.commands.benchmark_encoder import make_queries
+from chat.memory import conversation_history, remember_turn
+from chat.models import ChatMessage, Conversation
+from chat.rag_service import get_rag_service
+
+STRATEGIES = ('none', 'full', 'memory')
+
+
+class Command(BaseCommand):
+    help = 'Compare prompt tokens and latency of conversation history strategies as conversations grow'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--turns', type=int, nargs='+', default=[1, 5, 10, 25, 50, 100],
+                            help='Conversation lengths to report (default: 1 5 10 25 50 100)')
+        parser.add_argument('--strategies', nargs='+', choices=STRATEGIES, default=list(STRATEGIES),
+                            help='History strategies to compare (default: all)')
+        parser.add_argument('--prompt-ms', type=float, default=100,
+                            help='Fake LLM time per 1000 prompt tokens (default: 100)')
+        parser.add_argument('--collection', type=str, default=None,
+                            help='Collection to retrieve from (default: RAG_DEFAULT_COLLECTION)')
+
+    def handle(self, *args, **options):
+        service = get_rag_service(options['collection'])
+        service.initialize()
+        checkpoints = sorted(set(options['turns']))
+
+        User = get_user_model()
+        username = f"memorybench-{uuid.uuid4().hex[:8]}"
+        user = User.objects.create_user(username=username, email=f"{username}@example.com",
+                                        password=uuid.uuid4().hex)
+
+        saved = (service.llm, service.semantic_cache)
+        service.llm = FakeLLM(token_delay_ms=0, prompt_delay_ms=options['prompt_ms'])
+        service.semantic_cache = None
+
+        self.stdout.write(self.style.SUCCESS('=' * 100))
+        self.stdout.write(self.style.SUCCESS('Conversation Memory Benchmark'))
+        self.stdout.write(self.style.SUCCESS('=' * 100))
+        self.stdout.write(
+            f"Memory: summary <= {settings.RAG_MEMORY_SUMMARY_TOKENS} tokens ({settings.RAG_MEMORY_SUMMARIZER}) "
+            f"+ last {settings.RAG_MEMORY_RECENT_TURNS} turns <= {settings.RAG_MEMORY_TURN_TOKENS} tokens each; "
+            f"prompt budget {settings.RAG_PROMPT_TOKEN_BUDGET or 'unlimited'}; "
+            f"fake LLM {options['prompt_ms']:.0f}ms per 1000 prompt tokens"
+        )
+        self.stdout.write('')
+        self.stdout.write(
+            f"{'Strategy':<10}{'Turn':>6}{'History':>10}{'Context':>10}{'Prompt':>9}"
+            f"{'Load':>11}{'Answer':>12}{'Update':>11}{'Total':>12}"
+        )
+        self.stdout.write('-' * 100)
+
+        try:
+            with override_settings(RAG_RESPONSE_CACHE_ENABLED=False, RAG_MEMORY_ENABLED=True):
+                for strategy in options['strategies']:
+                    for row in self._play(service, user, strategy, checkpoints):
+                        self.stdout.write(
+                            f"{strategy:<10}{row['turn']:>6}{row['history']:>10,}{row['context']:>10,}"
+                            f"{row['prompt']:>9,}{row['load_ms']:>8.1f} ms{row['answer_ms']:>9.1f} ms"
+                            f"{row['update_ms']:>8.1f} ms{row['total_ms']:>9.1f} ms"
+                        )
+                    self.stdout.write('')
+        finally:
+            service.llm, service.semantic_cache = saved
+            user.delete()
+
+        self.stdout.write('Tokens are count_tokens estimates; Load reads the history from the database')
+        self.stdout.write(self.style.SUCCESS('=' * 100))
+
+    def _play(self, service, user, strategy, checkpoints):
+        """Answer one question per turn up to the last checkpoint; yield the checkpoint turns"""
+        conversation = Conversation.objects.create(user=user, title=f"Memory benchmark ({strategy})")
+        run = uuid.uuid4().hex[:6]
+        for turn, question in enumerate(make_queries(0, checkpoints[-1]), start=1):
+            question = f"{question} [{run}]"
+
+            start = time.perf_counter()
+            history = self._history(strategy, conversation)
+            load_ms = (time.perf_counter() - start) * 1000
+
+            timings = {}
+            begin = time.perf_counter()
+            answer = service.get_response(question, timings=timings, history=history)
+            answer_ms = (time.perf_counter() - begin) * 1000
+
+            ChatMessage.objects.create(
+                conversation=conversation, user=user, user_message=question, ai_response=answer
+            )
+            begin = time.perf_counter()
+            if strategy == 'memory':
+                remember_turn(conversation, service)
+            update_ms = (time.perf_counter() - begin) * 1000
+
+            if turn in checkpoints:
+                tokens = timings['tokens']
+                yield {
+                    'turn': turn,
+                    'history': tokens['history'],
+                    'context': tokens['context'],
+                    'prompt': tokens['prompt'],
+                    'load_ms': load_ms,
+                    'answer_ms': answer_ms,
+                    'update_ms': update_ms,
+                    'total_ms': (time.perf_counter() - start) * 1000,
+                }
+
+    @staticmethod
+    def _history(strategy, conversation):
+        if strategy == 'memory':
+            return conversation_history(conversation)
+        if strategy == 'full':
+            turns = conversation.messages.values_list('user_message', 'ai_response')
+            if not turns:
+                return ''
+            return "Conversation so far:\n" + "\n\n".join(
+                f"User: {question}\nAssistant: {answer}" for question, answer in turns
+            )
+        return ''
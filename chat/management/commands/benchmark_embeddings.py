@@ -0,0 +1,174 @@
+"""
+Django management command to compare embedding backends.
+Usage: python manage.py benchmark_embeddings [--backends sentence-transformers onnx onnx-int8 hashing] [--threads 1 4] [--texts 512]
+
+Every backend and thread count runs in a fresh Python process, so the
+startup time includes importing its libraries and loading the model,
+as a new server worker would. Reports startup, first-encode latency,
+batch throughput (texts/s) over knowledge base paragraphs, p50
+single-query latency, peak RSS and the mean cosine similarity of each
+backend's vectors to the --reference backend's on the same texts.
+'onnx-int8' is the onnx backend with RAG_ONNX_QUANTIZED=True; export
+the model with ``manage.py export_onnx_model --quantize`` first.
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from chat.chunking import split_paragraphs
+from chat.embeddings import EMBEDDING_BACKENDS, backend_available, backend_config, onnx_model_file
+from chat.management.commands.benchmark_encoder import make_queries
+
+VARIANTS = {
+    'sentence-transformers': {'backend': 'sentence-transformers'},
+    'onnx': {'backend': 'onnx', 'onnx_quantized': False},
+    'onnx-int8': {'backend': 'onnx', 'onnx_quantized': True},
+    'hashing': {'backend': 'hashing'},
+}
+
+# Run in a fresh interpreter: stdin is the JSON job (too large for argv), the result is the
+# last stdout line and the vectors of the sample texts go to job['output']
+WORKER = """
+import json, resource, sys, time
+start = time.perf_counter()
+job = json.load(sys.stdin)
+import numpy as np
+from chat.embeddings import create_backend
+backend = create_backend(job['config'])
+startup_ms = (time.perf_counter() - start) * 1000
+
+begin = time.perf_counter()
+backend.encode(job['texts'][:1])
+first_ms = (time.perf_counter() - begin) * 1000
+
+begin = time.perf_counter()
+vectors = backend.encode(job['texts'])
+throughput = len(job['texts']) / (time.perf_counter() - begin)
+
+latencies = []
+for query in job['queries']:
+    begin = time.perf_counter()
+    backend.encode([query])
+    latencies.append((time.perf_counter() - begin) * 1000)
+
+np.save(job['output'], np.asarray(vectors, dtype='float32'))
+print(json.dumps({
+    'name': backend.name,
+    'startup_ms': startup_ms,
+    'first_ms': first_ms,
+    'throughput': throughput,
+    'p50_ms': float(np.percentile(latencies, 50)),
+    'rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+}))
+"""
+
+
+class Command(BaseCommand):
+    help = 'Compare startup, throughput, latency and agreement of the embedding backends'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backends', nargs='+', choices=list(VARIANTS), default=None,
+                            help='Backends to compare (default: every installed one)')
+        parser.add_argument('--threads', type=int, nargs='+', default=[settings.RAG_EMBEDDING_THREADS],
+                            help='Thread counts to run each backend with, 0 = library default '
+                                 '(default: RAG_EMBEDDING_THREADS)')
+        parser.add_argument('--texts', type=int, default=512,
+                            help='Knowledge base paragraphs encoded for throughput (default: 512)')
+        parser.add_argument('--queries', type=int, default=100,
+                            help='Single-query encodes for latency (default: 100)')
+        parser.add_argument('--batch-size', type=int, default=settings.RAG_EMBEDDING_BATCH_SIZE,
+                            help='Encode batch size (default: RAG_EMBEDDING_BATCH_SIZE)')
+        parser.add_argument('--reference', choices=list(VARIANTS), default='sentence-transformers',
+                            help='Backend the others are compared with (default: sentence-transformers)')
+
+    def handle(self, *args, **options):
+        backends = options['backends'] or [
+            variant for variant in VARIANTS if self._installed(variant)
+        ]
+        if not backends:
+            raise CommandError(f"No embedding backend is installed ({', '.join(EMBEDDING_BACKENDS)})")
+
+        texts = self._sample_texts(options['texts'])
+        queries = make_queries(0, options['queries'])
+
+        self.stdout.write(self.style.SUCCESS('=' * 100))
+        self.stdout.write(self.style.SUCCESS('Embedding Backend Benchmark'))
+        self.stdout.write(self.style.SUCCESS('=' * 100))
+        self.stdout.write(f"{len(texts)} texts, batch size {options['batch_size']}, {os.cpu_count()} cores")
+        self.stdout.write(
+            f"{'Backend':<24}{'Threads':>8}{'Startup':>12}{'First':>11}{'Texts/s':>10}"
+            f"{'p50 query':>12}{'Peak RSS':>11}{'Cosine':>9}"
+        )
+        self.stdout.write('-' * 100)
+
+        with tempfile.TemporaryDirectory(prefix='embeddings-') as scratch:
+            reference = None
+            if options['reference'] not in backends and self._installed(options['reference']):
+                reference, _ = self._run(options['reference'], 0, texts, queries, options['batch_size'], scratch)
+
+            for variant in backends:
+                for threads in options['threads']:
+                    vectors, result = self._run(variant, threads, texts, queries, options['batch_size'], scratch)
+                    if result is None:
+                        continue
+                    if variant == options['reference'] and reference is None:
+                        reference = vectors
+                    self.stdout.write(
+                        f"{variant:<24}{threads or 'default':>8}{result['startup_ms']:>9.0f} ms"
+                        f"{result['first_ms']:>8.1f} ms{result['throughput']:>10.0f}"
+                        f"{result['p50_ms']:>9.2f} ms{result['rss_mb']:>8.0f} MB"
+                        f"{self._agreement(vectors, reference):>9}"
+                    )
+
+        self.stdout.write('')
+        self.stdout.write(f"Cosine: mean similarity to {options['reference']} vectors of the same texts")
+        self.stdout.write(self.style.SUCCESS('=' * 100))
+
+    def _installed(self, variant):
+        config = VARIANTS[variant]
+        if not backend_available(config['backend']):
+            return False
+        if config['backend'] == 'onnx':
+            return os.path.exists(os.path.join(settings.RAG_ONNX_MODEL_DIR, onnx_model_file(config['onnx_quantized'])))
+        return True
+
+    def _sample_texts(self, count):
+        try:
+            with open(settings.RAG_KNOWLEDGE_BASE_PATH, 'r', encoding='utf-8') as f:
+                paragraphs = split_paragraphs(f.read())
+        except OSError:
+            paragraphs = []
+        paragraphs = paragraphs or make_queries(1, count)
+        return [paragraphs[i % len(paragraphs)] + ('' if i < len(paragraphs) else f" ({i})") for i in range(count)]
+
+    def _run(self, variant, threads, texts, queries, batch_size, scratch):
+        output = os.path.join(scratch, f"{variant}-{threads}.npy")
+        job = {
+            'config': backend_config(**VARIANTS[variant], threads=threads, batch_size=batch_size),
+            'texts': texts,
+            'queries': queries,
+            'output': output,
+        }
+        process = subprocess.run(
+            [sys.executable, '-c', WORKER], input=json.dumps(job),
+            cwd=settings.BASE_DIR, capture_output=True, text=True
+        )
+        if process.returncode != 0:
+            error = (process.stderr.strip().splitlines() or ['failed'])[-1]
+            self.stderr.write(f"{variant:<24}{threads or 'default':>8}  {error}")
+            return None, None
+        return np.load(output), json.loads(process.stdout.strip().splitlines()[-1])
+
+    @staticmethod
+    def _agreement(vectors, reference):
+        if reference is None or vectors.shape != reference.shape:
+            return '-'
+        a = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        b = reference / np.maximum(np.linalg.norm(reference, axis=1, keepdims=True), 1e-12)
+        return f"{(a * b).sum(axis=1).mean():.4f}"
@@ -0,0 +1,115 @@
+"""
+Django management command to benchmark query encoding under concurrency.
+Usage: python manage.py benchmark_encoder [--clients 1 8 32 64] [--requests 40]
+
+Every client thread encodes its own stream of distinct queries, either
+calling the model directly (one sentence per call) or through the
+micro-batcher. Reports throughput, p50/p99 latency and the mean batch
+size actually achieved.
+"""
+import statistics
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from chat.batching import MicroBatcher
+from chat.embeddings import backend_available, load_embedding_backend
+
+TEMPLATES = [
+    'How do I {} my {} in Django?',
+    'What is the best way to {} a {} with Python?',
+    'Can you explain how to {} the {} endpoint?',
+    'Why does my {} fail when I {} it?',
+]
+WORDS = ['reset', 'configure', 'deploy', 'cache', 'password', 'database', 'token', 'model', 'view', 'index']
+
+
+def make_queries(client, count):
+    return [
+        TEMPLATES[i % len(TEMPLATES)].format(WORDS[(client + i) % len(WORDS)], WORDS[(i * 7) % len(WORDS)])
+        + f" (#{client}-{i})"
+        for i in range(count)
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark per-query vs micro-batched query encoding at several concurrency levels'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, nargs='+', default=[1, 8, 32, 64],
+                            help='Concurrent client counts (default: 1 8 32 64)')
+        parser.add_argument('--requests', type=int, default=40,
+                            help='Queries per client (default: 40)')
+        parser.add_argument('--max-batch', type=int, default=settings.RAG_ENCODER_MAX_BATCH,
+                            help='Batcher max batch size (default: RAG_ENCODER_MAX_BATCH)')
+        parser.add_argument('--max-wait-ms', type=float, default=settings.RAG_ENCODER_MAX_WAIT_MS,
+                            help='Batcher max wait (default: RAG_ENCODER_MAX_WAIT_MS)')
+
+    def handle(self, *args, **options):
+        if not backend_available(settings.RAG_EMBEDDING_BACKEND):
+            raise CommandError(f"The {settings.RAG_EMBEDDING_BACKEND} embedding backend is not installed")
+
+        self.stdout.write(f"Loading the {settings.RAG_EMBEDDING_BACKEND} embedding backend...")
+        try:
+            model = load_embedding_backend()
+        except OSError as e:
+            raise CommandError(str(e))
+        model.encode(['warm up'])
+        self.stdout.write(f"Model: {model.name}")
+
+        self.stdout.write(self.style.SUCCESS('=' * 80))
+        self.stdout.write(self.style.SUCCESS('Query Encoder Benchmark'))
+        self.stdout.write(self.style.SUCCESS('=' * 80))
+        self.stdout.write(
+            f"{'Mode':<10}{'Clients':>8}{'Queries/s':>12}{'p50':>12}{'p99':>12}{'Mean batch':>12}"
+        )
+        self.stdout.write('-' * 80)
+
+        for clients in options['clients']:
+            direct = self._run(lambda text: model.encode([text]), clients, options['requests'])
+            self._report('direct', clients, direct, 1.0)
+
+            batcher = MicroBatcher(model.encode, options['max_batch'], options['max_wait_ms'])
+            batched = self._run(batcher.encode, clients, options['requests'])
+            self._report('batched', clients, batched, batcher.stats()['mean_batch_size'])
+
+        self.stdout.write(self.style.SUCCESS('=' * 80))
+
+    def _run(self, encode, clients, requests):
+        latencies = []
+        lock = threading.Lock()
+        barrier = threading.Barrier(clients)
+
+        def client(number):
+            queries = make_queries(number, requests)
+            own = []
+            barrier.wait()
+            for query in queries:
+                start = time.perf_counter()
+                encode(query)
+                own.append((time.perf_counter() - start) * 1000)
+            with lock:
+                latencies.extend(own)
+
+        threads = [threading.Thread(target=client, args=(n,)) for n in range(clients)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        latencies.sort()
+        return {
+            'qps': len(latencies) / elapsed,
+            'p50': statistics.median(latencies),
+            'p99': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+        }
+
+    def _report(self, mode, clients, result, mean_batch):
+        self.stdout.write(
+            f"{mode:<10}{clients:>8}{result['qps']:>12.1f}{result['p50']:>9.2f} ms"
+            f"{result['p99']:>9.2f} ms{mean_batch:>12.1f}"
+        )
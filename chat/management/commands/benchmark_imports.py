@@ -0,0 +1,138 @@
+"""
+Django management command to measure import time and memory of management commands.
+Usage: python manage.py benchmark_imports [--commands "check" "scheduler_info"] [--repeat 3]
+
+Each command runs in a fresh interpreter under ``python -X importtime``,
+twice:
+
+- lazy: as the code is now; the RAG stack is imported only when used
+- eager: numpy, faiss, sentence-transformers and google-generativeai are
+  imported first, which is what every command paid when chat.rag_service
+  imported them at module load
+
+Reports wall time, total import time (sum of -X importtime self times),
+peak RSS and which heavy modules were loaded; the best of --repeat runs
+is kept.
+"""
+import os
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+HEAVY_MODULES = ['numpy', 'faiss', 'sentence_transformers', 'onnxruntime', 'google.generativeai']
+
+DEFAULT_COMMANDS = ['check', 'migrate --plan', 'scheduler_info', 'showmigrations chat']
+
+# Runs manage.py in-process after optionally importing modules; on exit reports
+# peak RSS and which heavy modules ended up imported
+WRAPPER = """
+import atexit, resource, runpy, sys
+atexit.register(lambda: sys.stderr.write(
+    'maxrss_kb=%d\\n' % resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    + 'loaded=%s\\n' % ','.join(name for name in HEAVY_MODULES if name in sys.modules)))
+for name in filter(None, sys.argv[1].split(',')):
+    try:
+        __import__(name)
+    except ImportError:
+        pass
+sys.argv = ['manage.py'] + sys.argv[2:]
+runpy.run_path('manage.py', run_name='__main__')
+""".replace('HEAVY_MODULES', repr(HEAVY_MODULES))
+
+
+class Command(BaseCommand):
+    help = 'Compare startup import time and RSS of management commands with lazy and eager RAG imports'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--commands', nargs='+', default=DEFAULT_COMMANDS,
+                            help='Commands to measure, each quoted with its arguments '
+                                 f'(default: {" / ".join(DEFAULT_COMMANDS)})')
+        parser.add_argument('--repeat', type=int, default=3,
+                            help='Runs per command and mode; the fastest is reported (default: 3)')
+        parser.add_argument('--top', type=int, default=0,
+                            help='Also list the N slowest top-level imports of each lazy run')
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('=' * 90))
+        self.stdout.write(self.style.SUCCESS('Management Command Import Benchmark'))
+        self.stdout.write(self.style.SUCCESS('=' * 90))
+        self.stdout.write(
+            f"{'Command':<24}{'Mode':<7}{'Wall':>10}{'Imports':>11}{'Max RSS':>11}  Heavy modules loaded"
+        )
+        self.stdout.write('-' * 90)
+
+        savings = []
+        for command in options['commands']:
+            lazy = self._measure(command, '', options['repeat'])
+            eager = self._measure(command, ','.join(HEAVY_MODULES), options['repeat'])
+            for mode, result in (('lazy', lazy), ('eager', eager)):
+                self._report(command, mode, result)
+            savings.append((command, lazy, eager))
+            if options['top']:
+                for name, cumulative in lazy['top'][:options['top']]:
+                    self.stdout.write(f"{'':<31}{cumulative / 1000:>10.1f} ms  {name}")
+
+        self.stdout.write('')
+        self.stdout.write(self.style.SUCCESS('Savings from lazy imports:'))
+        for command, lazy, eager in savings:
+            self.stdout.write(
+                f"  {command:<24}{eager['wall_ms'] - lazy['wall_ms']:>9.0f} ms wall, "
+                f"{eager['import_ms'] - lazy['import_ms']:>7.0f} ms imports, "
+                f"{eager['rss_mb'] - lazy['rss_mb']:>6.0f} MB RSS"
+            )
+        self.stdout.write(self.style.SUCCESS('=' * 90))
+
+    def _measure(self, command, preload, repeat):
+        best = None
+        for _ in range(max(1, repeat)):
+            result = self._run_once(command, preload)
+            if best is None or result['wall_ms'] < best['wall_ms']:
+                best = result
+        return best
+
+    def _run_once(self, command, preload):
+        argv = [sys.executable, '-X', 'importtime', '-c', WRAPPER, preload] + command.split()
+        start = time.perf_counter()
+        completed = subprocess.run(
+            argv, cwd=settings.BASE_DIR, capture_output=True, text=True, env=os.environ.copy()
+        )
+        wall_ms = (time.perf_counter() - start) * 1000
+
+        import_us = 0
+        rss_kb = 0
+        top = []
+        loaded = []
+        for line in completed.stderr.splitlines():
+            if line.startswith('import time:'):
+                fields = line[len('import time:'):].split('|')
+                if len(fields) != 3 or not fields[0].strip().isdigit():
+                    continue  # header line
+                self_us, cumulative_us, name = int(fields[0]), int(fields[1]), fields[2]
+                import_us += self_us
+                if not name.startswith('  '):
+                    top.append((name.strip(), cumulative_us))
+            elif line.startswith('maxrss_kb='):
+                rss_kb = int(line.split('=', 1)[1])
+            elif line.startswith('loaded='):
+                loaded = [name for name in line.split('=', 1)[1].split(',') if name]
+
+        if completed.returncode != 0:
+            self.stderr.write(f"'{command}' exited with status {completed.returncode}")
+
+        top.sort(key=lambda item: item[1], reverse=True)
+        return {
+            'wall_ms': wall_ms,
+            'import_ms': import_us / 1000,
+            'rss_mb': rss_kb / 1024,
+            'heavy': loaded,
+            'top': top,
+        }
+
+    def _report(self, command, mode, result):
+        self.stdout.write(
+            f"{command:<24}{mode:<7}{result['wall_ms']:>7.0f} ms{result['import_ms']:>8.0f} ms"
+            f"{result['rss_mb']:>8.0f} MB  {', '.join(result['heavy']) or '-'}"
+        )
@@ -0,0 +1,120 @@
+"""
+Django management command to benchmark keyword search.
+Usage: python manage.py benchmark_lexical [--chunks 100000] [--queries 200]
+
+Compares the BM25 inverted index against the previous keyword fallback,
+which lowercased, split and substring-scanned every chunk per query.
+"""
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from chat.lexical_index import BM25Index, STOPWORDS
+
+
+def legacy_keyword_search(chunks, query, top_k=3):
+    """The original O(corpus) keyword-overlap search, kept as a baseline"""
+    query_lower = query.lower()
+    query_words = set(query_lower.split())
+
+    scored_chunks = []
+    for chunk in chunks:
+        chunk_lower = chunk.lower()
+        chunk_words = set(chunk_lower.split())
+
+        overlap = len(query_words & chunk_words)
+        if overlap > 0 or any(word in chunk_lower for word in query_words):
+            scored_chunks.append((chunk, overlap))
+
+    scored_chunks.sort(key=lambda x: x[1], reverse=True)
+    return [chunk for chunk, score in scored_chunks[:top_k]]
+
+
+def synthetic_chunks(num_chunks, vocabulary_size=20000, words_per_chunk=80, seed=0):
+    """Paragraph-like chunks with a Zipf-distributed vocabulary and some stopwords"""
+    rng = random.Random(seed)
+    vocabulary = [f"term{i}" for i in range(vocabulary_size)]
+    weights = [1.0 / (rank + 1) for rank in range(vocabulary_size)]
+    stopwords = sorted(STOPWORDS)
+    chunks = []
+    for _ in range(num_chunks):
+        words = rng.choices(vocabulary, weights=weights, k=words_per_chunk)
+        words += rng.choices(stopwords, k=words_per_chunk // 3)
+        rng.shuffle(words)
+        chunks.append(' '.join(words).capitalize() + '.')
+    return chunks, vocabulary
+
+
+class Command(BaseCommand):
+    help = 'Benchmark BM25 keyword search against the previous linear-scan fallback'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunks', type=int, default=100000,
+                            help='Number of synthetic chunks (default: 100000)')
+        parser.add_argument('--queries', type=int, default=200,
+                            help='Number of BM25 queries (default: 200)')
+        parser.add_argument('--legacy-queries', type=int, default=10,
+                            help='Number of queries for the slow baseline (default: 10)')
+        parser.add_argument('--top-k', type=int, default=3, help='Results per query (default: 3)')
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('=' * 80))
+        self.stdout.write(self.style.SUCCESS('Keyword Search Benchmark'))
+        self.stdout.write(self.style.SUCCESS('=' * 80))
+
+        self.stdout.write(f"Generating {options['chunks']} chunks...")
+        chunks, vocabulary = synthetic_chunks(options['chunks'])
+        rng = random.Random(1)
+        queries = [
+            'what is ' + ' '.join(rng.choices(vocabulary[:5000], k=rng.randint(2, 5)))
+            for _ in range(max(options['queries'], options['legacy_queries']))
+        ]
+
+        start = time.perf_counter()
+        index = BM25Index.build(enumerate(chunks))
+        build_s = time.perf_counter() - start
+        self.stdout.write(
+            f"BM25 index built in {build_s:.2f}s "
+            f"({index.vocabulary_size} terms, {build_s / len(chunks) * 1e6:.1f}us per chunk)"
+        )
+        self.stdout.write('')
+
+        self.stdout.write(f"{'Method':<12}{'Queries':>10}{'p50':>14}{'p99':>14}{'QPS':>12}")
+        self.stdout.write('-' * 80)
+
+        legacy = self._measure(
+            lambda query: legacy_keyword_search(chunks, query, options['top_k']),
+            queries[:options['legacy_queries']]
+        )
+        self._report('legacy', legacy)
+        bm25 = self._measure(
+            lambda query: index.search(query, options['top_k']),
+            queries[:options['queries']]
+        )
+        self._report('bm25', bm25)
+
+        self.stdout.write('')
+        self.stdout.write(f"Speed-up (p50): {legacy['p50'] / bm25['p50']:.0f}x")
+        self.stdout.write(self.style.SUCCESS('=' * 80))
+
+    def _measure(self, search, queries):
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            search(query)
+            latencies.append((time.perf_counter() - start) * 1000)
+        latencies.sort()
+        return {
+            'count': len(latencies),
+            'p50': statistics.median(latencies),
+            'p99': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+            'qps': len(latencies) / (sum(latencies) / 1000),
+        }
+
+    def _report(self, name, result):
+        self.stdout.write(
+            f"{name:<12}{result['count']:>10}{result['p50']:>11.2f} ms"
+            f"{result['p99']:>11.2f} ms{result['qps']:>12.1f}"
+        )
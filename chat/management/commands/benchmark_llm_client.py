@@ -0,0 +1,189 @@
+"""
+Django management command to measure the per-call overhead of the Gemini client.
+Usage: python manage.py benchmark_llm_client [--clients 1 8] [--calls 200] [--latency-ms 5] [--handshake-ms 20] [--stream]
+
+Starts a mock Gemini REST server on localhost and answers --calls
+prompts through the REST transport of chat.llm.GeminiClient:
+
+- per-call: a new client (and so a new connection) for every call, as
+  when the model object was built for each answer
+- pooled: one shared client reusing keep-alive connections, as the RAG
+  service now does
+
+The server takes --latency-ms per answer and sleeps --handshake-ms on
+each new connection, standing in for the TCP and TLS handshakes with the
+real API; set it to 0 to measure loopback connections alone. No API key
+or network access is needed.
+"""
+import json
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+from chat.llm import GeminiClient
+
+MODES = ('per-call', 'pooled')
+
+PROMPT = (
+    "You are a helpful AI assistant.\n\nContext:\nDjango is a high-level Python web framework.\n\n"
+    "Question: What is Django?\n\nAnswer:"
+)
+ANSWER_PIECES = ['Django is ', 'a high-level Python ', 'web framework.']
+
+
+def _payload(text):
+    return {'candidates': [{'content': {'role': 'model', 'parts': [{'text': text}]}, 'finishReason': 'STOP'}]}
+
+
+class MockGeminiHandler(BaseHTTPRequestHandler):
+    """generateContent and streamGenerateContent?alt=sse with canned answers, over HTTP/1.1 keep-alive"""
+
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; without this, Nagle's
+    # algorithm holds the body back until the client's delayed ACK
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.server.count_connection()
+        if self.server.handshake:
+            time.sleep(self.server.handshake)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if ':streamGenerateContent' in self.path:
+            body = b''.join(
+                b'data: ' + json.dumps(_payload(piece)).encode() + b'\r\n\r\n' for piece in ANSWER_PIECES
+            )
+            content_type = 'text/event-stream'
+        elif ':generateContent' in self.path:
+            body = json.dumps(_payload(''.join(ANSWER_PIECES))).encode()
+            content_type = 'application/json'
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MockGeminiServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency_ms, handshake_ms):
+        super().__init__(('127.0.0.1', 0), MockGeminiHandler)
+        self.latency = latency_ms / 1000
+        self.handshake = handshake_ms / 1000
+        self.connections = 0
+        self._lock = threading.Lock()
+
+    def count_connection(self):
+        with self._lock:
+            self.connections += 1
+
+
+class Command(BaseCommand):
+    help = 'Compare per-call and pooled Gemini clients against a local mock API server'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, nargs='+', default=[1, 8],
+                            help='Concurrent callers (default: 1 8)')
+        parser.add_argument('--calls', type=int, default=200,
+                            help='Calls per run (default: 200)')
+        parser.add_argument('--latency-ms', type=float, default=5,
+                            help='Mock server time per answer (default: 5)')
+        parser.add_argument('--handshake-ms', type=float, default=20,
+                            help='Mock server delay per new connection (default: 20)')
+        parser.add_argument('--stream', action='store_true',
+                            help='Stream answers (streamGenerateContent) instead of generateContent')
+
+    def handle(self, *args, **options):
+        server = MockGeminiServer(options['latency_ms'], options['handshake_ms'])
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.api_base = f"http://127.0.0.1:{server.server_address[1]}/v1beta"
+        self.stream = options['stream']
+
+        self.stdout.write(self.style.SUCCESS('=' * 80))
+        self.stdout.write(self.style.SUCCESS('Gemini Client Benchmark (mock server)'))
+        self.stdout.write(self.style.SUCCESS('=' * 80))
+        self.stdout.write(
+            f"Server: {options['latency_ms']:.0f}ms per answer, {options['handshake_ms']:.0f}ms per new connection; "
+            f"{options['calls']} {'streamed' if self.stream else 'complete'} answers per run"
+        )
+        self.stdout.write('')
+        self.stdout.write(
+            f"{'Mode':<10}{'Clients':>8}{'Calls/s':>10}{'Mean':>12}{'p50':>12}{'p99':>12}{'Overhead':>12}{'Conns':>7}"
+        )
+        self.stdout.write('-' * 80)
+
+        try:
+            for clients in options['clients']:
+                for mode in MODES:
+                    before = server.connections
+                    result = self._run(mode, clients, options['calls'])
+                    overhead = result['mean'] - options['latency_ms']
+                    self.stdout.write(
+                        f"{mode:<10}{clients:>8}{result['throughput']:>10.1f}{result['mean']:>9.2f} ms"
+                        f"{result['p50']:>9.2f} ms{result['p99']:>9.2f} ms{overhead:>9.2f} ms"
+                        f"{server.connections - before:>7}"
+                    )
+                self.stdout.write('')
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.stdout.write('Overhead is mean latency minus the server time per answer')
+        self.stdout.write(self.style.SUCCESS('=' * 80))
+
+    def _client(self, pool_size):
+        return GeminiClient(
+            'benchmark-key', 'gemini-2.5-flash', transport='rest', api_base=self.api_base, pool_size=pool_size
+        )
+
+    def _call(self, client):
+        if self.stream:
+            answer = ''.join(client.stream(PROMPT))
+        else:
+            answer = client.generate(PROMPT)
+        if answer != ''.join(ANSWER_PIECES):
+            raise RuntimeError(f"Unexpected answer from the mock server: {answer!r}")
+
+    def _run(self, mode, clients, calls):
+        shared = self._client(pool_size=clients) if mode == 'pooled' else None
+
+        def one_call(_):
+            start = time.perf_counter()
+            if shared is not None:
+                self._call(shared)
+            else:
+                client = self._client(pool_size=1)
+                try:
+                    self._call(client)
+                finally:
+                    client.close()
+            return (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=clients) as pool:
+            latencies = sorted(pool.map(one_call, range(calls)))
+        elapsed = time.perf_counter() - start
+        if shared is not None:
+            shared.close()
+
+        return {
+            'throughput': len(latencies) / elapsed,
+            'mean': statistics.fmean(latencies),
+            'p50': statistics.median(latencies),
+            'p99': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+        }
@@ -0,0 +1,165 @@
+"""
+Django management command to compare per-worker memory of the RAG index layouts.
+Usage: python manage.py benchmark_rag_memory [--workers 1 4 8] [--chunks 100000]
+
+Every worker process opens the same snapshot, runs a dense search and a
+keyword scan (so every page of the index is touched), and then reports
+its resident set size (RSS) and proportional set size (PSS). PSS divides
+shared pages between the processes mapping them, so it shows how much
+memory each worker really costs once the page cache is shared.
+"""
+import multiprocessing
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from chat import index_store
+
+WORDS = (
+    'django python index vector search query token model embedding worker '
+    'memory cache request response server database chunk snapshot layout '
+    'latency throughput process thread page shared offset matrix float'
+).split()
+
+
+def _read_memory_kb():
+    """Return (rss_kb, pss_kb) of the current process"""
+    values = {}
+    try:
+        with open('/proc/self/smaps_rollup', 'r') as f:
+            for line in f:
+                key, _, rest = line.partition(':')
+                if key in ('Rss', 'Pss'):
+                    values[key] = int(rest.split()[0])
+    except OSError:
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        values = {'Rss': rss, 'Pss': rss}
+    return values.get('Rss', 0), values.get('Pss', 0)
+
+
+def _worker(snapshot_dir, layout, barrier, results):
+    baseline_rss, _ = _read_memory_kb()
+    base = index_store.open_snapshot_dir(snapshot_dir, layout)
+    index, chunks = base['index'], base['chunks']
+
+    query = np.random.default_rng(0).standard_normal((1, index.d)).astype('float32')
+    index.search(query, 3)
+    matches = sum(1 for chunk in chunks if 'snapshot' in chunk)
+
+    # Measure while every worker is alive so shared pages are split between them
+    barrier.wait()
+    rss, pss = _read_memory_kb()
+    results.put({'rss_kb': rss, 'pss_kb': pss, 'baseline_rss_kb': baseline_rss, 'matches': matches})
+    barrier.wait()
+
+
+class Command(BaseCommand):
+    help = 'Benchmark RSS/PSS per worker for the mmap and in-process index layouts'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            nargs='+',
+            default=[1, 4, 8],
+            help='Worker counts to measure (default: 1 4 8)'
+        )
+        parser.add_argument(
+            '--chunks',
+            type=int,
+            default=100000,
+            help='Number of synthetic chunks (default: 100000)'
+        )
+        parser.add_argument(
+            '--dim',
+            type=int,
+            default=384,
+            help='Embedding dimension of the synthetic corpus (default: 384)'
+        )
+        parser.add_argument(
+            '--use-current',
+            action='store_true',
+            help='Benchmark the current snapshot in RAG_INDEX_DIR instead of a synthetic one'
+        )
+
+    def handle(self, *args, **options):
+        scratch = None
+
+        if options['use_current']:
+            snapshot_dir = index_store.current_snapshot_dir(settings.RAG_INDEX_DIR)
+            if snapshot_dir is None:
+                raise CommandError('No snapshot found. Run: python manage.py build_rag_index')
+        else:
+            scratch = tempfile.mkdtemp(prefix='rag-memory-bench-')
+            snapshot_dir = self._build_synthetic(scratch, options['chunks'], options['dim'])
+
+        meta = index_store.read_snapshot_meta(scratch or settings.RAG_INDEX_DIR)
+
+        self.stdout.write(self.style.SUCCESS('=' * 80))
+        self.stdout.write(self.style.SUCCESS('RAG Index Memory Benchmark'))
+        self.stdout.write(self.style.SUCCESS('=' * 80))
+        self.stdout.write(f"Snapshot: {snapshot_dir}")
+        self.stdout.write(f"Chunks: {meta['num_chunks']}, dimension: {meta['dimension']}")
+        self.stdout.write('')
+        self.stdout.write(
+            f"{'Layout':<10}{'Workers':>8}{'RSS/worker':>14}{'PSS/worker':>14}"
+            f"{'Index RSS/worker':>18}{'Total PSS':>14}"
+        )
+        self.stdout.write('-' * 80)
+
+        try:
+            for layout in ('memory', 'mmap'):
+                for workers in options['workers']:
+                    rows = self._run(snapshot_dir, layout, workers)
+                    rss = sum(r['rss_kb'] for r in rows) / len(rows)
+                    pss = sum(r['pss_kb'] for r in rows) / len(rows)
+                    index_rss = sum(r['rss_kb'] - r['baseline_rss_kb'] for r in rows) / len(rows)
+                    total_pss = sum(r['pss_kb'] for r in rows)
+                    self.stdout.write(
+                        f"{layout:<10}{workers:>8}{rss / 1024:>11.1f} MB{pss / 1024:>11.1f} MB"
+                        f"{index_rss / 1024:>15.1f} MB{total_pss / 1024:>11.1f} MB"
+                    )
+        finally:
+            if scratch:
+                shutil.rmtree(scratch, ignore_errors=True)
+
+        self.stdout.write(self.style.SUCCESS('=' * 80))
+
+    def _build_synthetic(self, scratch, num_chunks, dim):
+        self.stdout.write(f"Building synthetic snapshot ({num_chunks} chunks, dim {dim})...")
+        start = time.perf_counter()
+        rng = np.random.default_rng(42)
+        word_ids = rng.integers(0, len(WORDS), size=(num_chunks, 60))
+        chunks = [' '.join(WORDS[i] for i in row) for row in word_ids]
+        embeddings = rng.standard_normal((num_chunks, dim)).astype('float32')
+        snapshot_dir = index_store.save_snapshot(
+            scratch, chunks, embeddings,
+            ids=np.arange(num_chunks, dtype='int64'),
+            doc_rows=np.zeros(num_chunks, dtype='int32'),
+            documents=[{'id': 'synthetic', 'version': None}],
+            model_name='synthetic',
+            kb_version=f"synthetic-{num_chunks}",
+            next_chunk_id=num_chunks,
+        )
+        self.stdout.write(f"Built in {time.perf_counter() - start:.1f}s")
+        return snapshot_dir
+
+    def _run(self, snapshot_dir, layout, workers):
+        context = multiprocessing.get_context('spawn')
+        barrier = context.Barrier(workers)
+        results = context.Queue()
+        processes = [
+            context.Process(target=_worker, args=(snapshot_dir, layout, barrier, results))
+            for _ in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        rows = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+        return rows
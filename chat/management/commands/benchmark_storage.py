@@ -0,0 +1,99 @@
+"""
+Django management command to benchmark quantized embedding storage.
+Usage: python manage.py benchmark_storage [--sizes 100000 1000000] [--storage float32 float16 int8 pq] [--rescore 0 4 10]
+
+For every synthetic corpus size and storage type it reports the memory
+of the searched vectors (and its share of float32), recall@k against the
+exact float32 scan, and p50/p99 latency of single-query searches, once
+per --rescore factor (0 = no exact re-scoring).
+"""
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from chat import vector_index
+from chat.management.commands.benchmark_ann import synthetic_corpus
+
+
+class Command(BaseCommand):
+    help = 'Benchmark memory, recall@k and latency of float32, float16, int8 and PQ embedding storage'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[100000],
+                            help='Corpus sizes to test (default: 100000; try 1000000)')
+        parser.add_argument('--storage', nargs='+', default=list(vector_index.STORAGE_TYPES),
+                            choices=vector_index.STORAGE_TYPES, help='Storage types to test')
+        parser.add_argument('--rescore', type=int, nargs='+', default=[0, settings.RAG_RESCORE_FACTOR],
+                            help='Re-scoring factors to test, 0 for none (default: 0 RAG_RESCORE_FACTOR)')
+        parser.add_argument('--dim', type=int, default=384, help='Vector dimension (default: 384)')
+        parser.add_argument('--queries', type=int, default=200, help='Number of queries (default: 200)')
+        parser.add_argument('--k', type=int, default=10, help='Neighbours per query for recall@k (default: 10)')
+
+    def handle(self, *args, **options):
+        try:
+            import faiss  # noqa: F401
+        except ImportError:
+            raise CommandError('faiss is required for quantized storage')
+
+        params = vector_index.resolve_params(settings.RAG_INDEX_PARAMS)
+        k = options['k']
+
+        self.stdout.write(self.style.SUCCESS('=' * 96))
+        self.stdout.write(self.style.SUCCESS('Embedding Storage Benchmark'))
+        self.stdout.write(self.style.SUCCESS('=' * 96))
+
+        for size in options['sizes']:
+            self.stdout.write(f"\nGenerating {size} x {options['dim']} vectors...")
+            corpus, queries = synthetic_corpus(size, options['dim'], options['queries'])
+
+            exact = vector_index.MemmapFlatIndex(corpus)
+            _, truth = exact.search(queries, k)
+            float32_bytes = vector_index.index_memory_bytes(exact)
+
+            self.stdout.write(
+                f"{'Storage':<10}{'Rescore':>8}{'Build':>10}{'Memory':>12}{'vs f32':>8}"
+                f"{'Recall@' + str(k):>12}{'p50':>12}{'p99':>12}"
+            )
+            self.stdout.write('-' * 96)
+
+            for storage in options['storage']:
+                effective = vector_index.effective_storage(storage, size, options['dim'], params)
+                start = time.perf_counter()
+                if effective == 'float32':
+                    index = exact
+                else:
+                    index = vector_index.build_storage_index(corpus, effective, params)
+                build_s = time.perf_counter() - start
+                memory = vector_index.index_memory_bytes(index)
+
+                for factor in options['rescore'] if effective != 'float32' else [0]:
+                    searched = index
+                    if factor:
+                        searched = vector_index.RescoringIndex(index, corpus, factor)
+                    recall, p50, p99 = self._measure(searched, queries, truth, k)
+                    name = storage if effective == storage else f"{storage}*"
+                    self.stdout.write(
+                        f"{name:<10}{factor or '-':>8}{build_s:>9.2f}s{memory / (1024 * 1024):>9.1f} MB"
+                        f"{memory / float32_bytes:>8.0%}{recall:>12.4f}{p50:>10.3f}ms{p99:>10.3f}ms"
+                    )
+
+        self.stdout.write('')
+        self.stdout.write('* corpus too small to train PQ codebooks; stored as float32')
+        self.stdout.write('Memory counts the searched vectors or codes; re-scoring reads float32 rows from disk.')
+        self.stdout.write(self.style.SUCCESS('=' * 96))
+
+    def _measure(self, index, queries, truth, k):
+        latencies = []
+        found = 0
+        for q in range(len(queries)):
+            start = time.perf_counter()
+            _, rows = index.search(queries[q:q + 1], k)
+            latencies.append((time.perf_counter() - start) * 1000)
+            found += len(set(rows[0].tolist()) & set(truth[q].tolist()))
+        return (
+            found / (len(queries) * k),
+            float(np.percentile(latencies, 50)),
+            float(np.percentile(latencies, 99)),
+        )
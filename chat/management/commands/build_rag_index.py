@@ -0,0 +1,154 @@
+"""
+Django management command to prebuild and check the RAG index snapshot.
+Usage: python manage.py build_rag_index [--check] [--rebuild] [--timings]
+"""
+import shutil
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from chat.embeddings import backend_available, backend_config, backend_name, load_embedding_backend
+from chat.rag_service import RAGService, FAISS_AVAILABLE
+
+
+class Command(BaseCommand):
+    help = 'Build, verify or benchmark the on-disk RAG index snapshot'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Only verify that the current snapshot matches the knowledge base'
+        )
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='Rebuild the snapshot from the knowledge base file only, dropping separately '
+                 'ingested documents (cached embeddings are reused)'
+        )
+        parser.add_argument(
+            '--timings',
+            action='store_true',
+            help='Measure cold, cache-warm, snapshot-warm and single-edit start times in a scratch directory'
+        )
+
+    def handle(self, *args, **options):
+        if not (FAISS_AVAILABLE and backend_available(settings.RAG_EMBEDDING_BACKEND)):
+            raise CommandError(
+                f"faiss and the {settings.RAG_EMBEDDING_BACKEND} embedding backend are required to build the index"
+            )
+
+        from chat import index_store
+        from chat.knowledge_index import KnowledgeIndex
+
+        service = RAGService()
+        service._load_knowledge_base()
+        sources = {service.document_id: service.knowledge_base}
+        try:
+            model_name = backend_name(backend_config())
+        except OSError as e:
+            raise CommandError(f"Embedding model not found: {str(e)}")
+        index_dir = settings.RAG_INDEX_DIR
+
+        self.stdout.write(self.style.SUCCESS('=' * 60))
+        self.stdout.write(self.style.SUCCESS('RAG Index Snapshot'))
+        self.stdout.write(self.style.SUCCESS('=' * 60))
+        self.stdout.write(
+            f"Knowledge base: {settings.RAG_KNOWLEDGE_BASE_PATH} ({len(service.knowledge_base)} chunks)"
+        )
+        self.stdout.write(f"Index directory: {index_dir}")
+
+        if options['check']:
+            self._check(index_store, KnowledgeIndex, service, model_name, index_dir)
+            return
+
+        load_start = time.perf_counter()
+        model = load_embedding_backend()
+        model_ms = (time.perf_counter() - load_start) * 1000
+        self.stdout.write(f"Model load: {model_ms:.1f}ms")
+
+        if options['timings']:
+            self._timings(KnowledgeIndex, sources, model, model_name)
+            return
+
+        knowledge_index, info = KnowledgeIndex.open(
+            index_dir, model_name, model.encode, sources=sources,
+            layout=settings.RAG_INDEX_LAYOUT, rebuild=options['rebuild'],
+            index_type=settings.RAG_INDEX_TYPE, index_params=settings.RAG_INDEX_PARAMS,
+            storage=settings.RAG_EMBEDDING_STORAGE, rescore_factor=settings.RAG_RESCORE_FACTOR
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Snapshot {info['kb_version']} {info['source']} in {info['elapsed_ms']}ms "
+            f"({info['cache_misses']} encoded, {info['cache_hits']} from cache, "
+            f"{info['num_chunks']} chunks, {knowledge_index.stats()['index_type']} index, "
+            f"{knowledge_index.stats()['storage']} storage)"
+        ))
+
+    def _check(self, index_store, KnowledgeIndex, service, model_name, index_dir):
+        meta = index_store.read_snapshot_meta(index_dir)
+        if meta is None:
+            raise CommandError('No snapshot found. Run: python manage.py build_rag_index')
+
+        self.stdout.write(f"Snapshot version: {meta.get('kb_version')} (format {meta.get('format_version')})")
+        if (meta.get('model_name') != model_name
+                or meta.get('format_version') != index_store.SNAPSHOT_FORMAT_VERSION):
+            raise CommandError('Snapshot was built with another model or format. Run: python manage.py build_rag_index')
+
+        def cached_only(texts):
+            raise CommandError('Journal references embeddings missing from the cache. Run: python manage.py build_rag_index')
+
+        knowledge_index = KnowledgeIndex(index_dir, model_name, cached_only, settings.RAG_INDEX_LAYOUT)
+        knowledge_index._load_current()
+        for key, value in knowledge_index.stats().items():
+            self.stdout.write(f"  {key}: {value}")
+
+        expected = index_store.knowledge_base_version(service.knowledge_base, model_name)
+        indexed = knowledge_index.documents.get(service.document_id, {}).get('version')
+        if indexed != expected:
+            raise CommandError(
+                f"{service.document_id} changed since it was indexed. Run: python manage.py build_rag_index"
+            )
+
+        self.stdout.write(self.style.SUCCESS('Snapshot is up to date'))
+
+    def _timings(self, KnowledgeIndex, sources, model, model_name):
+        scratch = tempfile.mkdtemp(prefix='rag-index-timings-')
+        results = []
+
+        try:
+            def run(label, scenario_sources, rebuild=False):
+                start = time.perf_counter()
+                _, info = KnowledgeIndex.open(
+                    scratch, model_name, model.encode, sources=scenario_sources,
+                    layout=settings.RAG_INDEX_LAYOUT, rebuild=rebuild,
+                    index_type=settings.RAG_INDEX_TYPE, index_params=settings.RAG_INDEX_PARAMS
+                )
+                elapsed = (time.perf_counter() - start) * 1000
+                results.append((label, elapsed, info))
+
+            # Cold: empty embedding cache, no snapshot
+            run('cold (no cache, no snapshot)', sources)
+            # Snapshot rebuilt, all embeddings served from the cache
+            run('warm cache (rebuild)', sources, rebuild=True)
+            # Restart without knowledge base changes
+            run('warm (snapshot)', sources)
+            # One paragraph edited: only that chunk is re-embedded
+            for doc_id, chunks in sources.items():
+                if chunks:
+                    edited = list(chunks)
+                    edited[len(edited) // 2] = edited[len(edited) // 2] + ' (edited)'
+                    run('one paragraph edited', {doc_id: edited})
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+        self.stdout.write('')
+        self.stdout.write(f"{'Scenario':<32}{'Time':>12}{'Encoded':>10}{'Cached':>10}  Source")
+        self.stdout.write('-' * 76)
+        for label, elapsed, info in results:
+            self.stdout.write(
+                f"{label:<32}{elapsed:>10.1f}ms{info['cache_misses']:>10}"
+                f"{info['cache_hits']:>10}  {info['source']}"
+            )
+        self.stdout.write(self.style.SUCCESS('=' * 60))
@@ -0,0 +1,116 @@
+"""
+Django management command to export the embedding model for the ONNX backend.
+Usage: python manage.py export_onnx_model [--output DIR] [--quantize] [--opset 17]
+
+Exports the transformer of RAG_EMBEDDING_MODEL to ONNX with dynamic batch
+and sequence axes, saves its fast tokenizer and the pooling settings the
+ONNX backend needs, and with --quantize also writes an int8 copy with
+dynamically quantized weights. Both exports are checked against
+sentence-transformers on a few sample sentences (cosine similarity).
+Requires sentence-transformers, torch, onnx and onnxruntime; serving
+afterwards only needs onnxruntime and tokenizers.
+"""
+import json
+import os
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from chat.embeddings import ONNX_CONFIG_NAME, OnnxBackend, onnx_model_file
+
+SAMPLE_TEXTS = [
+    'How do I reset my password?',
+    'The scheduler runs jobs in the background and retries failed ones.',
+    'Embeddings are cached per chunk, so only edited paragraphs are re-encoded.',
+    'short',
+]
+
+
+class Command(BaseCommand):
+    help = 'Export RAG_EMBEDDING_MODEL to ONNX (optionally int8-quantized) for RAG_EMBEDDING_BACKEND=onnx'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', type=str, default=settings.RAG_ONNX_MODEL_DIR,
+                            help='Output directory (default: RAG_ONNX_MODEL_DIR)')
+        parser.add_argument('--quantize', action='store_true',
+                            help='Also write model_int8.onnx with int8 weights')
+        parser.add_argument('--opset', type=int, default=17, help='ONNX opset version (default: 17)')
+
+    def handle(self, *args, **options):
+        try:
+            import torch
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise CommandError(f"Exporting needs sentence-transformers, torch, onnx and onnxruntime ({str(e)})")
+
+        output = options['output']
+        os.makedirs(output, exist_ok=True)
+
+        self.stdout.write(self.style.SUCCESS('=' * 70))
+        self.stdout.write(self.style.SUCCESS('ONNX Embedding Model Export'))
+        self.stdout.write(self.style.SUCCESS('=' * 70))
+        self.stdout.write(f"Loading {settings.RAG_EMBEDDING_MODEL}...")
+        model = SentenceTransformer(settings.RAG_EMBEDDING_MODEL, device='cpu')
+        model.eval()
+
+        transformer = model[0]
+        pooling = 'cls' if getattr(model[1], 'pooling_mode_cls_token', False) else 'mean'
+        normalize = any(type(module).__name__ == 'Normalize' for module in model)
+        tokenizer = transformer.tokenizer
+        config = {
+            'model_name': settings.RAG_EMBEDDING_MODEL,
+            'dimension': model.get_sentence_embedding_dimension(),
+            'max_length': model.max_seq_length,
+            'pooling': pooling,
+            'normalize': normalize,
+            'pad_id': tokenizer.pad_token_id,
+            'pad_token': tokenizer.pad_token,
+        }
+
+        sample = tokenizer(SAMPLE_TEXTS[:2], padding=True, return_tensors='pt')
+        input_names = [name for name in ('input_ids', 'attention_mask', 'token_type_ids') if name in sample]
+        dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names}
+        dynamic_axes['last_hidden_state'] = {0: 'batch', 1: 'sequence'}
+
+        path = os.path.join(output, onnx_model_file(quantized=False))
+        self.stdout.write(f"Exporting {path} (opset {options['opset']})...")
+        with torch.no_grad():
+            torch.onnx.export(
+                transformer.auto_model,
+                tuple(sample[name] for name in input_names),
+                path,
+                input_names=input_names,
+                output_names=['last_hidden_state'],
+                dynamic_axes=dynamic_axes,
+                opset_version=options['opset'],
+                do_constant_folding=True,
+            )
+
+        tokenizer.backend_tokenizer.save(os.path.join(output, 'tokenizer.json'))
+        with open(os.path.join(output, ONNX_CONFIG_NAME), 'w', encoding='utf-8') as f:
+            json.dump(config, f, indent=2)
+
+        if options['quantize']:
+            quantized_path = os.path.join(output, onnx_model_file(quantized=True))
+            self.stdout.write(f"Quantizing weights to int8: {quantized_path}...")
+            quantize_dynamic(path, quantized_path, weight_type=QuantType.QInt8)
+
+        reference = model.encode(SAMPLE_TEXTS, normalize_embeddings=True, show_progress_bar=False)
+        for quantized in [False, True] if options['quantize'] else [False]:
+            backend = OnnxBackend(output, quantized=quantized)
+            vectors = backend.encode(SAMPLE_TEXTS)
+            vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+            similarity = (vectors * reference).sum(axis=1)
+            size_mb = os.path.getsize(os.path.join(output, onnx_model_file(quantized))) / (1024 * 1024)
+            self.stdout.write(
+                f"{onnx_model_file(quantized):<18}{size_mb:>8.1f} MB   cosine vs PyTorch: "
+                f"min {similarity.min():.4f}, mean {similarity.mean():.4f}"
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Done ({config['dimension']} dimensions, {pooling} pooling). "
+            f"Set RAG_EMBEDDING_BACKEND=onnx{' and RAG_ONNX_QUANTIZED=True' if options['quantize'] else ''} to use it."
+        ))
+        self.stdout.write(self.style.SUCCESS('=' * 70))
@@ -0,0 +1,111 @@
+"""
+Django management command to ingest a directory or glob of documents in parallel.
+Usage: python manage.py ingest_docs PATH [PATH ...] [--prefix docs/] [--collection ID] [--workers 8] [--embed-processes 2] [--restart]
+
+PATH is a directory (searched recursively for --extensions), a file or a
+quoted glob pattern such as "manuals/**/*.md". Files are chunked in a
+process pool, embedded in large batches and published as one new index
+snapshot; see chat/ingestion.py. An interrupted run resumes from its
+checkpoint when started again with the same settings.
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from chat.chunking import get_chunker
+from chat.embeddings import backend_config
+from chat.ingestion import DEFAULT_EXTENSIONS, ENCODE_MICRO_BATCH, IngestionPipeline, discover_files
+from chat.rag_service import get_rag_service
+
+
+class Command(BaseCommand):
+    help = 'Chunk, embed and index many documents in parallel, with checkpoints'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help='Directories, files or glob patterns')
+        parser.add_argument('--prefix', type=str, default='',
+                            help='Prepended to every document ID (relative file path)')
+        parser.add_argument('--collection', type=str, default=None,
+                            help='Collection to ingest into, created if new (default: RAG_DEFAULT_COLLECTION)')
+        parser.add_argument('--extensions', nargs='+', default=list(DEFAULT_EXTENSIONS),
+                            help='File extensions to ingest from directories (default: .txt .md)')
+        parser.add_argument('--workers', type=int, default=settings.RAG_INGEST_WORKERS,
+                            help='Chunking processes, 0 for one per core (default: RAG_INGEST_WORKERS)')
+        parser.add_argument('--batch-size', type=int, default=settings.RAG_INGEST_BATCH_SIZE,
+                            help='Chunks per embedding batch (default: RAG_INGEST_BATCH_SIZE)')
+        parser.add_argument('--embed-processes', type=int, default=settings.RAG_INGEST_EMBED_PROCESSES,
+                            help='Model replicas to embed with (default: RAG_INGEST_EMBED_PROCESSES)')
+        parser.add_argument('--checkpoint', type=str, default=None,
+                            help='Checkpoint file (default: RAG_INDEX_DIR/ingest_checkpoint.jsonl)')
+        parser.add_argument('--restart', action='store_true',
+                            help='Discard the checkpoint of an interrupted run and start over')
+
+    def handle(self, *args, **options):
+        try:
+            files = discover_files(options['paths'], options['extensions'], options['prefix'])
+        except (FileNotFoundError, ValueError) as e:
+            raise CommandError(str(e))
+        if not files:
+            raise CommandError('No documents found')
+
+        try:
+            service = get_rag_service(options['collection'], create=True)
+            index = service.get_index()
+        except (RuntimeError, ValueError) as e:
+            raise CommandError(str(e))
+
+        chunker = get_chunker()
+        chunker_options = None
+        if chunker is not None:
+            chunker_options = {
+                'target_tokens': chunker.target_tokens,
+                'overlap_tokens': chunker.overlap_tokens,
+                'min_tokens': chunker.min_tokens,
+            }
+
+        pipeline = IngestionPipeline(
+            index,
+            lambda texts: service.model.encode(texts, batch_size=ENCODE_MICRO_BATCH),
+            chunker_options,
+            workers=options['workers'],
+            batch_size=options['batch_size'],
+            embed_processes=options['embed_processes'],
+            embedding_config=backend_config(),
+            checkpoint_path=options['checkpoint'],
+            progress=self._progress
+        )
+
+        self.stdout.write(self.style.SUCCESS('=' * 80))
+        self.stdout.write(self.style.SUCCESS('Document Ingestion'))
+        self.stdout.write(self.style.SUCCESS('=' * 80))
+        self.stdout.write(
+            f"{len(files)} files into collection '{service.collection}', {pipeline.workers} chunking processes, "
+            f"{pipeline.embed_processes} embedding process(es), {pipeline.cores} cores, "
+            f"batches of {pipeline.batch_size} chunks"
+        )
+
+        stats = pipeline.run(files, restart=options['restart'])
+
+        if stats['resumed']:
+            self.stdout.write(f"Resumed: {stats['resumed']} files already done in the checkpoint")
+        rate = stats['chunks'] / stats['embed_seconds'] if stats['embed_seconds'] > 0 else 0.0
+        self.stdout.write(
+            f"Chunked and embedded {stats['processed']} files into {stats['chunks']:,} chunks "
+            f"in {stats['embed_seconds']:.1f}s ({rate:,.0f} chunks/s, {rate / stats['cores']:,.1f} per core; "
+            f"{stats['encoded']:,} encoded, {stats['cached']:,} from cache)"
+        )
+        if stats['failed']:
+            self.stderr.write(f"{stats['failed']} files could not be read")
+        published = stats['index']
+        self.stdout.write(self.style.SUCCESS(
+            f"Published {published['documents']} changed documents: {published['added']} chunks added, "
+            f"{published['deleted']} deleted, {published['unchanged']} unchanged"
+        ))
+        self.stdout.write(self.style.SUCCESS('=' * 80))
+
+    def _progress(self, stats):
+        self.stdout.write(
+            f"[{stats['resumed'] + stats['processed']:>6}/{stats['files']} files] "
+            f"{stats['chunks']:>9,} chunks  {stats['chunks_per_second']:>8,.0f} chunks/s  "
+            f"{stats['chunks_per_second_per_core']:>7,.1f} chunks/s/core  "
+            f"{stats['elapsed']:>6.1f}s"
+        )
@@ -0,0 +1,113 @@
+"""
+Django management command to change the knowledge base without a rebuild.
+Usage:
+    python manage.py ingest_kb add --document ID (--file PATH | --text TEXT)
+    python manage.py ingest_kb update --document ID (--file PATH | --text TEXT)
+    python manage.py ingest_kb delete --document ID
+    python manage.py ingest_kb update-chunk --chunk ID --text TEXT
+    python manage.py ingest_kb delete-chunks --chunk ID [ID ...]
+    python manage.py ingest_kb show --document ID
+    python manage.py ingest_kb compact
+    python manage.py ingest_kb status
+
+Changes are written to the index journal, so running servers pick them up
+within RAG_INDEX_REFRESH_SECONDS without restarting. --collection ID works
+on another collection's index; adding to a new collection creates it.
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from chat.rag_service import UnknownCollection, get_rag_service, split_into_chunks
+
+
+class Command(BaseCommand):
+    help = 'Add, update or delete knowledge base documents and chunks in the live index'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'action',
+            choices=['add', 'update', 'delete', 'update-chunk', 'delete-chunks', 'show', 'compact', 'status'],
+            help='Operation to perform'
+        )
+        parser.add_argument('--document', type=str, help='Document ID')
+        parser.add_argument('--chunk', type=int, nargs='+', help='Chunk ID(s)')
+        parser.add_argument('--file', type=str, help='Read document text from this file')
+        parser.add_argument('--text', type=str, help='Document or chunk text')
+        parser.add_argument('--collection', type=str, default=None,
+                            help='Collection ID (default: RAG_DEFAULT_COLLECTION)')
+
+    def handle(self, *args, **options):
+        action = options['action']
+        try:
+            service = get_rag_service(options['collection'], create=action in ('add', 'update'))
+        except (UnknownCollection, ValueError) as e:
+            raise CommandError(str(e))
+
+        try:
+            if action in ('add', 'update'):
+                document_id = self._require(options, 'document')
+                text = self._read_text(options)
+                if action == 'add':
+                    ids = service.add_chunks(document_id, split_into_chunks(text))
+                    self.stdout.write(self.style.SUCCESS(
+                        f"Added {len(ids)} chunks to {document_id} (IDs {ids[0]}-{ids[-1]})" if ids
+                        else f"No chunks found in the input for {document_id}"
+                    ))
+                else:
+                    result = service.upsert_document(document_id, text)
+                    self.stdout.write(self.style.SUCCESS(
+                        f"Updated {document_id}: {result['added']} added, {result['deleted']} deleted, "
+                        f"{result['unchanged']} unchanged ({result['encoded']} encoded)"
+                    ))
+
+            elif action == 'delete':
+                document_id = self._require(options, 'document')
+                count = service.delete_document(document_id)
+                self.stdout.write(self.style.SUCCESS(f"Deleted {document_id} ({count} chunks)"))
+
+            elif action == 'update-chunk':
+                chunk_ids = self._require(options, 'chunk')
+                if len(chunk_ids) != 1:
+                    raise CommandError('update-chunk takes exactly one --chunk ID')
+                service.update_chunk(chunk_ids[0], self._require(options, 'text'))
+                self.stdout.write(self.style.SUCCESS(f"Updated chunk {chunk_ids[0]}"))
+
+            elif action == 'delete-chunks':
+                count = service.delete_chunks(self._require(options, 'chunk'))
+                self.stdout.write(self.style.SUCCESS(f"Deleted {count} chunks"))
+
+            elif action == 'show':
+                document_id = self._require(options, 'document')
+                index = service.get_index()
+                for chunk_id in index.document_chunk_ids(document_id):
+                    chunk = index.get_chunk(chunk_id)
+                    text = chunk['text']
+                    preview = text[:70] + '...' if len(text) > 70 else text
+                    section = f"[{chunk['section']}] " if chunk['section'] else ''
+                    self.stdout.write(f"{chunk_id:>8}  {section}{preview}")
+
+            elif action == 'compact':
+                result = service.compact_index()
+                self.stdout.write(self.style.SUCCESS(
+                    f"Compacted index: dropped {result['dropped']} rows, kept {result['kept']}"
+                ))
+
+            elif action == 'status':
+                for key, value in service.get_index().stats().items():
+                    self.stdout.write(f"{key}: {value}")
+
+        except KeyError as e:
+            raise CommandError(str(e))
+        except RuntimeError as e:
+            raise CommandError(str(e))
+
+    def _require(self, options, name):
+        value = options.get(name)
+        if value is None:
+            raise CommandError(f"--{name} is required for this action")
+        return value
+
+    def _read_text(self, options):
+        if options.get('file'):
+            with open(options['file'], 'r', encoding='utf-8') as f:
+                return f.read()
+        return self._require(options, 'text')
@@ -0,0 +1,141 @@
+"""
+Django management command to load test the sync (WSGI) and async (ASGI) chat paths.
+Usage: python manage.py load_test_chat [--concurrency 8 32 128] [--threads 8] [--llm-ms 1500]
+
+Runs in-process with a fake LLM that takes --llm-ms per answer, so the
+numbers isolate how each path holds requests while waiting on the model:
+
+- wsgi: the DRF /api/chat view, with at most --threads requests inside
+  the view at once (like a gunicorn worker with that many threads);
+  latency includes the time a request waits for a free thread
+- asgi: the /api/async/chat view, all clients as tasks on one event loop
+
+A throwaway user is created for the run and deleted afterwards, together
+with its conversations. Answer caches are bypassed.
+"""
+import asyncio
+import statistics
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from chat.llm import FakeLLM
+from chat.rag_service import get_rag_service
+
+
+class Command(BaseCommand):
+    help = 'Compare concurrent chat throughput of the WSGI and ASGI chat views'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[8, 32, 128],
+                            help='Concurrent clients (default: 8 32 128)')
+        parser.add_argument('--requests', type=int, default=2,
+                            help='Chats per client (default: 2)')
+        parser.add_argument('--threads', type=int, default=8,
+                            help='WSGI worker threads (default: 8)')
+        parser.add_argument('--llm-ms', type=float, default=1500,
+                            help='Simulated LLM generation time (default: 1500)')
+
+    def handle(self, *args, **options):
+        service = get_rag_service()
+        service.initialize()
+
+        User = get_user_model()
+        username = f"loadtest-{uuid.uuid4().hex[:8]}"
+        user = User.objects.create_user(username=username, email=f"{username}@example.com",
+                                        password=uuid.uuid4().hex)
+        self.auth = f"Bearer {RefreshToken.for_user(user).access_token}"
+
+        saved = (service.llm, service.semantic_cache)
+        words = 30
+        service.llm = FakeLLM(token_delay_ms=options['llm_ms'] / words, max_words=words - 5)
+        service.semantic_cache = None
+
+        self.stdout.write(self.style.SUCCESS('=' * 80))
+        self.stdout.write(self.style.SUCCESS('Chat Load Test (one process)'))
+        self.stdout.write(self.style.SUCCESS('=' * 80))
+        self.stdout.write(f"Simulated LLM time: {options['llm_ms']:.0f}ms, WSGI threads: {options['threads']}")
+        self.stdout.write('')
+        self.stdout.write(
+            f"{'Path':<8}{'Clients':>8}{'Chats/s':>10}{'p50':>12}{'p99':>12}{'Errors':>8}"
+        )
+        self.stdout.write('-' * 80)
+
+        try:
+            with override_settings(RAG_RESPONSE_CACHE_ENABLED=False):
+                for clients in options['concurrency']:
+                    result = self._run_wsgi(clients, options['requests'], options['threads'])
+                    self._report('wsgi', clients, result)
+                    result = asyncio.run(self._run_asgi(clients, options['requests']))
+                    self._report('asgi', clients, result)
+        finally:
+            service.llm, service.semantic_cache = saved
+            user.delete()
+
+        self.stdout.write(self.style.SUCCESS('=' * 80))
+
+    def _message(self, client, number):
+        # Unique per request so no cache can answer it
+        return f"What is Django and how does it help? ({uuid.uuid4().hex[:6]} {client}-{number})"
+
+    def _run_wsgi(self, clients, requests, threads):
+        worker_threads = threading.BoundedSemaphore(threads)
+
+        def one_client(client_number):
+            client = Client()
+            latencies, errors = [], 0
+            for n in range(requests):
+                start = time.perf_counter()
+                with worker_threads:
+                    response = client.post(
+                        '/api/chat', {'message': self._message(client_number, n)},
+                        content_type='application/json', HTTP_AUTHORIZATION=self.auth
+                    )
+                latencies.append((time.perf_counter() - start) * 1000)
+                errors += response.status_code != 201
+            return latencies, errors
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=clients) as pool:
+            results = list(pool.map(one_client, range(clients)))
+        return self._summarise(results, time.perf_counter() - start)
+
+    async def _run_asgi(self, clients, requests):
+        async def one_client(client_number):
+            client = AsyncClient()
+            latencies, errors = [], 0
+            for n in range(requests):
+                start = time.perf_counter()
+                response = await client.post(
+                    '/api/async/chat', {'message': self._message(client_number, n)},
+                    content_type='application/json', headers={'Authorization': self.auth}
+                )
+                latencies.append((time.perf_counter() - start) * 1000)
+                errors += response.status_code != 201
+            return latencies, errors
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(one_client(n) for n in range(clients)))
+        return self._summarise(results, time.perf_counter() - start)
+
+    def _summarise(self, results, elapsed):
+        latencies = sorted(latency for client, _ in results for latency in client)
+        return {
+            'throughput': len(latencies) / elapsed,
+            'p50': statistics.median(latencies),
+            'p99': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+            'errors': sum(errors for _, errors in results),
+        }
+
+    def _report(self, path, clients, result):
+        self.stdout.write(
+            f"{path:<8}{clients:>8}{result['throughput']:>10.1f}{result['p50']:>9.0f} ms"
+            f"{result['p99']:>9.0f} ms{result['errors']:>8}"
+        )
@@ -0,0 +1,175 @@
+"""
+Per-conversation memory for follow-up questions.
+
+Replaying a conversation's whole history makes every prompt, and the LLM
+latency with it, grow with the conversation. Instead each ``Conversation``
+keeps a rolling summary, and a prompt carries that summary plus the last
+RAG_MEMORY_RECENT_TURNS messages verbatim:
+
+- ``conversation_history`` renders that memory for the prompt. Each turn
+  is clipped to RAG_MEMORY_TURN_TOKENS and the summary never exceeds
+  RAG_MEMORY_SUMMARY_TOKENS, so the memory stays under a fixed token
+  bound however long the conversation gets.
+- ``remember_turn`` runs after every answer. Messages that have fallen
+  out of the recent window are folded into the summary, and the
+  conversation's ``summarized_through`` moves past them. Only the
+  messages since the last update are read, so the cost of a turn does
+  not depend on the conversation's length either.
+
+Summarizers (``RAG_MEMORY_SUMMARIZER``):
+    extractive  appends one clipped question/answer line per turn and
+                drops the oldest lines beyond the budget; no LLM call
+    llm         asks the service's LLM to fold the new turns into the
+                summary, falling back to extractive if the call fails
+"""
+import logging
+
+from django.conf import settings
+
+from .chunking import count_tokens, split_sentences, truncate_to_tokens
+from .models import ChatMessage, Conversation
+
+logger = logging.getLogger(__name__)
+
+SUMMARIZERS = ('extractive', 'llm')
+
+SUMMARY_TEMPLATE = """Update the running summary of a conversation between a user and an AI assistant with the new exchanges below. Keep the topics, names, facts and open questions a follow-up question might refer to. Reply with the updated summary only, in at most {max_words} words.
+
+Current summary:
+{summary}
+
+New exchanges:
+{turns}
+
+Updated summary:"""
+
+
+def _clip(text, max_tokens):
+    """Text cut to max_tokens, marked when cut"""
+    if count_tokens(text) <= max_tokens:
+        return text
+    return truncate_to_tokens(text, max_tokens) + ' ...'
+
+
+def _format_turn(question, answer, max_tokens):
+    """'User: ...\\nAssistant: ...' within max_tokens; the question gets at most half"""
+    question = _clip(question.strip(), max_tokens // 2)
+    answer = _clip(answer.strip(), max(1, max_tokens - count_tokens(question)))
+    return f"User: {question}\nAssistant: {answer}"
+
+
+def load_memory(conversation, before_id=None):
+    """
+    Summary and recent turns of a conversation.
+
+    Args:
+        before_id (int): Only use messages older than this one, e.g. the
+            queued message a background job is answering
+
+    Returns:
+        dict: {'summary': str, 'turns': [(user_message, ai_response), ...]} oldest turn first
+    """
+    messages = ChatMessage.objects.filter(
+        conversation_id=conversation.id,
+        status=ChatMessage.STATUS_COMPLETED,
+        id__gt=conversation.summarized_through
+    )
+    if before_id is not None:
+        messages = messages.filter(id__lt=before_id)
+    recent = settings.RAG_MEMORY_RECENT_TURNS
+    turns = list(messages.order_by('-id').values_list('user_message', 'ai_response')[:recent]) if recent else []
+    return {'summary': conversation.summary, 'turns': turns[::-1]}
+
+
+def format_memory(memory):
+    """Prompt section for a memory dict, or '' when there is nothing to remember"""
+    parts = []
+    if memory['summary']:
+        parts.append(f"Summary of earlier turns:\n{memory['summary']}")
+    parts.extend(
+        _format_turn(question, answer, settings.RAG_MEMORY_TURN_TOKENS)
+        for question, answer in memory['turns']
+    )
+    if not parts:
+        return ''
+    return "Conversation so far:\n" + "\n\n".join(parts)
+
+
+def conversation_history(conversation, before_id=None):
+    """Rendered memory of a conversation for the prompt ('' when memory is disabled)"""
+    if not settings.RAG_MEMORY_ENABLED or conversation is None:
+        return ''
+    return format_memory(load_memory(conversation, before_id))
+
+
+def extractive_summary(summary, turns, max_tokens):
+    """Previous summary plus one line per turn, oldest lines dropped to fit max_tokens"""
+    lines = summary.splitlines() if summary else []
+    for question, answer in turns:
+        sentences = split_sentences(answer)
+        lines.append(f"- Q: {_clip(question.strip(), 40)} A: {_clip(sentences[0] if sentences else '', 60)}")
+    while len(lines) > 1 and count_tokens('\n'.join(lines)) > max_tokens:
+        lines.pop(0)
+    return truncate_to_tokens('\n'.join(lines), max_tokens)
+
+
+def llm_summary(generate, summary, turns, max_tokens):
+    """
+    Summary rewritten by the LLM to cover the new turns.
+
+    Args:
+        generate (callable): prompt -> (text, True if the model produced it)
+    """
+    prompt = SUMMARY_TEMPLATE.format(
+        max_words=max(10, max_tokens * 3 // 4),
+        summary=summary or '(none)',
+        turns='\n\n'.join(_format_turn(q, a, settings.RAG_MEMORY_TURN_TOKENS) for q, a in turns)
+    )
+    text, generated = generate(prompt)
+    if not generated or not text.strip():
+        return extractive_summary(summary, turns, max_tokens)
+    return truncate_to_tokens(text.strip(), max_tokens)
+
+
+def remember_turn(conversation, rag_service=None):
+    """
+    Fold completed messages that left the recent window into the summary.
+
+    Called after a message is answered. The update is conditional on
+    ``summarized_through`` being unchanged, so when two requests of a
+    conversation finish together only one of them folds the turns.
+
+    Returns:
+        bool: True if the summary was updated
+    """
+    if not settings.RAG_MEMORY_ENABLED or conversation is None:
+        return False
+    try:
+        pending = list(ChatMessage.objects.filter(
+            conversation_id=conversation.id,
+            status=ChatMessage.STATUS_COMPLETED,
+            id__gt=conversation.summarized_through
+        ).order_by('id').values_list('id', 'user_message', 'ai_response'))
+        overflow = pending[:max(0, len(pending) - settings.RAG_MEMORY_RECENT_TURNS)]
+        if not overflow:
+            return False
+
+        turns = [(question, answer) for _, question, answer in overflow]
+        max_tokens = settings.RAG_MEMORY_SUMMARY_TOKENS
+        if settings.RAG_MEMORY_SUMMARIZER == 'llm' and rag_service is not None:
+            summary = llm_summary(rag_service.complete, conversation.summary, turns, max_tokens)
+        else:
+            summary = extractive_summary(conversation.summary, turns, max_tokens)
+
+        summarized_through = overflow[-1][0]
+        updated = Conversation.objects.filter(
+            id=conversation.id, summarized_through=conversation.summarized_through
+        ).update(summary=summary, summarized_through=summarized_through)
+        if updated:
+            conversation.summary = summary
+            conversation.summarized_through = summarized_through
+        return bool(updated)
+    except Exception as e:
+        # Memory is best effort; the answer has already been saved
+        logger.error(f"Could not update the summary of conversation {conversation.id}: {str(e)}")
+        return False
@@ -11,6 +11,12 @@ class Conversation(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    # Rolling memory for follow-up questions (see chat/memory.py): a summary
+    # of every completed message up to summarized_through (a message ID);
+    # later messages are sent to the LLM as they are
+    summary = models.TextField(blank=True)
+    summarized_through = models.PositiveBigIntegerField(default=0)
+    
     class Meta:
         ordering = ['-updated_at']
         verbose_name = 'Conversation'
@@ -24,12 +30,32 @@ class ChatMessage(models.Model):
     """
     Model to store chat messages between users and AI
     """
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_COMPLETED = 'completed'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_COMPLETED, 'Completed'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+    
     conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='messages')
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='chat_messages')
     user_message = models.TextField()
-    ai_response = models.TextField()
+    ai_response = models.TextField(blank=True)
     timestamp = models.DateTimeField(auto_now_add=True)
     
+    # Background chats (202 Accepted): the message row is the queued job
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_COMPLETED, db_index=True)
+    options = models.JSONField(default=dict, blank=True)
+    error = models.TextField(blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    started_at = models.DateTimeField(null=True, blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    latency = models.JSONField(null=True, blank=True)
+    
     class Meta:
         ordering = ['timestamp']
         verbose_name = 'Chat Message'
@@ -1,209 +1,1205 @@
+import asyncio
+import functools
+import importlib.util
 import os
-try:
-    import numpy as np
-    from sentence_transformers import SentenceTransformer
-    import faiss
-    FAISS_AVAILABLE = True
-except ImportError:
-    FAISS_AVAILABLE = False
-    print("⚠️  sentence-transformers or faiss not installed. Using simple keyword matching.")
-
-try:
-    import google.generativeai as genai
-    GEMINI_AVAILABLE = True
-except ImportError:
-    GEMINI_AVAILABLE = False
-    print("⚠️  google-generativeai not installed.")
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 from django.conf import settings
 
+from .fusion import FUSION_METHODS, fuse
+from . import response_cache
+from .chunking import count_tokens, get_chunker, split_paragraphs, truncate_to_tokens
+from .embeddings import backend_available
+from .lexical_index import BM25Index
+from .llm import FakeLLM, GeminiClient
+from .query_cache import LRUCache, normalize_query
+from .reranking import rerank
+
+
+def _module_available(name):
+    """Whether a module is installed, found without importing it"""
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+# numpy, faiss, the embedding backend (torch or onnxruntime) and
+# google-generativeai take seconds and hundreds of MB to import, so they
+# are only imported when the service initializes.
+# Views, management commands and auth-only requests that never touch the
+# RAG service skip them.
+FAISS_AVAILABLE = all(_module_available(name) for name in ('numpy', 'faiss'))
+GEMINI_AVAILABLE = _module_available('google.generativeai')
+
+
+def _import_dense_stack():
+    """(embedding backend, KnowledgeIndex, MicroBatcher), or None if they fail to load"""
+    try:
+        from .batching import MicroBatcher
+        from .embeddings import load_embedding_backend
+        from .knowledge_index import KnowledgeIndex
+        
+        print(f"📦 Loading {settings.RAG_EMBEDDING_BACKEND} embedding backend...")
+        model = load_embedding_backend()
+    except (ImportError, OSError) as e:
+        print(f"⚠️  Could not load the {settings.RAG_EMBEDDING_BACKEND} embedding backend or faiss ({str(e)}). "
+              f"Using simple keyword matching.")
+        return None
+    return model, KnowledgeIndex, MicroBatcher
+
+
+def _load_reranker():
+    """The RAG_RERANKER cross-encoder, or None if it fails to load"""
+    from .reranking import load_reranker
+    
+    try:
+        print(f"📦 Loading {settings.RAG_RERANKER} reranker...")
+        return load_reranker(
+            settings.RAG_RERANKER, settings.RAG_RERANKER_MODEL, settings.RAG_FAKE_RERANKER_DELAY_MS
+        )
+    except (ImportError, OSError) as e:
+        print(f"⚠️  Could not load the {settings.RAG_RERANKER} reranker ({str(e)}). Keeping retrieval order.")
+        return None
+
+
+def _create_gemini_client():
+    """The process's Gemini client, or None if it cannot be created"""
+    api_key = os.getenv('GEMINI_API_KEY')
+    if not api_key:
+        print("⚠️  GEMINI_API_KEY not found in environment variables")
+        return None
+    if settings.RAG_GEMINI_TRANSPORT == 'sdk' and not GEMINI_AVAILABLE:
+        print("⚠️  google-generativeai not installed. Set RAG_GEMINI_TRANSPORT=rest to call the REST API directly.")
+        return None
+    client = GeminiClient(
+        api_key,
+        settings.RAG_GEMINI_MODEL,
+        transport=settings.RAG_GEMINI_TRANSPORT,
+        api_base=settings.RAG_GEMINI_API_BASE,
+        max_output_tokens=settings.RAG_GEMINI_MAX_OUTPUT_TOKENS,
+        temperature=settings.RAG_GEMINI_TEMPERATURE,
+        pool_size=settings.RAG_GEMINI_POOL_SIZE,
+        timeout=settings.RAG_GEMINI_TIMEOUT
+    )
+    print(f"✅ Gemini client ready ({settings.RAG_GEMINI_MODEL}, {settings.RAG_GEMINI_TRANSPORT} transport)")
+    return client
+
+RETRIEVAL_MODES = ('dense', 'lexical', 'hybrid')
+
+# Collection IDs name index directories, so no separators or leading dots
+COLLECTION_ID_PATTERN = re.compile(r'^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$')
+
+# Bump whenever _construct_prompt changes so cached answers are not reused
+PROMPT_TEMPLATE_VERSION = 4
+
+PROMPT_TEMPLATE = """You are a helpful AI assistant. Use the following context to answer the question. If the answer is not in the context, say so and provide a general answer.
+{history}
+Context:
+{context}
+
+Question: {query}
+
+Answer:"""
+
+PROMPT_TEMPLATE_TOKENS = count_tokens(PROMPT_TEMPLATE.format(history='', context='', query=''))
+
+
+def _fit_history(history, max_tokens):
+    """Conversation memory cut to max_tokens by dropping its oldest lines first"""
+    lines = history.splitlines()
+    while len(lines) > 1 and count_tokens('\n'.join(lines)) > max_tokens:
+        lines.pop(0)
+    return truncate_to_tokens('\n'.join(lines), max(0, max_tokens))
+
+
+def _elapsed_ms(start):
+    return round((time.perf_counter() - start) * 1000, 2)
+
+
+class UnknownCollection(LookupError):
+    """A collection that has no index yet"""
+
+
+def collection_index_dir(collection):
+    """Index directory of a collection; the default collection keeps RAG_INDEX_DIR"""
+    if collection == settings.RAG_DEFAULT_COLLECTION:
+        return settings.RAG_INDEX_DIR
+    if not COLLECTION_ID_PATTERN.match(collection):
+        raise ValueError(f"Invalid collection ID '{collection}'")
+    return os.path.join(settings.RAG_COLLECTIONS_DIR, collection)
+
+
+def list_collections():
+    """IDs of the default collection and every collection with an index on disk"""
+    try:
+        names = [
+            name for name in os.listdir(settings.RAG_COLLECTIONS_DIR)
+            if COLLECTION_ID_PATTERN.match(name) and os.path.isdir(os.path.join(settings.RAG_COLLECTIONS_DIR, name))
+        ]
+    except OSError:
+        names = []
+    return [settings.RAG_DEFAULT_COLLECTION] + sorted(set(names) - {settings.RAG_DEFAULT_COLLECTION})
+
+
+# The embedding backend, query encoder, thread pools and query embedding
+# cache are the same for every collection, so each process holds one
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def _shared_resource(name, factory):
+    """Per-process instance of something all collections' services use, created on first request"""
+    with _shared_lock:
+        if name not in _shared:
+            _shared[name] = factory()
+        return _shared[name]
+
+
+def split_into_chunks(content):
+    """Split document text into chunks (token-budgeted windows, or paragraphs with RAG_CHUNKER=paragraph)"""
+    chunker = get_chunker()
+    if chunker is None:
+        return split_paragraphs(content)
+    return [chunk['text'] for chunk in chunker.chunk_text(content)]
+
 
 class RAGService:
     """
     Retrieval-Augmented Generation (RAG) Service
     
     Uses FAISS for vector search and Google Generative AI for response generation.
+    One service serves one collection: the default collection indexes
+    RAG_KNOWLEDGE_BASE_PATH in RAG_INDEX_DIR, others hold only documents
+    ingested into them and live under RAG_COLLECTIONS_DIR.
     """
     
-    def __init__(self):
+    def __init__(self, collection=None):
+        self.collection = collection or settings.RAG_DEFAULT_COLLECTION
+        self.index_dir = collection_index_dir(self.collection)
         self.model = None
+        self.query_encoder = None
+        self.reranker = None
+        self._rerank_pool = None
+        self.rerank_stats = {'reranked': 0, 'fallbacks': 0}
+        self.diversity_stats = {'diversified': 0, 'duplicates_dropped': 0}
+        self.llm = None
         self.index = None
+        self.lexical_index = None
         self.knowledge_base = []
+        self.document_id = None
         self.initialized = False
+        # initialize() runs once; concurrent first requests wait for it
+        self._init_lock = threading.Lock()
+        self._warmup_thread = None
+        self.init_error = None
+        self.startup = {}
+        self._last_refresh = 0.0
+        # Runs the dense half of a hybrid search alongside the lexical half
+        self._retrieval_pool = _shared_resource(
+            'retrieval_pool', lambda: ThreadPoolExecutor(max_workers=4, thread_name_prefix='rag-retrieval')
+        )
+        # Bounded pool for CPU-bound work (encoding, search) on the async path
+        self._blocking_pool = _shared_resource('blocking_pool', lambda: ThreadPoolExecutor(
+            max_workers=settings.RAG_ASYNC_EXECUTOR_WORKERS, thread_name_prefix='rag-blocking'
+        ))
+        # Per-worker caches; search results are only valid for one KB version.
+        # Query embeddings do not depend on the collection and are shared.
+        self.embedding_cache = _shared_resource('embedding_cache', lambda: LRUCache(
+            settings.RAG_QUERY_EMBEDDING_CACHE_BYTES, ttl=settings.RAG_QUERY_CACHE_TTL
+        ))
+        self.result_cache = LRUCache(
+            settings.RAG_SEARCH_RESULT_CACHE_BYTES, ttl=settings.RAG_QUERY_CACHE_TTL
+        )
+        self._result_cache_version = None
+        # Set by ServiceRegistry to re-check its memory budget once the index is loaded or grows
+        self.on_index_resized = None
+        self.semantic_cache = None
+        if settings.RAG_SEMANTIC_CACHE_ENABLED:
+            from .semantic_cache import SemanticCache
+            self.semantic_cache = SemanticCache(
+                max_entries=settings.RAG_SEMANTIC_CACHE_MAX_ENTRIES,
+                threshold=settings.RAG_SEMANTIC_CACHE_THRESHOLD,
+                ttl=settings.RAG_SEMANTIC_CACHE_TTL
+            )
         
+    @property
+    def embedding_name(self):
+        """Vector space of query and chunk embeddings (model and backend), for cache keys"""
+        return self.model.name if self.model is not None else settings.RAG_EMBEDDING_MODEL
+    
+    @property
+    def reranker_name(self):
+        """Cross-encoder that orders results, or None; part of result cache keys"""
+        return self.reranker.name if self.reranker is not None else None
+    
+    @property
+    def ranking_key(self):
+        """Post-retrieval settings that decide which chunks are kept; part of result cache keys"""
+        diversity = None
+        if settings.RAG_MMR_ENABLED:
+            diversity = (settings.RAG_MMR_CANDIDATES, settings.RAG_MMR_LAMBDA, settings.RAG_DUPLICATE_THRESHOLD)
+        return (self.reranker_name, diversity)
+    
+    @property
+    def kb_version(self):
+        """Version of the indexed knowledge base (changes on every ingestion)"""
+        return self.index.version if self.index is not None else None
+    
     def initialize(self):
-        """Initialize the RAG service with embeddings and FAISS index"""
+        """Initialize the RAG service with embeddings and FAISS index (once; other callers wait)"""
         if self.initialized:
             return
         
-        print("🔧 Initializing RAG Service...")
+        with self._init_lock:
+            if self.initialized:
+                return
+            start = time.perf_counter()
+            try:
+                self._initialize()
+            except Exception as e:
+                self.init_error = str(e)
+                raise
+            self.init_error = None
+            self.startup['initialize_ms'] = _elapsed_ms(start)
+            self.startup['initialized_at'] = time.time()
+            self.initialized = True
+        # The index size is only known now that its snapshot is loaded
+        self._index_resized()
+    
+    def _index_resized(self):
+        if self.on_index_resized is not None:
+            self.on_index_resized(self)
+    
+    def warm_up(self):
+        """Start initialize() on a background thread unless it has run or is running"""
+        with self._init_lock:
+            if self.initialized or (self._warmup_thread is not None and self._warmup_thread.is_alive()):
+                return
+            self._warmup_thread = threading.Thread(target=self._warm_up, name='rag-warmup', daemon=True)
+            self._warmup_thread.start()
+    
+    def _warm_up(self):
+        try:
+            self.initialize()
+        except Exception as e:
+            print(f"❌ RAG warm-up failed: {str(e)}")
+    
+    def readiness(self):
+        """Startup state for the readiness probe"""
+        if self.initialized:
+            state = 'ready'
+        elif self.init_error:
+            state = 'error'
+        else:
+            state = 'starting'
+        info = {'status': state, 'ready': self.initialized, 'collection': self.collection}
+        if self.init_error:
+            info['error'] = self.init_error
+        info.update(self.startup)
+        if self.initialized:
+            info['kb_version'] = self.kb_version
+            info['index_size'] = len(self.knowledge_base)
+            if self.index is not None:
+                info['index_type'] = self.index.stats()['index_type']
+            info['llm_backend'] = settings.RAG_LLM_BACKEND
+        return info
+    
+    def _initialize(self):
+        print(f"🔧 Initializing RAG Service (collection '{self.collection}')...")
         
         # Load knowledge base
-        self._load_knowledge_base()
+        start = time.perf_counter()
+        sources = {}
+        if self.collection == settings.RAG_DEFAULT_COLLECTION:
+            self._load_knowledge_base()
+            sources[self.document_id] = self.knowledge_base
+        self.startup['knowledge_base_ms'] = _elapsed_ms(start)
         
-        if FAISS_AVAILABLE:
-            # Initialize embedding model
-            print("📦 Loading SentenceTransformer model...")
-            self.model = SentenceTransformer('all-MiniLM-L6-v2')
+        dense_available = FAISS_AVAILABLE and backend_available(settings.RAG_EMBEDDING_BACKEND)
+        start = time.perf_counter()
+        dense_stack = _shared_resource('dense_stack', _import_dense_stack) if dense_available else None
+        if dense_stack is not None:
+            self.model, KnowledgeIndex, MicroBatcher = dense_stack
+            self.startup['model_load_ms'] = _elapsed_ms(start)
+            self.startup['embedding_backend'] = self.model.name
+            if settings.RAG_ENCODER_BATCHING:
+                self.query_encoder = _shared_resource('query_encoder', lambda: MicroBatcher(
+                    self.model.encode,
+                    max_batch_size=settings.RAG_ENCODER_MAX_BATCH,
+                    max_wait_ms=settings.RAG_ENCODER_MAX_WAIT_MS
+                ))
             
-            # Create embeddings
-            print("🧠 Creating embeddings...")
-            embeddings = self.model.encode(self.knowledge_base)
-            
-            # Create FAISS index
-            print("📊 Building FAISS index...")
-            dimension = embeddings.shape[1]
-            self.index = faiss.IndexFlatL2(dimension)
-            self.index.add(embeddings.astype('float32'))
-            print("✅ FAISS index created")
+            # Load the index snapshot and journal, or build it from cached embeddings
+            print("📊 Loading FAISS index...")
+            start = time.perf_counter()
+            self.index, info = KnowledgeIndex.open(
+                self.index_dir,
+                self.model.name,
+                self.model.encode,
+                sources=sources,
+                layout=settings.RAG_INDEX_LAYOUT,
+                compaction_threshold=settings.RAG_COMPACTION_THRESHOLD,
+                max_pending_chunks=settings.RAG_MAX_PENDING_CHUNKS,
+                index_type=settings.RAG_INDEX_TYPE,
+                index_params=settings.RAG_INDEX_PARAMS,
+                storage=settings.RAG_EMBEDDING_STORAGE,
+                rescore_factor=settings.RAG_RESCORE_FACTOR
+            )
+            self.startup['index_load_ms'] = _elapsed_ms(start)
+            self.startup['index_source'] = info['source']
+            # Chunks are now served from the index (mapped, not copied)
+            self.knowledge_base = self.index
+            self._last_refresh = time.monotonic()
+            if info['source'] == 'built':
+                print(
+                    f"✅ FAISS index built in {info['elapsed_ms']}ms "
+                    f"({info['cache_misses']} chunks encoded, {info['cache_hits']} from cache)"
+                )
+            else:
+                print(
+                    f"✅ FAISS index loaded from snapshot {info['kb_version']} "
+                    f"in {info['elapsed_ms']}ms ({info['layout']} layout, "
+                    f"{info['cache_misses']} chunks re-encoded)"
+                )
+            if settings.RAG_RETRIEVAL_MODE != 'dense':
+                self.index.search_lexical('', 1)
+                print(f"✅ BM25 index built ({self.index.stats()['lexical_terms']} terms)")
         else:
-            print("⚠️  Using simple keyword search (FAISS not available)")
+            if not dense_available:
+                print(f"⚠️  faiss or the {settings.RAG_EMBEDDING_BACKEND} embedding backend is not installed.")
+            print("⚠️  Using BM25 keyword search (FAISS not available)")
+            start = time.perf_counter()
+            self.lexical_index = BM25Index.build(enumerate(self.knowledge_base))
+            self.startup['index_load_ms'] = _elapsed_ms(start)
+            self.startup['index_source'] = 'bm25'
+            print(
+                f"✅ BM25 index built in {(time.perf_counter() - start) * 1000:.0f}ms "
+                f"({self.lexical_index.vocabulary_size} terms)"
+            )
+        
+        if settings.RAG_RERANKER:
+            start = time.perf_counter()
+            self.reranker = _shared_resource('reranker', _load_reranker)
+            if self.reranker is not None:
+                self._rerank_pool = _shared_resource('rerank_pool', lambda: ThreadPoolExecutor(
+                    max_workers=settings.RAG_RERANK_WORKERS, thread_name_prefix='rag-rerank'
+                ))
+                self.startup['reranker_load_ms'] = _elapsed_ms(start)
+                print(f"✅ Re-ranking {settings.RAG_RERANK_CANDIDATES} candidates with {self.reranker.name}")
         
             # Configure Gemini API
-        if GEMINI_AVAILABLE:
-            api_key = os.getenv('GEMINI_API_KEY')
-            if api_key:
-                genai.configure(api_key=api_key)
-                print("✅ Gemini API configured")
-            else:
-                print("⚠️  GEMINI_API_KEY not found in environment variables")
+        if settings.RAG_LLM_BACKEND == 'fake':
+            self.llm = FakeLLM(
+                token_delay_ms=settings.RAG_FAKE_LLM_TOKEN_DELAY_MS,
+                prompt_delay_ms=settings.RAG_FAKE_LLM_PROMPT_DELAY_MS
+            )
+            print("⚠️  Using fake LLM backend (RAG_LLM_BACKEND=fake)")
+        else:
+            # One client per process, shared by every collection
+            self.llm = _shared_resource('gemini_client', _create_gemini_client)
         
         print("✅ RAG Service initialized successfully!")
-        self.initialized = True
     
     def _load_knowledge_base(self):
         """Load knowledge base from text file"""
-        kb_path = os.path.join(settings.BASE_DIR, 'knowledge_base.txt')
+        kb_path = settings.RAG_KNOWLEDGE_BASE_PATH
         
         if not os.path.exists(kb_path):
             raise FileNotFoundError(f"Knowledge base not found at {kb_path}")
         
-        with open(kb_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        # Split into chunks (paragraphs)
-        self.knowledge_base = [
-            chunk.strip() 
-            for chunk in content.split('\n\n') 
-            if chunk.strip()
-        ]
+        chunker = get_chunker()
+        if chunker is None:
+            with open(kb_path, 'r', encoding='utf-8') as f:
+                content = f.read()
+            
+            # Split into chunks (paragraphs)
+            self.knowledge_base = split_paragraphs(content)
+        else:
+            # Streamed line by line, so the file is never held in memory whole
+            self.knowledge_base = [chunk['text'] for chunk in chunker.chunk_file(kb_path)]
+        self.document_id = os.path.basename(kb_path)
         
         print(f"📚 Loaded {len(self.knowledge_base)} chunks from knowledge base")
     
-    def _search_faiss(self, query, top_k=3):
-        """Search FAISS index for relevant context"""
+    def _refresh_index(self):
+        """Apply index changes made by other processes (throttled)"""
+        now = time.monotonic()
+        if now - self._last_refresh >= settings.RAG_INDEX_REFRESH_SECONDS:
+            self._last_refresh = now
+            if self.index.refresh():
+                self._index_resized()
+    
+    def _search_faiss(self, query, top_k=3, mode=None, fusion=None, timings=None):
+        """
+        Search the knowledge base for relevant context
+        
+        Args:
+            query (str): User's question
+            top_k (int): Number of chunks to return
+            mode (str): 'dense', 'lexical' or 'hybrid' (default: RAG_RETRIEVAL_MODE)
+            fusion (str): Hybrid fusion method, 'rrf' or 'weighted' (default: RAG_FUSION_METHOD)
+            timings (dict): Filled with per-stage latencies in milliseconds
+            
+        Returns:
+            list: Relevant chunks as {'text', 'tokens'} dicts, best first
+        """
         if not self.initialized:
             self.initialize()
         
+        timings = {} if timings is None else timings
+        mode = mode or settings.RAG_RETRIEVAL_MODE
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode '{mode}'. Choose: {', '.join(RETRIEVAL_MODES)}")
+        
+        start = time.perf_counter()
         if FAISS_AVAILABLE and self.index is not None:
-            # Encode query
-            query_embedding = self.model.encode([query])
+            self._refresh_index()
             
-            # Search FAISS index
-            distances, indices = self.index.search(
-                query_embedding.astype('float32'), 
-                top_k
+            # Results depend on the indexed chunks: start over when the KB changes
+            version = self.kb_version
+            if version != self._result_cache_version:
+                self.result_cache.clear()
+                self._result_cache_version = version
+            fusion = (fusion or settings.RAG_FUSION_METHOD) if mode == 'hybrid' else None
+            cache_key = (version, mode, fusion, self.ranking_key, top_k, normalize_query(query))
+            
+            shared_key = response_cache.make_key(
+                'context', query, self.collection, version, self.embedding_name, mode, fusion,
+                *self.ranking_key, top_k
             )
             
-            # Get relevant chunks
-            relevant_chunks = [
-                self.knowledge_base[idx] 
-                for idx in indices[0] 
-                if idx < len(self.knowledge_base)
-            ]
+            relevant_chunks = self.result_cache.get(cache_key)
+            if relevant_chunks is None:
+                relevant_chunks = response_cache.cache_get(shared_key)
+                if relevant_chunks is not None:
+                    self.result_cache.put(cache_key, relevant_chunks)
+            if relevant_chunks is not None:
+                timings['search_cache_ms'] = _elapsed_ms(start)
+            else:
+                candidates = self._candidate_count(top_k)
+                if mode == 'dense':
+                    hits = self._dense_search(query, candidates, timings)
+                elif mode == 'lexical':
+                    hits = self._lexical_search(query, candidates, timings)
+                else:
+                    hits = self._hybrid_search(query, candidates, fusion, timings)
+                # With diversification on, MMR picks the top_k from every re-ranked candidate
+                keep = candidates if settings.RAG_MMR_ENABLED else top_k
+                hits, reranked = self._rerank(query, hits, keep, timings)
+                hits = self._diversify(query, hits, top_k, timings)
+                relevant_chunks = self._context_chunks(hits)
+                # Results that missed the re-ranking budget are not cached, so the next request retries
+                if reranked:
+                    self.result_cache.put(cache_key, relevant_chunks)
+                    response_cache.cache_set(shared_key, relevant_chunks)
+            relevant_chunks = list(relevant_chunks)
         else:
-            # Fallback: Simple keyword matching
-            relevant_chunks = self._simple_search(query, top_k)
+            # Fallback: BM25 keyword search
+            hits = [{'text': text} for text in self._simple_search(query, self._candidate_count(top_k))]
+            timings['lexical_search_ms'] = _elapsed_ms(start)
+            hits, _ = self._rerank(query, hits, top_k, timings)
+            relevant_chunks = [{'text': hit['text'], 'tokens': count_tokens(hit['text'])} for hit in hits]
         
+        timings['retrieval_ms'] = _elapsed_ms(start)
         return relevant_chunks
     
+    def _context_chunks(self, hits):
+        """{'text', 'tokens'} of index hits, with the token counts stored at ingestion"""
+        counts = self.index.token_counts([hit['id'] for hit in hits])
+        return [
+            {'text': hit['text'], 'tokens': count_tokens(hit['text']) if count is None else count}
+            for hit, count in zip(hits, counts)
+        ]
+    
+    def _candidate_count(self, top_k):
+        """Hits to retrieve: over-fetch when a reranker or MMR picks the best top_k of them"""
+        candidates = top_k
+        if self.reranker is not None:
+            candidates = max(candidates, settings.RAG_RERANK_CANDIDATES)
+        if settings.RAG_MMR_ENABLED:
+            candidates = max(candidates, settings.RAG_MMR_CANDIDATES)
+        return candidates
+    
+    def _rerank(self, query, hits, top_k, timings):
+        """
+        Keep the top_k hits by cross-encoder score
+        
+        Returns:
+            tuple: (hits, False if the budget ran out and the hits keep retrieval order)
+        """
+        if self.reranker is None:
+            return hits[:top_k], True
+        
+        start = time.perf_counter()
+        hits, completed = rerank(
+            self.reranker, query, hits, top_k, self._rerank_pool,
+            budget_ms=settings.RAG_RERANK_BUDGET_MS,
+            batch_size=settings.RAG_RERANK_BATCH_SIZE
+        )
+        if completed:
+            timings['rerank_ms'] = _elapsed_ms(start)
+            self.rerank_stats['reranked'] += 1
+        else:
+            timings['rerank_fallback_ms'] = _elapsed_ms(start)
+            self.rerank_stats['fallbacks'] += 1
+        return hits, completed
+    
+    def _diversify(self, query, hits, top_k, timings):
+        """Pick top_k of the hits by Maximal Marginal Relevance, dropping near-duplicates"""
+        if not settings.RAG_MMR_ENABLED or len(hits) <= 1:
+            return hits[:top_k]
+        from .diversity import mmr, relevance_scores
+        
+        start = time.perf_counter()
+        try:
+            vectors = self.index.vectors([hit['id'] for hit in hits])
+        except (KeyError, OSError):
+            # A candidate was deleted since the search, or a compaction pruned
+            # the snapshot its embeddings are read from; keep the ranking as it is
+            return hits[:top_k]
+        selected, duplicates = mmr(
+            vectors,
+            relevance_scores(hits, vectors, lambda: self.encode_query(query)),
+            top_k,
+            lambda_=settings.RAG_MMR_LAMBDA,
+            duplicate_threshold=settings.RAG_DUPLICATE_THRESHOLD
+        )
+        timings['diversify_ms'] = _elapsed_ms(start)
+        self.diversity_stats['diversified'] += 1
+        self.diversity_stats['duplicates_dropped'] += duplicates
+        return [hits[i] for i in selected]
+    
+    def _dense_search(self, query, top_k, timings):
+        """Embedding search; returns hits with 'id', 'distance' and 'text'"""
+        start = time.perf_counter()
+        query_embedding = self.encode_query(query)
+        timings['query_encoding_ms'] = _elapsed_ms(start)
+        
+        hits = self.index.search(query_embedding, top_k)[0]
+        timings['dense_search_ms'] = _elapsed_ms(start)
+        return hits
+    
+    def encode_query(self, query):
+        """Embedding of a query, served from the in-process cache when possible"""
+        key = (self.embedding_name, normalize_query(query))
+        embedding = self.embedding_cache.get(key)
+        if embedding is None:
+            if self.query_encoder is not None:
+                embedding = self.query_encoder.encode(query)
+            else:
+                embedding = self.model.encode([query])
+            embedding.setflags(write=False)
+            self.embedding_cache.put(key, embedding)
+        return embedding
+    
+    def _lexical_search(self, query, top_k, timings):
+        """BM25 search; returns hits with 'id', 'score' and 'text'"""
+        start = time.perf_counter()
+        hits = self.index.search_lexical(query, top_k)
+        timings['lexical_search_ms'] = _elapsed_ms(start)
+        return hits
+    
+    def _hybrid_search(self, query, top_k, fusion, timings):
+        """Run dense and lexical search concurrently and fuse their rankings"""
+        fusion = fusion or settings.RAG_FUSION_METHOD
+        if fusion not in FUSION_METHODS:
+            raise ValueError(f"Unknown fusion method '{fusion}'. Choose: {', '.join(FUSION_METHODS)}")
+        
+        candidates = max(top_k, settings.RAG_HYBRID_CANDIDATES)
+        dense_future = self._retrieval_pool.submit(self._dense_search, query, candidates, timings)
+        lexical_hits = self._lexical_search(query, candidates, timings)
+        dense_hits = dense_future.result()
+        
+        start = time.perf_counter()
+        fused = fuse(
+            dense_hits,
+            lexical_hits,
+            method=fusion,
+            rrf_k=settings.RAG_RRF_K,
+            dense_weight=settings.RAG_HYBRID_DENSE_WEIGHT
+        )
+        timings['fusion_ms'] = _elapsed_ms(start)
+        return fused[:top_k]
+    
     def _simple_search(self, query, top_k=3):
-        """Simple keyword-based search fallback"""
-        query_lower = query.lower()
-        query_words = set(query_lower.split())
-        
-        # Score each chunk by keyword overlap
-        scored_chunks = []
-        for chunk in self.knowledge_base:
-            chunk_lower = chunk.lower()
-            chunk_words = set(chunk_lower.split())
-            
-            # Calculate overlap score
-            overlap = len(query_words & chunk_words)
-            if overlap > 0 or any(word in chunk_lower for word in query_words):
-                scored_chunks.append((chunk, overlap))
+        """BM25 keyword search fallback"""
+        if self.lexical_index is None:
+            self.lexical_index = BM25Index.build(enumerate(self.knowledge_base))
         
-        # Sort by score and return top K
-        scored_chunks.sort(key=lambda x: x[1], reverse=True)
-        return [chunk for chunk, score in scored_chunks[:top_k]]
+        hits = self.lexical_index.search(query, top_k)
+        return [self.knowledge_base[position] for position, score in hits]
     
-    def _construct_prompt(self, query, context_chunks):
-        """Construct prompt with context for the LLM"""
-        context = "\n\n".join(context_chunks)
+    def _construct_prompt(self, query, context_chunks, timings=None, history=''):
+        """
+        Construct prompt with context for the LLM, within RAG_PROMPT_TOKEN_BUDGET
         
-        prompt = f"""You are a helpful AI assistant. Use the following context to answer the question. If the answer is not in the context, say so and provide a general answer.
-
-Context:
-{context}
-
-Question: {query}
-
-Answer:"""
+        The template, the conversation history, the question and
+        RAG_ANSWER_TOKEN_RESERVE tokens for the answer are set aside first. Context chunks then go in best first
+        while they fit; the first one that does not fit is cut to the tokens
+        left if that keeps at least RAG_MIN_CONTEXT_CHUNK_TOKENS of it, and
+        the chunks after it are dropped. A budget too small for the history
+        drops its oldest lines, and then cuts the question.
+        
+        Args:
+            context_chunks (list): {'text', 'tokens'} dicts, best first
+            timings (dict): Given the token counts of each part under 'tokens'
+            history (str): Conversation memory (see chat/memory.py), bounded by its own settings
+        """
+        budget = settings.RAG_PROMPT_TOKEN_BUDGET
+        if budget:
+            fixed = budget - settings.RAG_ANSWER_TOKEN_RESERVE - PROMPT_TEMPLATE_TOKENS
+            if count_tokens(history) + count_tokens(query) > fixed:
+                query = truncate_to_tokens(query, max(0, fixed))
+                history = _fit_history(history, fixed - count_tokens(query))
+        query_tokens = count_tokens(query)
+        history_tokens = count_tokens(history)
+        available = (
+            budget - settings.RAG_ANSWER_TOKEN_RESERVE - PROMPT_TEMPLATE_TOKENS - history_tokens - query_tokens
+        )
         
-        return prompt
+        texts = []
+        context_tokens = 0
+        truncated = 0
+        for chunk in context_chunks:
+            if not budget or chunk['tokens'] <= available - context_tokens:
+                texts.append(chunk['text'])
+                context_tokens += chunk['tokens']
+                continue
+            remaining = available - context_tokens
+            if remaining >= settings.RAG_MIN_CONTEXT_CHUNK_TOKENS:
+                text = truncate_to_tokens(chunk['text'], remaining)
+                texts.append(text)
+                context_tokens += count_tokens(text)
+                truncated = 1
+            break
+        
+        if timings is not None:
+            timings['tokens'] = {
+                'budget': budget,
+                'template': PROMPT_TEMPLATE_TOKENS,
+                'history': history_tokens,
+                'question': query_tokens,
+                'context': context_tokens,
+                'prompt': PROMPT_TEMPLATE_TOKENS + history_tokens + query_tokens + context_tokens,
+                'answer_reserve': settings.RAG_ANSWER_TOKEN_RESERVE,
+                'retrieved_chunks': len(context_chunks),
+                'context_chunks': len(texts),
+                'truncated_chunks': truncated,
+                'dropped_chunks': len(context_chunks) - len(texts),
+            }
+        
+        return PROMPT_TEMPLATE.format(
+            history=f"\n{history}\n" if history else '', context="\n\n".join(texts), query=query
+        )
+    
+    def complete(self, prompt):
+        """
+        Answer a free-form prompt with the configured LLM, without retrieval
+        
+        Returns:
+            tuple: (text, True if it came from the model rather than a fallback)
+        """
+        if not self.initialized:
+            self.initialize()
+        return self._generate(prompt)
     
     def _call_gemini(self, prompt):
         """Call Google Gemini API to get response"""
-        if not GEMINI_AVAILABLE:
-            # Fallback: Return context-based response
-            return "Gemini API not available. Based on the knowledge base: " + prompt.split("Context:")[1].split("Question:")[0][:500] if "Context:" in prompt else "AI service not configured."
+        return self._generate(prompt)[0]
+    
+    def _generate(self, prompt):
+        """
+        Generate an answer with Gemini
+        
+        Returns:
+            tuple: (response text, True if it came from the model rather than a fallback)
+        """
+        if self.llm is None:
+            return self._fallback_response(prompt, available=False), False
         
         try:
-            model = genai.GenerativeModel('gemini-2.5-flash')
-            response = model.generate_content(prompt)
-            return response.text
+            return self.llm.generate(prompt), True
         except Exception as e:
             print(f"❌ Error calling Gemini API: {str(e)}")
-            # Fallback: Extract context from prompt
-            if "Context:" in prompt:
-                context = prompt.split("Context:")[1].split("Question:")[0].strip()
-                return f"Based on available information: {context[:500]}..."
-            return "I apologize, but I encountered an error while generating a response. Please ensure GEMINI_API_KEY is configured."
+            return self._fallback_response(prompt), False
     
-    def get_response(self, query):
+    def _generate_stream(self, prompt, outcome):
+        """
+        Stream an answer from Gemini as text pieces
+        
+        Sets outcome['generated'] to False when a fallback answer is
+        produced or the model fails, and outcome['error'] when it fails
+        part-way through, after some of the answer was sent.
+        """
+        outcome['generated'] = True
+        if self.llm is None:
+            outcome['generated'] = False
+            yield self._fallback_response(prompt, available=False)
+            return
+        
+        emitted = False
+        try:
+            for piece in self.llm.stream(prompt):
+                emitted = True
+                yield piece
+        except Exception as e:
+            print(f"❌ Error streaming from Gemini API: {str(e)}")
+            outcome['generated'] = False
+            if emitted:
+                outcome['error'] = str(e)
+            else:
+                yield self._fallback_response(prompt)
+    
+    async def _agenerate(self, prompt):
+        """Async variant of _generate; with the SDK transport it waits on the network without holding a thread"""
+        if self.llm is None:
+            return self._fallback_response(prompt, available=False), False
+        
+        try:
+            return await self.llm.agenerate(prompt), True
+        except Exception as e:
+            print(f"❌ Error calling Gemini API: {str(e)}")
+            return self._fallback_response(prompt), False
+    
+    @staticmethod
+    def _fallback_response(prompt, available=True):
+        """Context-based answer used when Gemini cannot be called"""
+        if not available:
+            # Fallback: Return context-based response
+            return "Gemini API not available. Based on the knowledge base: " + prompt.split("Context:")[1].split("Question:")[0][:500] if "Context:" in prompt else "AI service not configured."
+        
+        # Fallback: Extract context from prompt
+        if "Context:" in prompt:
+            context = prompt.split("Context:")[1].split("Question:")[0].strip()
+            return f"Based on available information: {context[:500]}..."
+        return "I apologize, but I encountered an error while generating a response. Please ensure GEMINI_API_KEY is configured."
+    
+    def get_index(self):
+        """Initialized knowledge index (requires sentence-transformers and faiss)"""
+        if not self.initialized:
+            self.initialize()
+        if self.index is None:
+            raise RuntimeError('Knowledge base ingestion requires sentence-transformers and faiss')
+        return self.index
+    
+    def upsert_document(self, document_id, text):
+        """
+        Add a document, or replace its content if it already exists
+        
+        Only new or edited chunks are embedded; unchanged chunks keep their IDs.
+        
+        Returns:
+            dict: counts of added, deleted, unchanged and encoded chunks
+        """
+        chunker = get_chunker()
+        if chunker is None:
+            result = self.get_index().upsert_document(document_id, split_paragraphs(text))
+        else:
+            chunks = chunker.chunk_text(text)
+            result = self.get_index().upsert_document(
+                document_id,
+                [chunk['text'] for chunk in chunks],
+                sections=[chunk['section'] for chunk in chunks]
+            )
+        self._index_resized()
+        return result
+    
+    def add_chunks(self, document_id, chunks):
+        """Append chunks to a document; returns their stable chunk IDs"""
+        ids = self.get_index().add_chunks(document_id, list(chunks))
+        self._index_resized()
+        return ids
+    
+    def update_chunk(self, chunk_id, text):
+        """Replace the text of a chunk, keeping its ID"""
+        self.get_index().update_chunk(chunk_id, text)
+    
+    def delete_chunks(self, chunk_ids):
+        """Delete chunks by ID; returns how many were deleted"""
+        return self.get_index().delete_chunks(list(chunk_ids))
+    
+    def delete_document(self, document_id):
+        """Delete a document and its chunks; returns how many chunks were deleted"""
+        return self.get_index().delete_document(document_id)
+    
+    def compact_index(self):
+        """Write a new snapshot without deleted chunks"""
+        return self.get_index().compact()
+    
+    def memory_bytes(self):
+        """Approximate memory of this collection's index and search result cache"""
+        index_bytes = self.index.memory_bytes() if self.index is not None else 0
+        return index_bytes + self.result_cache.stats()['bytes']
+    
+    def get_stats(self):
+        """Index statistics for monitoring"""
+        stats = {
+            'collection': self.collection,
+            'initialized': self.initialized,
+            'faiss_available': FAISS_AVAILABLE
+        }
+        if self.index is not None:
+            stats['index'] = self.index.stats()
+        stats['query_embedding_cache'] = self.embedding_cache.stats()
+        stats['search_result_cache'] = self.result_cache.stats()
+        if self.semantic_cache is not None:
+            stats['semantic_cache'] = self.semantic_cache.stats()
+        if self.query_encoder is not None:
+            stats['query_encoder'] = self.query_encoder.stats()
+        if self.reranker is not None:
+            stats['reranker'] = {
+                'model': self.reranker.name,
+                'candidates': settings.RAG_RERANK_CANDIDATES,
+                'budget_ms': settings.RAG_RERANK_BUDGET_MS,
+                **self.rerank_stats
+            }
+        if settings.RAG_MMR_ENABLED:
+            stats['diversity'] = {
+                'candidates': settings.RAG_MMR_CANDIDATES,
+                'lambda': settings.RAG_MMR_LAMBDA,
+                'duplicate_threshold': settings.RAG_DUPLICATE_THRESHOLD,
+                **self.diversity_stats
+            }
+        if isinstance(self.llm, GeminiClient):
+            stats['llm'] = self.llm.stats()
+        return stats
+    
+    def get_response(self, query, retrieval_mode=None, fusion=None, timings=None, history=''):
         """
         Get AI response for a query using RAG
         
         Args:
             query (str): User's question
+            retrieval_mode (str): 'dense', 'lexical' or 'hybrid' (default: RAG_RETRIEVAL_MODE)
+            fusion (str): Hybrid fusion method (default: RAG_FUSION_METHOD)
+            timings (dict): Filled with per-stage latencies in milliseconds, and
+                the prompt token counts under 'tokens'
+            history (str): Memory of the conversation so far, from
+                chat.memory.conversation_history
             
         Returns:
             str: AI-generated response
         """
-        if not self.initialized:
-            self.initialize()
+        timings = {} if timings is None else timings
+        request = self._begin_request(query, retrieval_mode, fusion, timings, history)
+        if request['cached'] is not None:
+            return request['cached']
         
         # Search for relevant context
-        context_chunks = self._search_faiss(query, top_k=3)
+        context_chunks = self._search_faiss(
+            query, top_k=3, mode=request['mode'], fusion=request['fusion'], timings=timings
+        )
         
         # Construct prompt with context
-        prompt = self._construct_prompt(query, context_chunks)
+        prompt = self._construct_prompt(query, context_chunks, timings, history)
         
         # Get response from Gemini
-        response = self._call_gemini(prompt)
+        start = time.perf_counter()
+        response, generated = self._generate(prompt)
+        timings['generation_ms'] = _elapsed_ms(start)
+        
+        # Fallback answers, and answers from context that missed the re-ranking
+        # budget, are not cached, so the next request retries
+        if generated and 'rerank_fallback_ms' not in timings:
+            self._remember_response(request, response)
         
         return response
+    
+    async def aget_response(self, query, retrieval_mode=None, fusion=None, timings=None, history=''):
+        """
+        Async variant of get_response for ASGI views
+        
+        Cache lookups, encoding and search run on a bounded thread pool
+        (RAG_ASYNC_EXECUTOR_WORKERS); the LLM call is awaited, so a slow
+        generation holds no thread at all.
+        """
+        timings = {} if timings is None else timings
+        request = await self._run_blocking(self._begin_request, query, retrieval_mode, fusion, timings, history)
+        if request['cached'] is not None:
+            return request['cached']
+        
+        context_chunks = await self._run_blocking(
+            self._search_faiss, query, 3, request['mode'], request['fusion'], timings
+        )
+        prompt = self._construct_prompt(query, context_chunks, timings, history)
+        
+        start = time.perf_counter()
+        response, generated = await self._agenerate(prompt)
+        timings['generation_ms'] = _elapsed_ms(start)
+        
+        if generated and 'rerank_fallback_ms' not in timings:
+            await self._run_blocking(self._remember_response, request, response)
+        
+        return response
+    
+    async def _run_blocking(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._blocking_pool, functools.partial(func, *args))
+    
+    def stream_response(self, query, retrieval_mode=None, fusion=None, timings=None, history=''):
+        """
+        Stream an AI response for a query using RAG
+        
+        Yields (event, data) pairs: ('sources', list of {'rank', 'text'}),
+        then ('token', str) for each piece of the answer. A cached answer
+        is sent as a single token after an empty source list. If the model
+        fails part-way through, the answer ends with ('error', str).
+        """
+        timings = {} if timings is None else timings
+        request = self._begin_request(query, retrieval_mode, fusion, timings, history)
+        if request['cached'] is not None:
+            yield 'sources', []
+            yield 'token', request['cached']
+            return
+        
+        context_chunks = self._search_faiss(
+            query, top_k=3, mode=request['mode'], fusion=request['fusion'], timings=timings
+        )
+        prompt = self._construct_prompt(query, context_chunks, timings, history)
+        # Only the chunks that fit the prompt's token budget are sources
+        sent = context_chunks[:timings['tokens']['context_chunks']]
+        yield 'sources', [
+            {'rank': rank, 'text': chunk['text']} for rank, chunk in enumerate(sent, start=1)
+        ]
+        
+        start = time.perf_counter()
+        outcome = {}
+        pieces = []
+        for piece in self._generate_stream(prompt, outcome):
+            if not pieces:
+                timings['first_token_ms'] = _elapsed_ms(start)
+            pieces.append(piece)
+            yield 'token', piece
+        timings['generation_ms'] = _elapsed_ms(start)
+        if 'error' in outcome:
+            yield 'error', outcome['error']
+            return
+        
+        if outcome.get('generated') and 'rerank_fallback_ms' not in timings:
+            self._remember_response(request, ''.join(pieces))
+    
+    def _begin_request(self, query, retrieval_mode, fusion, timings, history=''):
+        """
+        Resolve retrieval settings and look the query up in the answer caches
+        
+        Returns:
+            dict: request state; 'cached' holds the answer on a cache hit
+        """
+        if not self.initialized:
+            self.initialize()
+        
+        retrieval_mode = retrieval_mode or settings.RAG_RETRIEVAL_MODE
+        if retrieval_mode == 'hybrid':
+            fusion = fusion or settings.RAG_FUSION_METHOD
+        else:
+            fusion = None
+        request = {
+            'query': query,
+            'mode': retrieval_mode,
+            'fusion': fusion,
+            'context': (retrieval_mode, fusion, *self.ranking_key),
+            'answer_key': None,
+            'kb_version': None,
+            'response_key': None,
+            'query_embedding': None,
+            'cached': None,
+        }
+        
+        # Caches are only used with a versioned index to key them on
+        if not (FAISS_AVAILABLE and self.index is not None):
+            return request
+        self._refresh_index()
+        kb_version = request['kb_version'] = self.kb_version
+        # Everything an answer depends on besides the question, KB version and
+        # history: both answer caches are keyed on it
+        request['answer_key'] = (
+            self.embedding_name, settings.RAG_LLM_BACKEND, settings.RAG_GEMINI_MODEL,
+            settings.RAG_GEMINI_MAX_OUTPUT_TOKENS, settings.RAG_GEMINI_TEMPERATURE, PROMPT_TEMPLATE_VERSION,
+            settings.RAG_PROMPT_TOKEN_BUDGET, settings.RAG_ANSWER_TOKEN_RESERVE, *request['context']
+        )
+        
+        # Serve exact repeats from the shared response cache
+        if settings.RAG_RESPONSE_CACHE_ENABLED:
+            start = time.perf_counter()
+            request['response_key'] = response_cache.make_key(
+                'response', query, self.collection, kb_version, *request['answer_key'], history
+            )
+            cached = response_cache.cache_get(request['response_key'])
+            if cached is not None:
+                timings['response_cache_hit_ms'] = _elapsed_ms(start)
+                request['cached'] = cached
+                return request
+            timings['response_cache_lookup_ms'] = _elapsed_ms(start)
+        
+        # Serve near-duplicate questions from the semantic cache; a follow-up
+        # question means something else in another conversation, so skip those
+        if self.semantic_cache is not None and not history:
+            start = time.perf_counter()
+            request['query_embedding'] = self.encode_query(query)
+            cached = self.semantic_cache.lookup(
+                request['query_embedding'][0], kb_version, request['answer_key']
+            )
+            if cached is not None:
+                timings['semantic_cache_hit_ms'] = _elapsed_ms(start)
+                request['cached'] = cached['answer']
+                return request
+            timings['semantic_cache_lookup_ms'] = _elapsed_ms(start)
+        
+        return request
+    
+    def _remember_response(self, request, response):
+        """Store a generated answer in the response and semantic caches"""
+        if request['response_key'] is not None:
+            response_cache.cache_set(request['response_key'], response)
+        if request['query_embedding'] is not None:
+            self.semantic_cache.store(
+                request['query_embedding'][0], request['query'], response,
+                request['kb_version'], request['answer_key']
+            )
+
+
+class ServiceRegistry:
+    """
+    RAG services by collection, kept within a memory budget.
+    
+    A collection's service is created on first request and loads its
+    index lazily. When a service is created, once its index has loaded,
+    and whenever the index grows (ingestion, or changes picked up from
+    other processes), least recently used services are evicted while the
+    resident indices exceed ``memory_budget`` bytes or there are more than
+    ``max_resident`` services. Requests for resident collections only
+    reorder them, so the hot path never measures index sizes under the lock. An evicted collection
+    is loaded again from its snapshot when it is next requested. Requests
+    still holding an evicted service finish normally, and its memory is
+    released with the last reference. Pinned collections are never evicted.
+    """
+    
+    def __init__(self, memory_budget, max_resident, pinned=()):
+        self.memory_budget = memory_budget
+        self.max_resident = max(1, max_resident)
+        self.pinned = set(pinned)
+        self._services = OrderedDict()
+        # Counters outlive evictions so the admin view shows churn
+        self._counters = {}
+        self._lock = threading.Lock()
+        self.evictions = 0
+    
+    def is_resident(self, collection):
+        return collection in self._services
+    
+    def get(self, collection):
+        with self._lock:
+            counters = self._counters.setdefault(
+                collection, {'hits': 0, 'loads': 0, 'evictions': 0, 'last_used': None}
+            )
+            service = self._services.get(collection)
+            if service is None:
+                service = self._services[collection] = RAGService(collection)
+                service.on_index_resized = self._index_resized
+                counters['loads'] += 1
+                self._evict(keep=collection)
+            else:
+                self._services.move_to_end(collection)
+                counters['hits'] += 1
+            counters['last_used'] = time.time()
+        return service
+    
+    def _index_resized(self, service):
+        """Re-check the budget now that a service's index was loaded or grew"""
+        with self._lock:
+            # An evicted service can still finish loading for requests holding it
+            if self._services.get(service.collection) is service:
+                self._evict(keep=service.collection)
+    
+    def _evict(self, keep):
+        sizes = {collection: service.memory_bytes() for collection, service in self._services.items()}
+        resident = sum(sizes.values())
+        for collection in list(self._services):
+            if resident <= self.memory_budget and len(self._services) <= self.max_resident:
+                break
+            if collection == keep or collection in self.pinned:
+                continue
+            del self._services[collection]
+            resident -= sizes[collection]
+            self._counters[collection]['evictions'] += 1
+            self.evictions += 1
+            print(f"♻️  Evicted RAG collection '{collection}' ({sizes[collection] / (1024 * 1024):.1f} MB)")
+    
+    def stats(self):
+        """Resident collections with their index sizes and request counts, most recent first"""
+        with self._lock:
+            services = dict(self._services)
+            counters = {collection: dict(values) for collection, values in self._counters.items()}
+        
+        collections = []
+        for collection in reversed(list(services)):
+            service = services[collection]
+            entry = {
+                'collection': collection,
+                'resident': True,
+                'initialized': service.initialized,
+                'memory_bytes': service.memory_bytes(),
+                'chunks': len(service.index) if service.index is not None else len(service.knowledge_base),
+                'kb_version': service.kb_version,
+                **counters[collection],
+            }
+            collections.append(entry)
+        for collection, values in counters.items():
+            if collection not in services:
+                collections.append({'collection': collection, 'resident': False, **values})
+        
+        return {
+            'memory_budget_bytes': self.memory_budget,
+            'max_resident': self.max_resident,
+            'resident': len(services),
+            'resident_bytes': sum(entry['memory_bytes'] for entry in collections if entry['resident']),
+            'evictions': self.evictions,
+            'collections': collections,
+        }
 
 
-# Global instance
-_rag_service_instance = None
+# Global registry
+_service_registry = None
+_service_registry_lock = threading.Lock()
 
 
-def get_rag_service():
-    """Get or create RAG service singleton"""
-    global _rag_service_instance
+def get_service_registry():
+    """Get or create the per-process registry of collection services"""
+    global _service_registry
     
-    if _rag_service_instance is None:
-        _rag_service_instance = RAGService()
+    if _service_registry is None:
+        with _service_registry_lock:
+            if _service_registry is None:
+                _service_registry = ServiceRegistry(
+                    settings.RAG_COLLECTION_MEMORY_BUDGET_MB * 1024 * 1024,
+                    settings.RAG_MAX_RESIDENT_COLLECTIONS,
+                    pinned=[settings.RAG_DEFAULT_COLLECTION]
+                )
     
-    return _rag_service_instance
+    return _service_registry
+
+
+def get_rag_service(collection=None, create=False):
+    """
+    Get the RAG service of a collection (default: RAG_DEFAULT_COLLECTION)
+    
+    Args:
+        collection (str): Collection ID
+        create (bool): Allow a collection with no index yet; it is
+            created empty by the first ingestion
+    
+    Raises:
+        ValueError: Malformed collection ID
+        UnknownCollection: No index exists for the collection and create is False
+    """
+    collection = collection or settings.RAG_DEFAULT_COLLECTION
+    registry = get_service_registry()
+    if not registry.is_resident(collection) and collection != settings.RAG_DEFAULT_COLLECTION:
+        if not create and not os.path.isdir(collection_index_dir(collection)):
+            raise UnknownCollection(f"Unknown collection '{collection}'")
+    return registry.get(collection)
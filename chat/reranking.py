@@ -0,0 +1,124 @@
+"""
+Cross-encoder re-ranking of retrieved chunks.
+
+The bi-encoder index ranks chunks by embedding distance, which is cheap
+but noisy. A cross-encoder reads the query and a chunk together and
+scores their relevance much more accurately, at the cost of one model
+pass per pair. The RAG service over-fetches RAG_RERANK_CANDIDATES hits,
+scores them here in batches and keeps the best k.
+
+Backends (``RAG_RERANKER``):
+    cross-encoder  RAG_RERANKER_MODEL run by sentence-transformers
+    fake           deterministic word-overlap scores with an optional
+                   per-batch delay, for tests and budget experiments
+
+``rerank`` enforces a time budget: scoring runs on a worker pool and
+the request waits for it at most RAG_RERANK_BUDGET_MS. When that runs
+out the hits keep their retrieval order, and the unfinished scoring is
+dropped from the queue or stops after its current batch.
+"""
+import logging
+import re
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+logger = logging.getLogger(__name__)
+
+RERANKER_BACKENDS = ('cross-encoder', 'fake')
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+
+class CrossEncoderReranker:
+    """A sentence-transformers cross-encoder, e.g. cross-encoder/ms-marco-MiniLM-L-6-v2"""
+
+    def __init__(self, model_name, max_length=512):
+        from sentence_transformers import CrossEncoder
+
+        self.model = CrossEncoder(model_name, max_length=max_length)
+        self.name = model_name
+
+    def score(self, query, texts):
+        """Relevance of each text to the query, higher is better"""
+        scores = self.model.predict([(query, text) for text in texts], show_progress_bar=False)
+        return [float(score) for score in scores]
+
+
+class FakeReranker:
+    """
+    Deterministic stand-in for a cross-encoder.
+
+    Scores a text by the fraction of query words it contains, ties
+    broken by shorter texts. ``delay_ms`` is slept once per call, to
+    simulate model latency per batch.
+    """
+
+    name = 'fake'
+
+    def __init__(self, delay_ms=0.0):
+        self.delay = delay_ms / 1000
+
+    def score(self, query, texts):
+        if self.delay:
+            time.sleep(self.delay)
+        query_words = set(TOKEN_PATTERN.findall(query.lower()))
+        scores = []
+        for text in texts:
+            words = TOKEN_PATTERN.findall(text.lower())
+            overlap = len(query_words & set(words)) / len(query_words) if query_words else 0.0
+            scores.append(overlap - len(words) * 1e-6)
+        return scores
+
+
+def load_reranker(backend, model_name=None, fake_delay_ms=0.0):
+    """Reranker for a RAG_RERANKER value"""
+    if backend == 'cross-encoder':
+        return CrossEncoderReranker(model_name)
+    if backend == 'fake':
+        return FakeReranker(fake_delay_ms)
+    raise ValueError(f"Unknown reranker '{backend}'. Choose: {', '.join(RERANKER_BACKENDS)}")
+
+
+def _score_batches(reranker, query, texts, batch_size, stop):
+    scores = []
+    for start in range(0, len(texts), batch_size):
+        if stop.is_set():
+            return None
+        scores.extend(reranker.score(query, texts[start:start + batch_size]))
+    return scores
+
+
+def rerank(reranker, query, hits, top_k, pool, budget_ms, batch_size=16):
+    """
+    Re-order hits by cross-encoder score and keep the best ``top_k``.
+
+    Args:
+        reranker: Object with ``score(query, texts)``
+        hits (list): Retrieval hits (dicts with 'text'), best first
+        pool (Executor): Runs the scoring, so the wait can be cut short
+        budget_ms (float): Longest wait for the scores; 0 for no limit
+
+    Returns:
+        tuple: (hits, completed) where ``completed`` is False when the
+            budget ran out (or scoring failed) and the hits are in their
+            original order
+    """
+    if len(hits) <= 1:
+        return hits[:top_k], True
+
+    stop = threading.Event()
+    texts = [hit['text'] for hit in hits]
+    future = pool.submit(_score_batches, reranker, query, texts, max(1, batch_size), stop)
+    try:
+        scores = future.result(timeout=budget_ms / 1000 if budget_ms else None)
+    except FutureTimeoutError:
+        stop.set()
+        future.cancel()
+        return hits[:top_k], False
+    except Exception as e:
+        logger.error(f"Re-ranking failed, keeping retrieval order: {str(e)}")
+        return hits[:top_k], False
+
+    order = sorted(range(len(hits)), key=lambda i: scores[i], reverse=True)
+    return [dict(hits[i], rerank_score=scores[i]) for i in order[:top_k]], True
@@ -0,0 +1,52 @@
+"""
+Shared cache for RAG answers and retrieval results.
+
+Entries go through Django's cache framework (the ``RAG_CACHE_ALIAS``
+entry in ``CACHES``), so every worker, and every restart, sees the same
+cache. Keys hash the normalised query together with everything the value
+depends on (KB version, model names, prompt template version, retrieval
+settings), so a KB change makes old entries unreachable and they simply
+expire.
+
+Cache backend failures are logged and treated as misses: the cache must
+never take the chat endpoint down.
+"""
+import hashlib
+import json
+import logging
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .query_cache import normalize_query
+
+logger = logging.getLogger(__name__)
+
+
+def make_key(kind, query, *parts):
+    """Cache key for a query and the values its result depends on"""
+    payload = json.dumps([normalize_query(query), *parts], ensure_ascii=False, default=str)
+    digest = hashlib.sha256(payload.encode('utf-8')).hexdigest()[:40]
+    return f"rag:{kind}:{digest}"
+
+
+def _cache():
+    return caches[settings.RAG_CACHE_ALIAS]
+
+
+def cache_get(key):
+    try:
+        return _cache().get(key)
+    except Exception as e:
+        logger.warning(f"RAG cache read failed: {str(e)}")
+        return None
+
+
+def cache_set(key, value, timeout=None):
+    try:
+        if timeout is None:
+            _cache().set(key, value)
+        else:
+            _cache().set(key, value, timeout)
+    except Exception as e:
+        logger.warning(f"RAG cache write failed: {str(e)}")
@@ -0,0 +1,133 @@
+"""
+Semantic answer cache.
+
+Stores (question embedding, answer) pairs and serves a stored answer when
+a new question is close enough in embedding space, so rephrasings of a
+frequent question skip retrieval and the LLM call. Entries are only
+served for the KB version and the settings they were generated with
+(the RAG service passes the same model, prompt and retrieval settings
+that key its exact-match response cache), expire after a TTL, and the
+least recently used entry is evicted when the cache is full.
+"""
+import threading
+import time
+
+import numpy as np
+
+
+class SemanticCache:
+    """
+    Cosine-similarity lookup over a fixed number of slots.
+
+    Args:
+        max_entries (int): Number of answers kept
+        threshold (float): Minimum cosine similarity for a hit (0-1)
+        ttl (float): Entry lifetime in seconds (0 = until evicted)
+    """
+
+    def __init__(self, max_entries=1000, threshold=0.92, ttl=3600):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.ttl = ttl or None
+        self._vectors = None
+        self._entries = [None] * max_entries
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def lookup(self, embedding, kb_version, context=None):
+        """
+        Best live entry for this question, or None.
+
+        Returns:
+            dict: {'query', 'answer', 'similarity', 'hits', ...} of the entry
+        """
+        query = self._normalize(embedding)
+        with self._lock:
+            if self._vectors is None:
+                self.misses += 1
+                return None
+
+            similarities = self._vectors @ query
+            now = time.monotonic()
+            for slot in np.argsort(-similarities):
+                similarity = float(similarities[slot])
+                if similarity < self.threshold:
+                    break
+                entry = self._entries[slot]
+                if entry is None:
+                    continue
+                if entry['kb_version'] != kb_version or (self.ttl and now - entry['created'] > self.ttl):
+                    self._free(slot)
+                    continue
+                if entry['context'] != context:
+                    continue
+                entry['hits'] += 1
+                entry['last_used'] = now
+                self.hits += 1
+                return dict(entry, similarity=similarity)
+
+            self.misses += 1
+            return None
+
+    def store(self, embedding, query, answer, kb_version, context=None):
+        vector = self._normalize(embedding)
+        now = time.monotonic()
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_entries, vector.shape[0]), dtype='float32')
+            slot = self._free_slot()
+            self._vectors[slot] = vector
+            self._entries[slot] = {
+                'query': query,
+                'answer': answer,
+                'kb_version': kb_version,
+                'context': context,
+                'created': now,
+                'last_used': now,
+                'hits': 0,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._vectors = None
+            self._entries = [None] * self.max_entries
+
+    def _free_slot(self):
+        for slot, entry in enumerate(self._entries):
+            if entry is None:
+                return slot
+        slot = min(range(self.max_entries), key=lambda i: self._entries[i]['last_used'])
+        self._free(slot)
+        self.evictions += 1
+        return slot
+
+    def _free(self, slot):
+        self._entries[slot] = None
+        self._vectors[slot] = 0.0
+
+    @staticmethod
+    def _normalize(embedding):
+        vector = np.asarray(embedding, dtype='float32').reshape(-1)
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm else vector
+
+    def stats(self, top=10):
+        with self._lock:
+            live = [entry for entry in self._entries if entry is not None]
+        lookups = self.hits + self.misses
+        live.sort(key=lambda entry: entry['hits'], reverse=True)
+        return {
+            'entries': len(live),
+            'max_entries': self.max_entries,
+            'threshold': self.threshold,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'top_entries': [
+                {'query': entry['query'][:100], 'hits': entry['hits'], 'kb_version': entry['kb_version']}
+                for entry in live[:top]
+            ],
+        }
@@ -1,4 +1,6 @@
 from rest_framework import serializers
+from .fusion import FUSION_METHODS
+from .rag_service import COLLECTION_ID_PATTERN
 from .models import ChatMessage, Conversation
 
 
@@ -7,8 +9,36 @@ class ChatMessageSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = ChatMessage
-        fields = ['id', 'user_message', 'ai_response', 'timestamp']
-        read_only_fields = ['id', 'timestamp']
+        fields = ['id', 'user_message', 'ai_response', 'timestamp', 'status']
+        read_only_fields = ['id', 'timestamp', 'status']
+
+
+class ChatJobSerializer(serializers.ModelSerializer):
+    """Serializer for a background chat request (a ChatMessage queued with respond_async)"""
+    job_id = serializers.IntegerField(source='id', read_only=True)
+    conversation_id = serializers.IntegerField(read_only=True)
+    latency = serializers.SerializerMethodField()
+    tokens = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = ChatMessage
+        fields = ['job_id', 'status', 'conversation_id', 'user_message', 'ai_response', 'error',
+                  'attempts', 'timestamp', 'started_at', 'completed_at', 'tokens', 'latency']
+        read_only_fields = fields
+    
+    def get_latency(self, obj):
+        if obj.completed_at is None:
+            return None
+        latency = {'total_ms': round((obj.completed_at - obj.timestamp).total_seconds() * 1000, 2)}
+        if obj.started_at is not None:
+            latency['queue_wait_ms'] = round((obj.started_at - obj.timestamp).total_seconds() * 1000, 2)
+        latency.update(obj.latency or {})
+        latency.pop('tokens', None)
+        return latency
+    
+    def get_tokens(self, obj):
+        # Stored with the latencies by the job worker
+        return (obj.latency or {}).get('tokens')
 
 
 class ConversationSerializer(serializers.ModelSerializer):
@@ -38,6 +68,10 @@ class ChatRequestSerializer(serializers.Serializer):
     """Serializer for incoming chat requests"""
     message = serializers.CharField(max_length=5000, required=True)
     conversation_id = serializers.IntegerField(required=False, allow_null=True)
+    retrieval_mode = serializers.ChoiceField(choices=['dense', 'lexical', 'hybrid'], required=False)
+    fusion = serializers.ChoiceField(choices=FUSION_METHODS, required=False)
+    collection = serializers.RegexField(COLLECTION_ID_PATTERN, required=False)
+    respond_async = serializers.BooleanField(required=False, default=False)
     
     def validate_message(self, value):
         if not value or not value.strip():
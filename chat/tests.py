@@ -1,3 +1,1219 @@
-from django.test import TestCase
+"""
+Tests for the chat app.
 
-# Create your tests here.
+Run with: python manage.py test chat
+
+Nothing needs a model download or network access: embeddings come from
+the hashing backend, answers from the fake LLM, and every test gets its
+own index directory and answer cache.
+"""
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from unittest import mock, skipUnless
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import AsyncClient, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .chunking import Chunker, count_tokens
+from .embeddings import backend_config, create_backend
+from .job_queue import ChatJobQueue
+from .llm import GeminiClient, GeminiError
+from .management.commands.benchmark_llm_client import ANSWER_PIECES, PROMPT, MockGeminiHandler, MockGeminiServer
+from .memory import conversation_history, remember_turn
+from .models import ChatMessage, Conversation
+from .rag_service import FAISS_AVAILABLE, RAGService, ServiceRegistry, get_rag_service
+from .reranking import rerank
+
+KB_CHUNKS = [
+    'Django is a high-level Python web framework that encourages rapid development.',
+    'FAISS is a library for efficient similarity search of dense vectors.',
+    'PostgreSQL is an open source relational database with strong SQL support.',
+    'Redis is an in-memory key-value store often used as a cache.',
+    'JSON Web Tokens carry signed claims between a client and a server.',
+]
+
+
+def make_index_dir(test):
+    """Temporary index directory, removed when the test ends"""
+    path = tempfile.mkdtemp(prefix='rag-test-')
+    test.addCleanup(shutil.rmtree, path, ignore_errors=True)
+    return path
+
+
+def use_rag_settings(test, **overrides):
+    """
+    Point the RAG settings at a fresh index of KB_CHUNKS for one test.
+
+    The knowledge base is chunked by paragraph, so each of KB_CHUNKS is
+    one chunk, and the per-process service registry starts empty.
+    """
+    index_dir = make_index_dir(test)
+    kb_path = os.path.join(index_dir, 'knowledge_base.txt')
+    with open(kb_path, 'w', encoding='utf-8') as f:
+        f.write('\n\n'.join(KB_CHUNKS))
+    options = {
+        'RAG_KNOWLEDGE_BASE_PATH': kb_path,
+        'RAG_INDEX_DIR': index_dir,
+        'RAG_COLLECTIONS_DIR': os.path.join(index_dir, 'collections'),
+        'RAG_CHUNKER': 'paragraph',
+        'RAG_EMBEDDING_BACKEND': 'hashing',
+        'RAG_LLM_BACKEND': 'fake',
+        'RAG_FAKE_LLM_TOKEN_DELAY_MS': 0,
+        'RAG_RERANKER': '',
+        'RAG_WARMUP': False,
+        'CACHES': {
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+            'rag': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': index_dir},
+        },
+    }
+    options.update(overrides)
+    settings_override = override_settings(**options)
+    settings_override.enable()
+    test.addCleanup(settings_override.disable)
+    registry = mock.patch('chat.rag_service._service_registry', None)
+    registry.start()
+    test.addCleanup(registry.stop)
+
+
+class ChunkerTests(SimpleTestCase):
+    """Token budget, overlap and paragraph boundaries of chat.chunking.Chunker"""
+
+    def setUp(self):
+        self.chunker = Chunker(target_tokens=60, overlap_tokens=15, min_tokens=10)
+        self.sentences = [
+            f'Sentence number {i} explains how the cache layer handles request {i} quickly.' for i in range(30)
+        ]
+
+    def test_single_paragraph_is_one_chunk(self):
+        self.assertEqual(self.chunker.chunk_text('Django is a web framework.'), [
+            {'text': 'Django is a web framework.', 'tokens': 7, 'section': None}
+        ])
+
+    def test_chunks_stay_within_the_token_budget(self):
+        chunks = self.chunker.chunk_text(' '.join(self.sentences))
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            self.assertLessEqual(count_tokens(chunk['text']), 60)
+            self.assertEqual(chunk['tokens'], count_tokens(chunk['text']))
+        # An unbroken word longer than the budget is cut too
+        chunks = self.chunker.chunk_text('x' * 2000)
+        self.assertTrue(all(count_tokens(chunk['text']) <= 60 for chunk in chunks))
+
+    def test_split_paragraph_repeats_the_overlap(self):
+        chunks = [chunk['text'] for chunk in self.chunker.chunk_text(' '.join(self.sentences))]
+        for previous, chunk in zip(chunks, chunks[1:]):
+            carried = next(
+                chunk[:end] for end in range(len(chunk), 0, -1) if previous.endswith(chunk[:end])
+            )
+            self.assertTrue(0 < count_tokens(carried) <= 15, (previous, chunk))
+        # Every sentence is indexed, in order
+        text = ' '.join(chunks)
+        positions = [text.index(sentence) for sentence in self.sentences]
+        self.assertEqual(positions, sorted(positions))
+
+    def test_paragraphs_are_split_at_their_boundaries_without_overlap(self):
+        first, second = ' '.join(self.sentences[:2]), ' '.join(self.sentences[2:4])
+        chunks = self.chunker.chunk_text(f'{first}\n\n{second}')
+        self.assertEqual([chunk['text'] for chunk in chunks], [first, second])
+
+    def test_short_paragraphs_are_merged_and_headings_repeated(self):
+        text = '# Caching\n\nRedis stores sessions.\n\nMemcached stores pages.\n\n' + ' '.join(self.sentences[:4])
+        chunks = self.chunker.chunk_text(text)
+        self.assertTrue(chunks[0]['text'].startswith('Caching\nRedis stores sessions.\nMemcached stores pages.\n'))
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(chunk['section'] == 'Caching' for chunk in chunks))
+        self.assertTrue(all(chunk['text'].startswith('Caching\n') for chunk in chunks))
+
+
+@skipUnless(FAISS_AVAILABLE, 'numpy and faiss are not installed')
+class KnowledgeIndexTests(SimpleTestCase):
+    """Journaled changes, replay on reopen and compaction of chat.knowledge_index"""
+
+    def setUp(self):
+        self.index_dir = make_index_dir(self)
+        self.backend = create_backend(backend_config(backend='hashing'))
+
+    def open_index(self):
+        from .knowledge_index import KnowledgeIndex
+
+        # No background compaction, so each test decides when it runs
+        index, _ = KnowledgeIndex.open(
+            self.index_dir, self.backend.name, self.backend.encode,
+            sources={'kb': KB_CHUNKS}, compaction_threshold=1.0
+        )
+        return index
+
+    def search_ids(self, index, query, k=3):
+        return [hit['id'] for hit in index.search(self.backend.encode([query]), k)[0]]
+
+    def test_add_update_and_delete_chunks(self):
+        index = self.open_index()
+        ids = index.add_chunks('notes', ['Celery runs background tasks from a message queue.',
+                                         'Nginx is a reverse proxy and web server.'])
+        self.assertEqual(len(index), len(KB_CHUNKS) + 2)
+        self.assertEqual(index.get_chunk(ids[0])['document'], 'notes')
+        self.assertEqual(self.search_ids(index, 'Celery background tasks', k=1), [ids[0]])
+
+        index.update_chunk(ids[0], 'Gunicorn is a WSGI HTTP server for Python.')
+        self.assertEqual(index.get_chunk(ids[0])['text'], 'Gunicorn is a WSGI HTTP server for Python.')
+        self.assertEqual(self.search_ids(index, 'Gunicorn WSGI server', k=1), [ids[0]])
+
+        kb_id = index.document_chunk_ids('kb')[0]
+        self.assertEqual(index.delete_chunks([ids[1], kb_id, 10 ** 6]), 2)
+        self.assertIsNone(index.get_chunk(ids[1]))
+        self.assertIsNone(index.get_chunk(kb_id))
+        self.assertNotIn(ids[1], self.search_ids(index, 'Nginx reverse proxy', k=len(KB_CHUNKS)))
+        self.assertEqual(len(index), len(KB_CHUNKS))
+
+    def test_upsert_keeps_unchanged_chunks(self):
+        index = self.open_index()
+        index.upsert_document('guide', ['Install Django with pip.', 'Run the migrations.', 'Start the server.'])
+        before = {index.get_chunk(cid)['text']: cid for cid in index.document_chunk_ids('guide')}
+
+        result = index.upsert_document('guide', ['Install Django with pip.', 'Start the server.',
+                                                 'Create a superuser.'])
+        self.assertEqual((result['added'], result['deleted'], result['unchanged']), (1, 1, 2))
+        after = {index.get_chunk(cid)['text']: cid for cid in index.document_chunk_ids('guide')}
+        self.assertEqual(after['Install Django with pip.'], before['Install Django with pip.'])
+        self.assertEqual(after['Start the server.'], before['Start the server.'])
+        self.assertNotIn('Run the migrations.', after)
+
+        self.assertEqual(index.delete_document('guide'), 3)
+        self.assertEqual(index.document_chunk_ids('guide'), [])
+
+    def test_upsert_pairs_sections_with_chunks_by_position(self):
+        index = self.open_index()
+        index.upsert_document('faq', ['See the docs.', 'See the docs.'], sections=['Install', 'Deploy'])
+        sections = sorted(index.get_chunk(cid)['section'] for cid in index.document_chunk_ids('faq'))
+        self.assertEqual(sections, ['Deploy', 'Install'])
+
+    def test_reopen_replays_the_journal(self):
+        index = self.open_index()
+        ids = index.add_chunks('notes', ['Celery runs background tasks from a message queue.'])
+        index.update_chunk(index.document_chunk_ids('kb')[1], 'FAISS builds IVF and HNSW vector indexes.')
+        index.delete_chunks([index.document_chunk_ids('kb')[0]])
+        queries = ['background tasks', 'vector indexes', 'web framework', 'relational database']
+        expected = [index.search(self.backend.encode([query]), 3)[0] for query in queries]
+
+        reopened = self.open_index()
+        self.assertEqual(reopened.version, index.version)
+        self.assertEqual(sorted(reopened.iter_chunks()), sorted(index.iter_chunks()))
+        self.assertEqual(reopened.get_chunk(ids[0])['document'], 'notes')
+        for query, hits in zip(queries, expected):
+            replayed = reopened.search(self.backend.encode([query]), 3)[0]
+            self.assertEqual([hit['id'] for hit in replayed], [hit['id'] for hit in hits])
+            for hit, other in zip(replayed, hits):
+                self.assertAlmostEqual(hit['distance'], other['distance'], places=5)
+
+    def test_compaction_keeps_ids_and_documents(self):
+        index = self.open_index()
+        ids = index.add_chunks('notes', ['Celery runs background tasks.', 'Nginx is a reverse proxy.'],
+                               sections=['Workers', None])
+        index.delete_chunks([index.document_chunk_ids('kb')[2], ids[1]])
+        chunks = sorted(index.iter_chunks())
+        documents = {cid: index.get_chunk(cid) for cid, _ in chunks}
+
+        result = index.compact()
+        self.assertEqual(result['kept'], len(chunks))
+        self.assertEqual(index.stats()['deleted_rows'], 0)
+        self.assertEqual(index.stats()['pending_chunks'], 0)
+
+        for reloaded in (index, self.open_index()):
+            self.assertEqual(sorted(reloaded.iter_chunks()), chunks)
+            self.assertEqual({cid: reloaded.get_chunk(cid) for cid, _ in chunks}, documents)
+            self.assertEqual(self.search_ids(reloaded, 'Celery background tasks', k=1), [ids[0]])
+
+
+@skipUnless(FAISS_AVAILABLE, 'numpy and faiss are not installed')
+def save_random_snapshot(test, num_vectors, dimension=32):
+    """
+    Snapshot of clustered random embeddings, with queries near known rows.
+
+    Returns (snapshot_dir, queries, rows): the exact nearest neighbour of
+    queries[i] is rows[i].
+    """
+    import numpy as np
+
+    from .index_store import save_snapshot
+
+    rng = np.random.default_rng(7)
+    centers = rng.normal(size=(16, dimension))
+    embeddings = (centers[rng.integers(0, 16, num_vectors)] + rng.normal(scale=0.5, size=(num_vectors, dimension)))
+    embeddings = embeddings.astype('float32')
+    rows = rng.choice(num_vectors, 50, replace=False)
+    queries = (embeddings[rows] + rng.normal(scale=0.01, size=(50, dimension))).astype('float32')
+    snapshot_dir = save_snapshot(
+        make_index_dir(test), [f'chunk {i}' for i in range(num_vectors)], embeddings, np.arange(num_vectors),
+        np.zeros(num_vectors), [{'id': 'kb', 'version': None}], 'test-model', 'v1', num_vectors
+    )
+    return snapshot_dir, queries, rows
+
+
+def top_hits(index, queries):
+    return index.search(queries, 1)[1][:, 0]
+
+
+@skipUnless(FAISS_AVAILABLE, 'numpy and faiss are not installed')
+class QuantizedStorageTests(SimpleTestCase):
+    """float16, int8 and PQ embedding storage opened by chat.index_store"""
+
+    PARAMS = {'pq_m': 8, 'pq_nbits': 4}
+
+    def test_storage_is_built_once_and_reused(self):
+        from . import vector_index
+        from .index_store import open_snapshot_dir
+
+        snapshot_dir, _, _ = save_random_snapshot(self, 1000)
+        for storage in ('float16', 'int8', 'pq'):
+            with self.subTest(storage=storage):
+                base = open_snapshot_dir(snapshot_dir, storage=storage, index_params=self.PARAMS)
+                self.assertEqual(base['storage'], storage)
+                path = os.path.join(snapshot_dir, vector_index.storage_file_name(storage, self.PARAMS))
+                self.assertTrue(os.path.exists(path))
+
+                for layout in ('mmap', 'memory'):
+                    with mock.patch('chat.vector_index.build_storage_index') as build:
+                        reopened = open_snapshot_dir(snapshot_dir, layout, storage=storage, index_params=self.PARAMS)
+                    build.assert_not_called()
+                    self.assertEqual(reopened['index'].ntotal, 1000)
+
+    def test_quantized_storage_is_smaller_and_rescoring_keeps_it_exact(self):
+        from .index_store import open_snapshot_dir
+        from .vector_index import index_memory_bytes
+
+        snapshot_dir, queries, rows = save_random_snapshot(self, 1000)
+        full_size = 1000 * 32 * 4
+        for storage, ratio in (('float16', 2), ('int8', 4), ('pq', 8)):
+            with self.subTest(storage=storage):
+                base = open_snapshot_dir(snapshot_dir, storage=storage, index_params=self.PARAMS, rescore_factor=10)
+                self.assertLessEqual(index_memory_bytes(base['index']), full_size / ratio * 1.2)
+                self.assertEqual(list(top_hits(base['index'], queries)), list(rows))
+
+    def test_pq_needs_enough_vectors_to_train(self):
+        from . import vector_index
+        from .index_store import open_snapshot_dir
+
+        snapshot_dir, queries, rows = save_random_snapshot(self, 100)
+        base = open_snapshot_dir(snapshot_dir, storage='pq', index_params=self.PARAMS)
+        self.assertEqual(base['storage'], 'float32')
+        self.assertFalse(os.path.exists(os.path.join(snapshot_dir, vector_index.storage_file_name('pq', self.PARAMS))))
+        self.assertEqual(list(top_hits(base['index'], queries)), list(rows))
+
+
+@skipUnless(FAISS_AVAILABLE, 'numpy and faiss are not installed')
+class AnnIndexTests(SimpleTestCase):
+    """IVF and HNSW indexes built by chat.vector_index.build_ann_index"""
+
+    PARAMS = {'nlist': 8, 'nprobe': 4, 'pq_m': 8, 'pq_nbits': 4, 'hnsw_m': 16, 'ef_search': 32}
+
+    def test_index_types_are_built_and_configured(self):
+        import faiss
+        import numpy as np
+
+        from .vector_index import build_ann_index
+
+        embeddings = np.random.default_rng(7).normal(size=(1000, 32)).astype('float32')
+        for index_type, cls in (('ivf_flat', faiss.IndexIVFFlat), ('ivf_pq', faiss.IndexIVFPQ),
+                                ('hnsw', faiss.IndexHNSWFlat), ('flat', faiss.IndexFlatL2)):
+            with self.subTest(index_type=index_type):
+                index = build_ann_index(embeddings, index_type, self.PARAMS)
+                self.assertIsInstance(index, cls)
+                self.assertEqual(index.ntotal, 1000)
+        self.assertEqual(build_ann_index(embeddings, 'ivf_flat', self.PARAMS).nprobe, 4)
+        self.assertEqual(build_ann_index(embeddings, 'hnsw', self.PARAMS).hnsw.efSearch, 32)
+
+    def test_small_corpus_falls_back_to_flat(self):
+        import faiss
+        import numpy as np
+
+        from .vector_index import build_ann_index
+
+        embeddings = np.random.default_rng(7).normal(size=(100, 32)).astype('float32')
+        for index_type in ('ivf_flat', 'ivf_pq'):
+            with self.subTest(index_type=index_type):
+                self.assertIsInstance(build_ann_index(embeddings, index_type, self.PARAMS), faiss.IndexFlatL2)
+
+    def test_pq_m_must_divide_the_dimension(self):
+        import numpy as np
+
+        from .vector_index import build_ann_index
+
+        embeddings = np.random.default_rng(7).normal(size=(1000, 30)).astype('float32')
+        with self.assertRaises(ValueError):
+            build_ann_index(embeddings, 'ivf_pq', self.PARAMS)
+
+    def test_snapshot_index_is_persisted_and_finds_neighbours(self):
+        from . import vector_index
+        from .index_store import open_snapshot_dir
+
+        snapshot_dir, queries, rows = save_random_snapshot(self, 2000)
+        for index_type in ('ivf_flat', 'ivf_pq', 'hnsw'):
+            with self.subTest(index_type=index_type):
+                base = open_snapshot_dir(snapshot_dir, index_type=index_type, index_params=self.PARAMS,
+                                         rescore_factor=10)
+                self.assertEqual(base['index_type'], index_type)
+                path = os.path.join(snapshot_dir, vector_index.index_file_name(index_type, 2000, self.PARAMS))
+                self.assertTrue(os.path.exists(path))
+                recall = (top_hits(base['index'], queries) == rows).mean()
+                self.assertGreaterEqual(recall, 0.9)
+
+                with mock.patch('chat.vector_index.build_ann_index') as build:
+                    reopened = open_snapshot_dir(snapshot_dir, index_type=index_type, index_params=self.PARAMS)
+                build.assert_not_called()
+                self.assertEqual(reopened['index'].ntotal, 2000)
+
+
+class RAGServiceTests(SimpleTestCase):
+    """Answer caches and retrieval modes of chat.rag_service.RAGService"""
+
+    def setUp(self):
+        use_rag_settings(self, RAG_SEMANTIC_CACHE_ENABLED=True)
+        self.service = RAGService()
+
+    def ask(self, query, **kwargs):
+        timings = {}
+        return self.service.get_response(query, timings=timings, **kwargs), timings
+
+    def test_exact_repeat_is_served_from_the_response_cache(self):
+        answer, timings = self.ask('What is Django?')
+        self.assertIn('response_cache_lookup_ms', timings)
+        self.assertIn('generation_ms', timings)
+
+        repeat, timings = self.ask('  what is DJANGO?')
+        self.assertEqual(repeat, answer)
+        self.assertIn('response_cache_hit_ms', timings)
+        self.assertNotIn('retrieval_ms', timings)
+        self.assertNotIn('generation_ms', timings)
+
+    def test_reworded_question_is_served_from_the_semantic_cache(self):
+        answer, _ = self.ask('What is Django?')
+
+        # Same words in another order: a different cache key, but the same embedding
+        reworded, timings = self.ask('Django is what?')
+        self.assertEqual(reworded, answer)
+        self.assertIn('response_cache_lookup_ms', timings)
+        self.assertIn('semantic_cache_hit_ms', timings)
+        self.assertNotIn('generation_ms', timings)
+
+        # A follow-up question depends on its conversation, so it is answered afresh
+        _, timings = self.ask('Django is what?', history='Conversation so far:\nUser: Tell me about Redis')
+        self.assertNotIn('semantic_cache_hit_ms', timings)
+        self.assertIn('generation_ms', timings)
+
+    def test_semantic_cache_is_keyed_on_model_and_prompt_settings(self):
+        self.ask('What is Django?')
+        for changed in ({'RAG_GEMINI_MODEL': 'gemini-2.5-pro'}, {'RAG_PROMPT_TOKEN_BUDGET': 1024}):
+            with self.subTest(**changed), override_settings(**changed):
+                _, timings = self.ask('Django is what?')
+                self.assertNotIn('semantic_cache_hit_ms', timings)
+                self.assertIn('generation_ms', timings)
+
+    def test_knowledge_base_change_invalidates_cached_answers(self):
+        self.ask('What is Django?')
+        self.service.add_chunks('notes', ['Django ships with an admin site.'])
+        _, timings = self.ask('What is Django?')
+        self.assertNotIn('response_cache_hit_ms', timings)
+        self.assertNotIn('semantic_cache_hit_ms', timings)
+        self.assertIn('generation_ms', timings)
+
+    def test_lexical_retrieval(self):
+        timings = {}
+        chunks = self.service._search_faiss('in-memory key-value store', top_k=2, mode='lexical', timings=timings)
+        self.assertEqual(chunks[0]['text'], KB_CHUNKS[3])
+        self.assertIn('lexical_search_ms', timings)
+        self.assertNotIn('dense_search_ms', timings)
+
+    def test_hybrid_retrieval(self):
+        for fusion in ('rrf', 'weighted'):
+            timings = {}
+            chunks = self.service._search_faiss(
+                'relational SQL database', top_k=2, mode='hybrid', fusion=fusion, timings=timings
+            )
+            self.assertEqual(chunks[0]['text'], KB_CHUNKS[2])
+            self.assertEqual(len(chunks), 2)
+            self.assertIn('lexical_search_ms', timings)
+            self.assertIn('fusion_ms', timings)
+
+        with self.assertRaises(ValueError):
+            self.service._search_faiss('database', mode='fuzzy')
+
+
+@skipUnless(FAISS_AVAILABLE, 'numpy and faiss are not installed')
+class PromptBudgetTests(SimpleTestCase):
+    """Context packing of RAGService._construct_prompt within RAG_PROMPT_TOKEN_BUDGET"""
+
+    def setUp(self):
+        use_rag_settings(self, RAG_ANSWER_TOKEN_RESERVE=100, RAG_MIN_CONTEXT_CHUNK_TOKENS=16)
+        self.service = RAGService()
+        texts = [f'Chunk {i} ' + ' '.join(KB_CHUNKS) for i in range(10)]
+        self.chunks = [{'text': text, 'tokens': count_tokens(text)} for text in texts]
+        self.history = 'User: What is Django?\nAssistant: A Python web framework.'
+
+    def construct(self, budget):
+        timings = {}
+        with override_settings(RAG_PROMPT_TOKEN_BUDGET=budget):
+            prompt = self.service._construct_prompt('What is Redis?', self.chunks, timings, self.history)
+        return prompt, timings['tokens']
+
+    def test_prompt_never_exceeds_the_budget(self):
+        for budget in (160, 200, 350, 500, 1000, 5000):
+            with self.subTest(budget=budget):
+                prompt, tokens = self.construct(budget)
+                self.assertLessEqual(count_tokens(prompt) + 100, budget)
+                self.assertEqual(tokens['prompt'], count_tokens(prompt))
+                self.assertEqual(tokens['context_chunks'] + tokens['dropped_chunks'], len(self.chunks))
+                self.assertIn('What is Redis?', prompt)
+
+    def test_best_chunks_go_in_first_and_the_last_is_cut(self):
+        _, tokens = self.construct(0)
+        overhead = tokens['prompt'] - tokens['context'] + 100
+        prompt, tokens = self.construct(overhead + 2 * self.chunks[0]['tokens'] + 40)
+        self.assertIn(self.chunks[1]['text'], prompt)
+        self.assertIn(self.chunks[2]['text'][:10], prompt)
+        self.assertNotIn(self.chunks[2]['text'], prompt)
+        self.assertNotIn(self.chunks[3]['text'][:10], prompt)
+        self.assertEqual(tokens['truncated_chunks'], 1)
+        self.assertEqual(tokens['context_chunks'], 3)
+        self.assertEqual(tokens['context'], 2 * self.chunks[0]['tokens'] + 40)
+
+    def test_history_that_does_not_fit_loses_its_oldest_lines(self):
+        _, tokens = self.construct(0)
+        prompt, tokens = self.construct(tokens['template'] + tokens['question'] + 100 + count_tokens('Assistant: A Python web framework.'))
+        self.assertIn('Assistant: A Python web framework.', prompt)
+        self.assertNotIn('User: What is Django?', prompt)
+        self.assertIn('What is Redis?', prompt)
+        self.assertEqual(tokens['context_chunks'], 0)
+
+    def test_zero_budget_keeps_every_chunk(self):
+        prompt, tokens = self.construct(0)
+        self.assertEqual(tokens['dropped_chunks'], 0)
+        self.assertTrue(all(chunk['text'] in prompt for chunk in self.chunks))
+
+
+class ChatViewTests(TestCase):
+    """POST /api/chat"""
+
+    def setUp(self):
+        use_rag_settings(self)
+        self.user = get_user_model().objects.create_user(username='alice', password='secret-password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_exact_repeat_is_answered_from_cache(self):
+        first = self.client.post('/api/chat', {'message': 'What is FAISS?'}, format='json')
+        self.assertEqual(first.status_code, 201, first.data)
+        self.assertFalse(first.data['from_cache'])
+        self.assertIsNone(first.data['cache'])
+        self.assertIsNotNone(first.data['tokens'])
+
+        repeat = self.client.post('/api/chat', {'message': 'What is FAISS?'}, format='json')
+        self.assertEqual(repeat.status_code, 201, repeat.data)
+        self.assertTrue(repeat.data['from_cache'])
+        self.assertEqual(repeat.data['cache'], 'response')
+        self.assertEqual(repeat.data['ai_response'], first.data['ai_response'])
+        self.assertIn('response_cache_ms', repeat.data['latency']['breakdown'])
+
+    def test_retrieval_mode_is_passed_through(self):
+        response = self.client.post(
+            '/api/chat', {'message': 'Redis cache', 'retrieval_mode': 'lexical'}, format='json'
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertIn('lexical_search_ms', response.data['latency']['rag_breakdown'])
+        self.assertIn('Redis', response.data['ai_response'])
+
+
+class AsyncChatViewTests(TestCase):
+    """POST /api/async/chat and its JWT authentication"""
+
+    def setUp(self):
+        use_rag_settings(self)
+        self.user = get_user_model().objects.create_user(username='dave', password='secret-password')
+        self.auth = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+
+    async def post(self, body, headers=None):
+        return await self.async_client.post(
+            '/api/async/chat', body, content_type='application/json',
+            headers=self.auth if headers is None else headers
+        )
+
+    async def test_missing_or_invalid_token_is_401(self):
+        self.assertEqual((await self.post({'message': 'What is Redis?'}, headers={})).status_code, 401)
+        response = await self.post({'message': 'What is Redis?'}, headers={'Authorization': 'Bearer not-a-token'})
+        self.assertEqual(response.status_code, 401)
+
+    async def test_other_methods_are_405(self):
+        response = await self.async_client.get('/api/async/chat', headers=self.auth)
+        self.assertEqual(response.status_code, 405)
+
+    async def test_unknown_conversation_or_collection_is_404(self):
+        self.assertEqual((await self.post({'message': 'What is Redis?', 'conversation_id': 999})).status_code, 404)
+        self.assertEqual((await self.post({'message': 'What is Redis?', 'collection': 'acme'})).status_code, 404)
+        self.assertEqual(await Conversation.objects.acount(), 0)
+
+    async def test_new_conversation_is_created_with_the_answer(self):
+        response = await self.post({'message': 'What is Redis?'})
+        self.assertEqual(response.status_code, 201, response.json())
+        data = response.json()
+        self.assertIn('Redis', data['ai_response'])
+        conversation = await Conversation.objects.aget(id=data['conversation_id'], user=self.user)
+        self.assertEqual(conversation.title, 'What is Redis?')
+        self.assertEqual(await ChatMessage.objects.filter(conversation=conversation).acount(), 1)
+
+    async def test_failed_answer_removes_the_new_conversation(self):
+        with mock.patch.object(RAGService, 'aget_response', side_effect=RuntimeError('model down')):
+            response = await self.post({'message': 'What is Redis?'})
+        self.assertEqual(response.status_code, 500)
+        self.assertIn('model down', response.json()['error'])
+        self.assertEqual(await Conversation.objects.acount(), 0)
+
+
+class ChatJobQueueTests(TestCase):
+    """Claiming and requeueing of background chats in chat.job_queue"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='bob', password='secret-password')
+        self.conversation = Conversation.objects.create(user=self.user, title='Jobs')
+
+    def queue_job(self, message='What is Django?'):
+        return ChatMessage.objects.create(
+            conversation=self.conversation, user=self.user, user_message=message,
+            status=ChatMessage.STATUS_PENDING
+        )
+
+    def test_only_one_worker_claims_a_job(self):
+        job = self.queue_job()
+        first, second = ChatJobQueue(workers=1), ChatJobQueue(workers=1)
+        real_now = timezone.now
+        claims = []
+
+        def first_worker_claims_meanwhile():
+            # Runs just before the second worker's UPDATE, after it listed the job as pending
+            if not claims:
+                claims.append(None)
+                claims[0] = first._claim_next()
+            return real_now()
+
+        with mock.patch('django.utils.timezone.now', side_effect=first_worker_claims_meanwhile):
+            self.assertIsNone(second._claim_next())
+        self.assertEqual(claims, [job.id])
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ChatMessage.STATUS_RUNNING)
+        self.assertEqual(job.attempts, 1)
+        self.assertIsNone(first._claim_next())
+
+    def test_stale_job_is_requeued_then_failed_after_max_attempts(self):
+        queue = ChatJobQueue(stale_after=60, max_attempts=2)
+        job = self.queue_job()
+        busy = self.queue_job('Still running')
+
+        def claim_and_abandon(target):
+            self.assertEqual(queue._claim_next(), target.id)
+            ChatMessage.objects.filter(id=target.id).update(started_at=timezone.now() - timedelta(minutes=5))
+
+        claim_and_abandon(job)
+        self.assertEqual(queue._claim_next(), busy.id)
+        self.assertEqual(queue.requeue_stale(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, ChatMessage.STATUS_PENDING)
+        self.assertIsNone(job.started_at)
+        busy.refresh_from_db()
+        self.assertEqual(busy.status, ChatMessage.STATUS_RUNNING)
+
+        claim_and_abandon(job)
+        self.assertEqual(queue.requeue_stale(), 0)
+        job.refresh_from_db()
+        self.assertEqual(job.status, ChatMessage.STATUS_FAILED)
+        self.assertEqual(job.attempts, 2)
+        self.assertEqual(job.error, 'Gave up after 2 attempts')
+        self.assertIsNotNone(job.completed_at)
+
+
+@skipUnless(FAISS_AVAILABLE, 'numpy and faiss are not installed')
+class ChatJobViewTests(TransactionTestCase):
+    """POST /api/chat with respond_async, then GET /api/chat/jobs/<id>?wait="""
+
+    def setUp(self):
+        use_rag_settings(self)
+        self.user = get_user_model().objects.create_user(username='carol', password='secret-password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        # Workers are run by hand, so the test decides when the job is answered
+        self.queue = ChatJobQueue(workers=1, poll_interval=5)
+        self.queue.start = lambda: None
+        patcher = mock.patch('chat.job_queue._job_queue', self.queue)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def run_worker_later(self, delay):
+        def work():
+            try:
+                time.sleep(delay)
+                self.queue._run(self.queue._claim_next())
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=work)
+        thread.start()
+        self.addCleanup(thread.join)
+
+    def test_async_request_is_accepted_then_completed(self):
+        response = self.client.post(
+            '/api/chat', {'message': 'What is Redis?', 'respond_async': True}, format='json'
+        )
+        self.assertEqual(response.status_code, 202, response.data)
+        self.assertEqual(response.data['status'], ChatMessage.STATUS_PENDING)
+        self.assertEqual(response['Location'], f"/api/chat/jobs/{response.data['job_id']}")
+
+        pending = self.client.get(response['Location'])
+        self.assertEqual(pending.data['status'], ChatMessage.STATUS_PENDING)
+
+        self.run_worker_later(0.2)
+        start = time.monotonic()
+        done = self.client.get(response['Location'] + '?wait=10')
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertEqual(done.status_code, 200)
+        self.assertEqual(done.data['status'], ChatMessage.STATUS_COMPLETED, done.data)
+        self.assertIn('Redis', done.data['ai_response'])
+        self.assertEqual(done.data['conversation_id'], response.data['conversation_id'])
+
+    def test_prefer_header_requests_an_async_response(self):
+        response = self.client.post(
+            '/api/chat', {'message': 'What is Redis?'}, format='json', HTTP_PREFER='respond-async'
+        )
+        self.assertEqual(response.status_code, 202, response.data)
+
+    def test_sync_status_wait_is_capped_and_asks_to_retry(self):
+        response = self.client.post(
+            '/api/chat', {'message': 'What is Redis?', 'respond_async': True}, format='json'
+        )
+        start = time.monotonic()
+        pending = self.client.get(response['Location'] + '?wait=20')
+        self.assertLess(time.monotonic() - start, 3)
+        self.assertEqual(pending.data['status'], ChatMessage.STATUS_PENDING)
+        self.assertIn('Retry-After', pending)
+
+    def test_async_status_long_polls_until_completed(self):
+        response = self.client.post(
+            '/api/chat', {'message': 'What is Redis?', 'respond_async': True}, format='json'
+        )
+        job_id = response.data['job_id']
+        token = str(AccessToken.for_user(self.user))
+
+        self.run_worker_later(1.5)
+        start = time.monotonic()
+        done = async_to_sync(AsyncClient().get)(
+            f'/api/async/chat/jobs/{job_id}?wait=10', headers={'Authorization': f'Bearer {token}'}
+        )
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertEqual(done.status_code, 200)
+        self.assertEqual(done.json()['status'], ChatMessage.STATUS_COMPLETED, done.json())
+        self.assertNotIn('Retry-After', done)
+
+
+class SlowReranker:
+    """Cross-encoder stand-in: scores by text length, sleeping per batch"""
+
+    name = 'slow'
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.batches = 0
+
+    def score(self, query, texts):
+        self.batches += 1
+        time.sleep(self.delay)
+        return [float(len(text)) for text in texts]
+
+
+@skipUnless(FAISS_AVAILABLE, 'numpy and faiss are not installed')
+class MicroBatcherTests(SimpleTestCase):
+    """Coalescing of concurrent query encodings by chat.batching.MicroBatcher"""
+
+    def setUp(self):
+        self.calls = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def encode(self, texts):
+        import numpy as np
+
+        self.calls.append(list(texts))
+        self.release.wait(5)
+        return np.array([[float(text.split()[-1]), 1.0] for text in texts])
+
+    def encode_concurrently(self, batcher, count):
+        with ThreadPoolExecutor(max_workers=count) as pool:
+            # The first query holds the encoder until the rest are queued behind it
+            self.release.clear()
+            first = pool.submit(batcher.encode, 'query 0')
+            while not self.calls:
+                time.sleep(0.005)
+            rest = [pool.submit(batcher.encode, f'query {i}') for i in range(1, count)]
+            while batcher._queue.qsize() < count - 1:
+                time.sleep(0.005)
+            self.release.set()
+            return [future.result() for future in [first] + rest]
+
+    def test_lone_query_is_encoded_without_waiting(self):
+        from .batching import MicroBatcher
+
+        batcher = MicroBatcher(self.encode, max_wait_ms=2000)
+        start = time.monotonic()
+        vector = batcher.encode('query 7')
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(vector.shape, (1, 2))
+        self.assertEqual(vector[0, 0], 7.0)
+
+    def test_concurrent_queries_share_batches(self):
+        from .batching import MicroBatcher
+
+        batcher = MicroBatcher(self.encode, max_batch_size=4, max_wait_ms=50)
+        vectors = self.encode_concurrently(batcher, 9)
+        self.assertEqual([vector[0, 0] for vector in vectors], [float(i) for i in range(9)])
+        self.assertEqual([len(call) for call in self.calls], [1, 4, 4])
+        self.assertEqual(batcher.stats()['items'], 9)
+        self.assertEqual(batcher.stats()['batches'], 3)
+
+    def test_failed_batch_fails_each_caller(self):
+        from .batching import MicroBatcher
+
+        batcher = MicroBatcher(mock.Mock(side_effect=RuntimeError('model down')))
+        with self.assertRaisesMessage(RuntimeError, 'model down'):
+            batcher.encode('query 1')
+        self.assertEqual(batcher.stats()['batches'], 0)
+
+
+class RerankTests(SimpleTestCase):
+    """Time budget of chat.reranking.rerank"""
+
+    def setUp(self):
+        pool = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(pool.shutdown)
+        self.pool = pool
+        # Retrieval order is shortest first; the scores prefer longer texts
+        self.hits = [{'id': i, 'text': 'x' * (i + 1)} for i in range(8)]
+
+    def test_scores_reorder_within_budget(self):
+        hits, completed = rerank(SlowReranker(0), 'query', self.hits, 3, self.pool, budget_ms=0, batch_size=4)
+        self.assertTrue(completed)
+        self.assertEqual([hit['id'] for hit in hits], [7, 6, 5])
+        self.assertEqual(hits[0]['rerank_score'], 8.0)
+
+    def test_unscored_candidates_keep_retrieval_order_when_budget_runs_out(self):
+        reranker = SlowReranker(0.1)
+        hits, completed = rerank(reranker, 'query', self.hits, 5, self.pool, budget_ms=50, batch_size=2)
+        self.assertFalse(completed)
+        self.assertEqual(hits, self.hits[:5])
+        self.assertTrue(all('rerank_score' not in hit for hit in hits))
+
+        # Scoring stops after the batch it was running
+        self.pool.submit(lambda: None).result()
+        self.assertEqual(reranker.batches, 1)
+
+    @skipUnless(FAISS_AVAILABLE, 'numpy and faiss are not installed')
+    def test_answer_from_unranked_context_is_not_cached(self):
+        use_rag_settings(self, RAG_RERANK_BUDGET_MS=20)
+        service = RAGService()
+        service.initialize()
+        service.reranker, service._rerank_pool = SlowReranker(0.2), self.pool
+
+        for _ in range(2):
+            timings = {}
+            service.get_response('What is Redis?', timings=timings)
+            self.assertIn('rerank_fallback_ms', timings)
+            self.assertIn('generation_ms', timings)
+        self.assertEqual(service.rerank_stats['fallbacks'], 2)
+
+
+@skipUnless(FAISS_AVAILABLE, 'numpy and faiss are not installed')
+class DiversityTests(SimpleTestCase):
+    """Maximal Marginal Relevance selection of chat.diversity.mmr"""
+
+    def setUp(self):
+        import numpy as np
+
+        # Rows 0 and 1 are near-copies; row 2 points elsewhere
+        self.vectors = np.array([[1.0, 0.0, 0.0], [0.99, 0.1, 0.0], [0.0, 1.0, 0.2], [0.0, 0.2, 1.0]])
+        self.relevance = np.array([1.0, 0.95, 0.6, 0.5])
+
+    def test_lambda_one_keeps_retrieval_order(self):
+        import numpy as np
+
+        from .diversity import mmr
+
+        vectors = np.random.default_rng(7).normal(size=(20, 8))
+        relevance = np.linspace(1.0, 0.0, 20)
+        selected, duplicates = mmr(vectors, relevance, 10, lambda_=1.0, duplicate_threshold=1.01)
+        self.assertEqual(selected, list(range(10)))
+        self.assertEqual(duplicates, 0)
+
+    def test_lower_lambda_prefers_novel_chunks(self):
+        from .diversity import mmr
+
+        selected, _ = mmr(self.vectors, self.relevance, 3, lambda_=0.5, duplicate_threshold=1.01)
+        self.assertEqual(selected[:2], [0, 2])
+        self.assertNotIn(1, selected[:3])
+
+    def test_near_duplicates_are_dropped(self):
+        from .diversity import mmr
+
+        selected, duplicates = mmr(self.vectors, self.relevance, 4, lambda_=1.0, duplicate_threshold=0.95)
+        self.assertEqual(selected, [0, 2, 3])
+        self.assertEqual(duplicates, 1)
+
+    def test_scores_are_normalised_to_relevance(self):
+        from .diversity import relevance_scores
+
+        hits = [{'score': 8.0}, {'score': 4.0}, {'score': 2.0}]
+        query = mock.Mock()
+        self.assertEqual([round(float(r), 3) for r in relevance_scores(hits, self.vectors[:3], query)],
+                         [1.0, 0.333, 0.0])
+        query.assert_not_called()
+
+
+@override_settings(RAG_MEMORY_ENABLED=True, RAG_MEMORY_RECENT_TURNS=2, RAG_MEMORY_TURN_TOKENS=100,
+                   RAG_MEMORY_SUMMARY_TOKENS=60, RAG_MEMORY_SUMMARIZER='extractive')
+class ConversationMemoryTests(TestCase):
+    """Rolling summary and recent turns of chat.memory"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='dave', password='secret-password')
+        self.conversation = Conversation.objects.create(user=self.user, title='Memory')
+
+    def answer(self, number, status=ChatMessage.STATUS_COMPLETED):
+        return ChatMessage.objects.create(
+            conversation=self.conversation, user=self.user, status=status,
+            user_message=f'Question {number} about topic{number}?',
+            ai_response=f'Answer {number} explains topic{number} at length. ' + 'More detail follows. ' * 20
+        )
+
+    def test_remember_turn_folds_old_turns_within_the_summary_budget(self):
+        messages = []
+        for number in range(1, 11):
+            messages.append(self.answer(number))
+            updated = remember_turn(self.conversation)
+            self.assertEqual(updated, number > 2)
+            # Everything but the last RAG_MEMORY_RECENT_TURNS messages is summarized
+            expected = messages[-3].id if number > 2 else 0
+            self.conversation.refresh_from_db()
+            self.assertEqual(self.conversation.summarized_through, expected)
+            self.assertLessEqual(count_tokens(self.conversation.summary), 60)
+
+        self.assertIn('topic8', self.conversation.summary)
+        self.assertNotIn('topic1 ', self.conversation.summary)
+        history = conversation_history(self.conversation)
+        self.assertIn('Summary of earlier turns:', history)
+        self.assertIn('Question 9', history)
+        self.assertIn('Question 10', history)
+        self.assertEqual(history.count('User:'), 2)
+
+    def test_history_before_id_excludes_the_queued_message(self):
+        self.answer(1)
+        self.answer(2)
+        job = self.answer(3, status=ChatMessage.STATUS_PENDING)
+        # Answered while the job waited in the queue
+        self.answer(4)
+
+        history = conversation_history(self.conversation, before_id=job.id)
+        self.assertIn('Question 1', history)
+        self.assertIn('Question 2', history)
+        self.assertNotIn('Question 3', history)
+        self.assertNotIn('Question 4', history)
+        self.assertIn('Question 4', conversation_history(self.conversation))
+
+    def test_only_one_of_two_concurrent_updates_wins(self):
+        for number in range(1, 5):
+            self.answer(number)
+        first = Conversation.objects.get(id=self.conversation.id)
+        second = Conversation.objects.get(id=self.conversation.id)
+
+        self.assertTrue(remember_turn(first))
+        self.assertFalse(remember_turn(second))
+        self.assertEqual(second.summarized_through, 0)
+
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.summarized_through, first.summarized_through)
+        self.assertEqual(self.conversation.summary, first.summary)
+        self.assertEqual(self.conversation.summary.count('- Q:'), 2)
+
+
+class StubGeminiHandler(MockGeminiHandler):
+    """The benchmark's mock Gemini API; models named error-<status> answer with that HTTP error"""
+
+    def do_POST(self):
+        match = re.search(r'/models/error-(\d+):', self.path)
+        if match is None:
+            super().do_POST()
+            return
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        status = int(match.group(1))
+        body = json.dumps({'error': {'code': status, 'message': 'stub failure'}}).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class IdleClosingGeminiHandler(StubGeminiHandler):
+    # Close keep-alive connections idle for more than 0.2s, as API front ends do
+    timeout = 0.2
+
+
+class StubGeminiServerMixin:
+    """Runs a stub Gemini API on localhost for each test"""
+
+    handler = StubGeminiHandler
+
+    def setUp(self):
+        self.server = MockGeminiServer(latency_ms=0, handshake_ms=0)
+        self.server.RequestHandlerClass = self.handler
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.api_base = f"http://127.0.0.1:{self.server.server_address[1]}/v1beta"
+
+    def make_client(self, model='gemini-2.5-flash'):
+        client = GeminiClient('test-key', model, transport='rest', api_base=self.api_base, pool_size=2)
+        self.addCleanup(client.close)
+        return client
+
+
+class GeminiRestClientTests(StubGeminiServerMixin, SimpleTestCase):
+    """Pooled REST transport of chat.llm.GeminiClient"""
+
+    def test_connection_is_reused(self):
+        client = self.make_client()
+        self.assertEqual(client.generate(PROMPT), ''.join(ANSWER_PIECES))
+        self.assertEqual(''.join(client.stream(PROMPT)), ''.join(ANSWER_PIECES))
+        self.assertEqual(client.generate(PROMPT), ''.join(ANSWER_PIECES))
+
+        stats = client.pool.stats()
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual((stats['connections_opened'], stats['connections_reused']), (1, 2))
+        self.assertEqual(stats['idle_connections'], 1)
+
+    def test_abandoned_stream_is_not_returned_to_the_pool(self):
+        client = self.make_client()
+        stream = client.stream(PROMPT)
+        self.assertEqual(next(stream), ANSWER_PIECES[0])
+        stream.close()
+        self.assertEqual(client.pool.stats()['idle_connections'], 0)
+
+        self.assertEqual(client.generate(PROMPT), ''.join(ANSWER_PIECES))
+        self.assertEqual(self.server.connections, 2)
+        self.assertEqual(client.pool.stats()['idle_connections'], 1)
+
+    def test_error_status_raises_gemini_error(self):
+        for status in (400, 503):
+            client = self.make_client(f'error-{status}')
+            with self.assertRaisesMessage(GeminiError, f'HTTP {status}: stub failure'):
+                client.generate(PROMPT)
+            with self.assertRaisesMessage(GeminiError, f'HTTP {status}: stub failure'):
+                list(client.stream(PROMPT))
+            # The error body was read, so the connection carries the next request
+            self.assertEqual(client.pool.stats()['connections_reused'], 1)
+
+
+class GeminiRestClientIdleTests(StubGeminiServerMixin, SimpleTestCase):
+    """Pooled REST transport against a server that drops idle connections"""
+
+    handler = IdleClosingGeminiHandler
+
+    def test_stale_idle_connection_is_retried_once(self):
+        client = self.make_client()
+        self.assertEqual(client.generate(PROMPT), ''.join(ANSWER_PIECES))
+        time.sleep(0.5)
+        self.assertEqual(client.generate(PROMPT), ''.join(ANSWER_PIECES))
+
+        stats = client.pool.stats()
+        self.assertEqual(stats['retries'], 1)
+        self.assertEqual(stats['connections_opened'], 2)
+        self.assertEqual(self.server.connections, 2)
+
+
+@skipUnless(FAISS_AVAILABLE, 'numpy and faiss are not installed')
+class ServiceRegistryTests(SimpleTestCase):
+    """Per-collection services kept within a memory budget"""
+
+    def setUp(self):
+        use_rag_settings(self)
+        # Three collections of the same size
+        for collection in ('acme', 'globex', 'initech'):
+            RAGService(collection).upsert_document('handbook', '\n\n'.join(KB_CHUNKS * 20))
+        service = RAGService('acme')
+        service.initialize()
+        self.size = service.memory_bytes()
+
+    def test_coldest_collection_is_evicted_once_a_load_exceeds_the_budget(self):
+        registry = ServiceRegistry(memory_budget=self.size * 2.5, max_resident=10)
+        registry.get('acme').initialize()
+        registry.get('globex').initialize()
+        registry.get('acme')
+        self.assertEqual(registry.evictions, 0)
+
+        # Before its index loads, a new service has no size to count
+        service = registry.get('initech')
+        self.assertTrue(registry.is_resident('globex'))
+        service.initialize()
+        self.assertFalse(registry.is_resident('globex'))
+        self.assertTrue(registry.is_resident('acme'))
+        self.assertTrue(registry.is_resident('initech'))
+        self.assertEqual(registry.evictions, 1)
+        self.assertLessEqual(registry.stats()['resident_bytes'], self.size * 2.5)
+
+    def test_growing_index_triggers_eviction(self):
+        registry = ServiceRegistry(memory_budget=self.size * 2.5, max_resident=10)
+        registry.get('acme').initialize()
+        registry.get('globex').initialize()
+        registry.get('acme').upsert_document('more', '\n\n'.join(f'Extra chunk {i}.' for i in range(2000)))
+        self.assertFalse(registry.is_resident('globex'))
+        self.assertTrue(registry.is_resident('acme'))
+
+
+class LazyImportTests(SimpleTestCase):
+    """Views and URLs load without the numerical and model libraries"""
+
+    def test_importing_the_views_skips_heavy_libraries(self):
+        heavy = ('numpy', 'faiss', 'torch', 'sentence_transformers', 'onnxruntime', 'google.generativeai')
+        code = (
+            "import json, sys, django; django.setup(); "
+            "import chat.views, chat.async_views, core.urls; "
+            f"print(json.dumps(sorted(set(sys.modules) & {set(heavy)!r})))"
+        )
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'core.settings'))
+        result = subprocess.run(
+            [sys.executable, '-c', code], cwd=settings.BASE_DIR, env=env, capture_output=True, text=True
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(json.loads(result.stdout.strip().splitlines()[-1]), [])
+
+
+class HealthCheckTests(SimpleTestCase):
+    """Load balancer probes /healthz/live and /healthz/ready"""
+
+    def setUp(self):
+        use_rag_settings(self)
+        self.client = APIClient()
+
+    def test_readiness_is_503_until_the_service_is_initialized(self):
+        with mock.patch.object(RAGService, 'warm_up') as warm_up:
+            response = self.client.get('/healthz/ready')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.data['status'], 'starting')
+        warm_up.assert_called_once()
+
+        get_rag_service().initialize()
+        response = self.client.get('/healthz/ready')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'ready')
+        self.assertEqual(response.data['index_size'], len(KB_CHUNKS))
+
+    def test_readiness_probe_starts_the_warm_up(self):
+        self.assertEqual(self.client.get('/healthz/ready').status_code, 503)
+        deadline = time.monotonic() + 10
+        while self.client.get('/healthz/ready').status_code != 200:
+            self.assertLess(time.monotonic(), deadline, 'warm-up did not finish')
+            time.sleep(0.05)
+
+    def test_liveness_does_not_touch_the_rag_service(self):
+        with mock.patch('chat.views.get_rag_service', side_effect=AssertionError('RAG service used')) as get:
+            response = self.client.get('/healthz/live')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'alive')
+        get.assert_not_called()
+
+
+def parse_sse(body):
+    """[(event, data)] of a text/event-stream body"""
+    events = []
+    for block in body.decode('utf-8').strip().split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.splitlines())
+        events.append((fields['event'], json.loads(fields['data'])))
+    return events
+
+
+@skipUnless(FAISS_AVAILABLE, 'numpy and faiss are not installed')
+class ChatStreamTests(TestCase):
+    """POST /api/chat/stream with the fake LLM"""
+
+    def setUp(self):
+        use_rag_settings(self, RAG_SEMANTIC_CACHE_ENABLED=False, RAG_RESPONSE_CACHE_ENABLED=False)
+        self.user = get_user_model().objects.create_user(username='erin', password='secret-password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def stream(self, **body):
+        response = self.client.post('/api/chat/stream', {'message': 'What is Redis?', **body}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        return response
+
+    def fail_part_way(self):
+        service = get_rag_service()
+        service.initialize()
+
+        def stream(prompt):
+            yield 'Redis is'
+            yield ' an in-memory'
+            raise GeminiError('HTTP 503: overloaded')
+
+        patcher = mock.patch.object(service.llm, 'stream', side_effect=stream)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_events_arrive_in_order_and_the_message_is_saved(self):
+        events = parse_sse(b''.join(self.stream().streaming_content))
+        names = [name for name, _ in events]
+        self.assertEqual(names[0], 'sources')
+        self.assertEqual(names[-1], 'done')
+        self.assertEqual(set(names[1:-1]), {'token'})
+        self.assertIn('Redis', events[0][1]['sources'][0]['text'])
+
+        done = events[-1][1]
+        self.assertIn('time_to_first_token_ms', done['latency'])
+        self.assertFalse(done['from_cache'])
+        message = ChatMessage.objects.get(id=done['id'])
+        self.assertEqual(message.conversation_id, done['conversation_id'])
+        self.assertEqual(message.ai_response, ''.join(data['text'] for name, data in events if name == 'token'))
+
+    def test_failure_part_way_sends_an_error_and_drops_the_new_conversation(self):
+        self.fail_part_way()
+        events = parse_sse(b''.join(self.stream().streaming_content))
+        self.assertEqual([name for name, _ in events], ['sources', 'token', 'token', 'error'])
+        self.assertIn('HTTP 503: overloaded', events[-1][1]['error'])
+        self.assertFalse(ChatMessage.objects.exists())
+        self.assertFalse(Conversation.objects.exists())
+
+    def test_failure_keeps_an_existing_conversation(self):
+        conversation = Conversation.objects.create(user=self.user, title='Earlier')
+        self.fail_part_way()
+        events = parse_sse(b''.join(self.stream(conversation_id=conversation.id).streaming_content))
+        self.assertEqual(events[-1][0], 'error')
+        self.assertTrue(Conversation.objects.filter(id=conversation.id).exists())
+        self.assertFalse(ChatMessage.objects.exists())
+
+    def test_client_disconnect_drops_the_new_conversation(self):
+        response = self.stream()
+        first = next(iter(response.streaming_content))
+        self.assertTrue(first.startswith(b'event: sources'))
+        self.assertEqual(Conversation.objects.count(), 1)
+        response.close()
+        self.assertFalse(Conversation.objects.exists())
+        self.assertFalse(ChatMessage.objects.exists())
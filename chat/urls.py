@@ -1,6 +1,9 @@
 from django.urls import path
+from . import async_views
 from .views import (
     chat, 
+    chat_stream,
+    chat_job_status,
     chat_history, 
     chat_page,
     scheduler_admin_page,
@@ -10,21 +13,45 @@ from .views import (
     conversation_rename,
     scheduler_status,
     trigger_task,
-    system_statistics
+    system_statistics,
+    kb_document_upsert,
+    kb_document_delete,
+    kb_compact,
+    rag_status,
+    rag_collections,
+    health_live,
+    health_ready
 )
 
 urlpatterns = [
     path('chat', chat, name='chat'),
+    path('chat/stream', chat_stream, name='chat_stream'),
+    path('chat/jobs/<int:job_id>', chat_job_status, name='chat_job_status'),
     path('chat-history', chat_history, name='chat_history_list'),
     path('conversations', conversations_list, name='conversations_list'),
     path('conversations/<int:conversation_id>', conversation_detail, name='conversation_detail'),
     path('conversations/<int:conversation_id>/delete', conversation_delete, name='conversation_delete'),
     path('conversations/<int:conversation_id>/rename', conversation_rename, name='conversation_rename'),
     
+    # Async (ASGI) chat and conversation endpoints
+    path('async/chat', async_views.chat, name='async_chat'),
+    path('async/chat/jobs/<int:job_id>', async_views.chat_job_status, name='async_chat_job_status'),
+    path('async/conversations', async_views.conversations_list, name='async_conversations_list'),
+    path('async/conversations/<int:conversation_id>', async_views.conversation_detail, name='async_conversation_detail'),
+    path('async/conversations/<int:conversation_id>/delete', async_views.conversation_delete, name='async_conversation_delete'),
+    path('async/conversations/<int:conversation_id>/rename', async_views.conversation_rename, name='async_conversation_rename'),
+    
     # Admin scheduler endpoints
     path('admin/scheduler/status', scheduler_status, name='scheduler_status'),
     path('admin/scheduler/trigger', trigger_task, name='trigger_task'),
     path('admin/scheduler/statistics', system_statistics, name='system_statistics'),
+    
+    # Admin knowledge base endpoints
+    path('admin/rag/documents', kb_document_upsert, name='kb_document_upsert'),
+    path('admin/rag/documents/<str:document_id>/delete', kb_document_delete, name='kb_document_delete'),
+    path('admin/rag/compact', kb_compact, name='kb_compact'),
+    path('admin/rag/status', rag_status, name='rag_status'),
+    path('admin/rag/collections', rag_collections, name='rag_collections'),
 ]
 
 # Web page URLs (not under /api/)
@@ -32,3 +59,9 @@ web_urlpatterns = [
     path('chat-page', chat_page, name='chat_page'),
     path('scheduler-admin', scheduler_admin_page, name='scheduler_admin'),
 ]
+
+# Load balancer health checks (not under /api/)
+health_urlpatterns = [
+    path('healthz/live', health_live, name='health_live'),
+    path('healthz/ready', health_ready, name='health_ready'),
+]
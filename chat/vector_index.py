@@ -0,0 +1,324 @@
+"""
+Vector search structures used by the RAG service.
+
+All indexes expose the same ``search(queries, k)`` contract as FAISS:
+a pair of (distances, indices) arrays of shape (num_queries, k), with
+squared L2 distances and ``-1`` for missing results.
+
+Index types (``RAG_INDEX_TYPE``):
+    flat      exact scan (memory-mapped, or FAISS IndexFlatL2)
+    ivf_flat  inverted lists over k-means cells, probes ``nprobe`` cells
+    ivf_pq    inverted lists with product-quantized codes
+    hnsw      hierarchical navigable small-world graph, ``ef_search`` wide
+
+Embedding storage of the flat scan (``RAG_EMBEDDING_STORAGE``):
+    float32   4 bytes per dimension, exact
+    float16   2 bytes per dimension (FAISS IndexScalarQuantizer, fp16)
+    int8      1 byte per dimension, scalar-quantized between the
+              per-dimension minimum and maximum (IndexScalarQuantizer, 8bit)
+    pq        ``pq_m`` codes of ``pq_nbits`` bits per vector (IndexPQ)
+
+Lossy storage can be wrapped in ``RescoringIndex``, which re-ranks the
+top candidates by exact distance over the float32 rows.
+"""
+import hashlib
+import json
+import logging
+import math
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+INDEX_TYPES = ('flat', 'ivf_flat', 'ivf_pq', 'hnsw')
+
+STORAGE_TYPES = ('float32', 'float16', 'int8', 'pq')
+
+DEFAULT_INDEX_PARAMS = {
+    'nlist': 0,              # IVF cells; 0 picks 4 * sqrt(N)
+    'nprobe': 8,             # IVF cells visited per query
+    'pq_m': 16,              # PQ sub-quantizers (must divide the dimension)
+    'pq_nbits': 8,           # bits per PQ code
+    'hnsw_m': 32,            # HNSW neighbours per node
+    'ef_construction': 200,  # HNSW build-time search width
+    'ef_search': 64,         # HNSW query-time search width
+    'train_sample': 50000,   # vectors sampled to train IVF/PQ
+}
+
+# Build-time parameters; search-time ones (nprobe, ef_search) can change
+# without rebuilding the index
+BUILD_PARAMS = ('nlist', 'pq_m', 'pq_nbits', 'hnsw_m', 'ef_construction')
+
+# FAISS recommends at least this many training points per centroid
+MIN_POINTS_PER_CENTROID = 39
+
+
+class MemmapFlatIndex:
+    """
+    Exact L2 search directly over a (possibly memory-mapped) matrix.
+
+    Squared distances are computed as ``|x|^2 - 2 x.q + |q|^2`` with the
+    row norms precomputed at build time. Rows are scanned in blocks so a
+    query never materialises more than one block of distances, and the
+    matrix itself is never copied into process memory.
+    """
+
+    block_rows = 16384
+
+    def __init__(self, embeddings, norms=None):
+        self.embeddings = embeddings
+        if norms is None:
+            norms = np.einsum('ij,ij->i', embeddings, embeddings)
+        self.norms = norms
+        self.ntotal = int(embeddings.shape[0])
+        self.d = int(embeddings.shape[1]) if embeddings.ndim == 2 else 0
+
+    def search(self, queries, k):
+        queries = np.ascontiguousarray(queries, dtype='float32')
+        num_queries = queries.shape[0]
+        best_distances = np.full((num_queries, k), np.inf, dtype='float32')
+        best_indices = np.full((num_queries, k), -1, dtype='int64')
+        if self.ntotal == 0 or k <= 0:
+            return best_distances, best_indices
+
+        query_norms = np.einsum('ij,ij->i', queries, queries)[:, None]
+
+        for start in range(0, self.ntotal, self.block_rows):
+            end = min(start + self.block_rows, self.ntotal)
+            block = self.embeddings[start:end]
+            distances = self.norms[start:end][None, :] - 2.0 * (queries @ block.T) + query_norms
+            np.maximum(distances, 0.0, out=distances)
+
+            merged_distances = np.concatenate([best_distances, distances.astype('float32')], axis=1)
+            merged_indices = np.concatenate(
+                [best_indices, np.broadcast_to(np.arange(start, end), distances.shape)],
+                axis=1
+            )
+            keep = min(k, merged_distances.shape[1])
+            top = np.argpartition(merged_distances, keep - 1, axis=1)[:, :keep]
+            best_distances = np.take_along_axis(merged_distances, top, axis=1)
+            best_indices = np.take_along_axis(merged_indices, top, axis=1)
+
+        order = np.argsort(best_distances, axis=1, kind='stable')
+        best_distances = np.take_along_axis(best_distances, order, axis=1)
+        best_indices = np.take_along_axis(best_indices, order, axis=1)
+        best_indices[~np.isfinite(best_distances)] = -1
+        return best_distances, best_indices
+
+
+class RescoringIndex:
+    """
+    Re-rank the top ``k * factor`` candidates of a lossy index by exact distance.
+
+    Only the candidate rows of the float32 matrix are read, so when it is
+    memory-mapped the full-precision vectors stay on disk.
+    """
+
+    def __init__(self, index, embeddings, factor):
+        self.index = index
+        self.embeddings = embeddings
+        self.factor = max(1, factor)
+        self.ntotal = index.ntotal
+
+    def search(self, queries, k):
+        queries = np.ascontiguousarray(queries, dtype='float32')
+        best_distances = np.full((len(queries), k), np.inf, dtype='float32')
+        best_indices = np.full((len(queries), k), -1, dtype='int64')
+        if self.ntotal == 0 or k <= 0:
+            return best_distances, best_indices
+
+        _, candidates = self.index.search(queries, min(self.ntotal, k * self.factor))
+        for q in range(len(queries)):
+            # Sorted rows read the memory-mapped matrix front to back
+            rows = np.unique(candidates[q][candidates[q] >= 0])
+            diff = np.asarray(self.embeddings[rows], dtype='float32') - queries[q]
+            distances = np.einsum('ij,ij->i', diff, diff)
+            top = np.argsort(distances, kind='stable')[:k]
+            best_distances[q, :len(top)] = distances[top]
+            best_indices[q, :len(top)] = rows[top]
+        return best_distances, best_indices
+
+
+def build_flat_index(embeddings):
+    """Build an in-process exact L2 FAISS index over the embeddings"""
+    import faiss
+
+    index = faiss.IndexFlatL2(embeddings.shape[1])
+    index.add(np.ascontiguousarray(embeddings, dtype='float32'))
+    return index
+
+
+def resolve_params(params=None):
+    resolved = dict(DEFAULT_INDEX_PARAMS)
+    resolved.update({k: v for k, v in (params or {}).items() if v is not None})
+    return resolved
+
+
+def effective_index_type(index_type, num_vectors, params=None):
+    """
+    Index type that can actually be trained for this many vectors.
+
+    IVF and PQ need enough training points; small corpora fall back to an
+    exact flat scan, which is also the fastest choice at that size.
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type '{index_type}'. Choose: {', '.join(INDEX_TYPES)}")
+    params = resolve_params(params)
+    if index_type in ('ivf_flat', 'ivf_pq'):
+        if num_vectors < MIN_POINTS_PER_CENTROID * _nlist(num_vectors, params):
+            return 'flat'
+        if index_type == 'ivf_pq' and num_vectors < MIN_POINTS_PER_CENTROID * (1 << params['pq_nbits']):
+            return 'flat'
+    return index_type
+
+
+def effective_storage(storage, num_vectors, dimension, params=None):
+    """
+    Storage that can actually be used for this many vectors.
+
+    PQ codebooks need enough training points and a dimension divisible by
+    ``pq_m``; otherwise (and for an empty index) vectors stay float32.
+    """
+    if storage not in STORAGE_TYPES:
+        raise ValueError(f"Unknown embedding storage '{storage}'. Choose: {', '.join(STORAGE_TYPES)}")
+    params = resolve_params(params)
+    if num_vectors == 0:
+        return 'float32'
+    if storage == 'pq' and (
+        num_vectors < MIN_POINTS_PER_CENTROID * (1 << params['pq_nbits'])
+        or dimension % params['pq_m']
+    ):
+        return 'float32'
+    return storage
+
+
+def storage_file_name(storage, params=None):
+    """File name of persisted quantized vectors, unique per storage and build parameters"""
+    params = resolve_params(params)
+    build = {'storage': storage}
+    if storage == 'pq':
+        build.update({name: params[name] for name in ('pq_m', 'pq_nbits', 'train_sample')})
+    digest = hashlib.sha256(json.dumps(build, sort_keys=True).encode('utf-8')).hexdigest()[:10]
+    return f"vectors-{storage}-{digest}.faiss"
+
+
+def build_storage_index(embeddings, storage, params=None):
+    """
+    Exhaustive FAISS index over the embeddings quantized for ``storage``.
+
+    Scalar quantizers take their per-dimension ranges, and PQ its
+    codebooks, from a sample of at most ``train_sample`` vectors.
+    """
+    import faiss
+
+    params = resolve_params(params)
+    embeddings = np.ascontiguousarray(embeddings, dtype='float32')
+    num_vectors, dimension = embeddings.shape
+    storage = effective_storage(storage, num_vectors, dimension, params)
+
+    if storage == 'float32':
+        return build_flat_index(embeddings)
+    if storage == 'pq':
+        index = faiss.IndexPQ(dimension, params['pq_m'], params['pq_nbits'])
+    else:
+        quantizer_type = faiss.ScalarQuantizer.QT_fp16 if storage == 'float16' else faiss.ScalarQuantizer.QT_8bit
+        index = faiss.IndexScalarQuantizer(dimension, quantizer_type, faiss.METRIC_L2)
+
+    sample = embeddings
+    if num_vectors > params['train_sample']:
+        rows = np.random.default_rng(0).choice(num_vectors, params['train_sample'], replace=False)
+        sample = embeddings[np.sort(rows)]
+    index.train(sample)
+    index.add(embeddings)
+    return index
+
+
+def _nlist(num_vectors, params):
+    if params['nlist']:
+        return int(params['nlist'])
+    return max(1, int(4 * math.sqrt(max(num_vectors, 1))))
+
+
+def index_file_name(index_type, num_vectors, params=None):
+    """File name of a persisted ANN index, unique per type and build parameters"""
+    params = resolve_params(params)
+    build = {name: params[name] for name in BUILD_PARAMS}
+    build['nlist'] = _nlist(num_vectors, params)
+    digest = hashlib.sha256(json.dumps(build, sort_keys=True).encode('utf-8')).hexdigest()[:10]
+    return f"index-{index_type}-{digest}.faiss"
+
+
+def build_ann_index(embeddings, index_type, params=None):
+    """
+    Build and train a FAISS index of the given type over the embeddings.
+
+    IVF quantizers and PQ codebooks are trained on a random sample of at
+    most ``train_sample`` vectors.
+    """
+    import faiss
+
+    params = resolve_params(params)
+    embeddings = np.ascontiguousarray(embeddings, dtype='float32')
+    num_vectors, dimension = embeddings.shape
+    index_type = effective_index_type(index_type, num_vectors, params)
+
+    if index_type == 'flat':
+        return build_flat_index(embeddings)
+
+    if index_type == 'hnsw':
+        index = faiss.IndexHNSWFlat(dimension, params['hnsw_m'])
+        index.hnsw.efConstruction = params['ef_construction']
+    else:
+        nlist = _nlist(num_vectors, params)
+        quantizer = faiss.IndexFlatL2(dimension)
+        if index_type == 'ivf_flat':
+            index = faiss.IndexIVFFlat(quantizer, dimension, nlist)
+        else:
+            if dimension % params['pq_m']:
+                raise ValueError(f"pq_m={params['pq_m']} must divide the embedding dimension {dimension}")
+            index = faiss.IndexIVFPQ(quantizer, dimension, nlist, params['pq_m'], params['pq_nbits'])
+
+        sample_size = min(num_vectors, params['train_sample'])
+        sample = embeddings
+        if sample_size < num_vectors:
+            rows = np.random.default_rng(0).choice(num_vectors, sample_size, replace=False)
+            sample = embeddings[np.sort(rows)]
+        index.train(sample)
+
+    index.add(embeddings)
+    configure_search(index, index_type, params)
+    return index
+
+
+def configure_search(index, index_type, params=None):
+    """Apply search-time tunables (nprobe, efSearch) to a FAISS index"""
+    params = resolve_params(params)
+    if index_type in ('ivf_flat', 'ivf_pq') and hasattr(index, 'nprobe'):
+        index.nprobe = params['nprobe']
+    elif index_type == 'hnsw' and hasattr(index, 'hnsw'):
+        index.hnsw.efSearch = params['ef_search']
+    return index
+
+
+def read_ann_index(path, mmap=True):
+    """Read a persisted FAISS index, memory-mapping its codes when supported"""
+    import faiss
+
+    if mmap:
+        flag = getattr(faiss, 'IO_FLAG_MMAP_IFC', faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+        try:
+            return faiss.read_index(path, flag)
+        except RuntimeError as e:
+            logger.info(f"Memory-mapped read not supported for {path}, loading into memory: {str(e)}")
+    return faiss.read_index(path)
+
+
+def index_memory_bytes(index):
+    """Approximate memory used by an index's vectors/codes and structure"""
+    if isinstance(index, RescoringIndex):
+        # The float32 rows are read on demand, not held
+        return index_memory_bytes(index.index)
+    if isinstance(index, MemmapFlatIndex):
+        return int(index.embeddings.nbytes + index.norms.nbytes)
+    import faiss
+    return int(faiss.serialize_index(index).size)
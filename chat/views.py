@@ -1,16 +1,23 @@
+import json
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
 from django.shortcuts import render, get_object_or_404
 from rest_framework import status
-from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
+from rest_framework.permissions import AllowAny, IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
 from .models import ChatMessage, Conversation
 from .serializers import (
+    ChatJobSerializer,
     ChatMessageSerializer, 
     ChatRequestSerializer, 
     ConversationSerializer,
     ConversationDetailSerializer
 )
-from .rag_service import get_rag_service
+from .job_queue import get_job_queue
+from .memory import conversation_history, remember_turn
+from .rag_service import UnknownCollection, get_rag_service, get_service_registry, list_collections
 from .scheduler import get_scheduled_jobs, run_job_now
 from .tasks import (
     run_all_housekeeping_tasks,
@@ -19,8 +26,11 @@ from .tasks import (
     cleanup_inactive_users,
     generate_statistics
 )
+import os
 import time
 
+PROCESS_STARTED_AT = time.time()
+
 
 def chat_page(request):
     """Render the chat interface"""
@@ -39,8 +49,16 @@ def chat(request):
     Handle chat requests from authenticated users
     
     POST /chat
-    Body: {"message": "user question", "conversation_id": 1 (optional)}
-    Returns: {"user_message": "...", "ai_response": "...", "timestamp": "...", "conversation_id": 1, "latency": {...}}
+    Body: {"message": "user question", "conversation_id": 1 (optional),
+           "retrieval_mode": "dense|lexical|hybrid" (optional), "fusion": "rrf|weighted" (optional),
+           "collection": "acme" (optional, default RAG_DEFAULT_COLLECTION), "respond_async": false (optional)}
+    Returns: {"user_message": "...", "ai_response": "...", "timestamp": "...", "conversation_id": 1,
+              "collection": "acme", "from_cache": false, "cache": null | "response" | "semantic",
+              "tokens": {"context": 412, ...} | null, "latency": {...}}
+    An unknown collection is 404.
+    With "respond_async": true or a "Prefer: respond-async" header the message is queued
+    and the response is 202 {"job_id": 7, "status": "pending", "conversation_id": 1, ...};
+    poll GET /chat/jobs/<job_id> for the answer.
     """
     start_time = time.time()
     
@@ -51,24 +69,32 @@ def chat(request):
     user_message = serializer.validated_data['message']
     conversation_id = serializer.validated_data.get('conversation_id')
     
+    try:
+        rag_service = get_rag_service(serializer.validated_data.get('collection'))
+    except UnknownCollection as e:
+        return Response({'error': str(e)}, status=status.HTTP_404_NOT_FOUND)
+    
+    if serializer.validated_data['respond_async'] or 'respond-async' in request.headers.get('Prefer', ''):
+        return _submit_chat_job(request, serializer.validated_data)
+    
     try:
         # Get or create conversation
         conversation_start = time.time()
-        if conversation_id:
-            conversation = get_object_or_404(Conversation, id=conversation_id, user=request.user)
-        else:
-            # Create new conversation with first message as title
-            title = user_message[:50] + ('...' if len(user_message) > 50 else '')
-            conversation = Conversation.objects.create(
-                user=request.user,
-                title=title
-            )
+        conversation = _get_or_create_conversation(request.user, conversation_id, user_message)
+        # Summary and last turns of an existing conversation, for follow-up questions
+        history = conversation_history(conversation) if conversation_id else ''
         conversation_time = time.time() - conversation_start
         
-        # Get RAG service and generate response
+        # Generate response from the collection's RAG service
         rag_start = time.time()
-        rag_service = get_rag_service()
-        ai_response = rag_service.get_response(user_message)
+        rag_timings = {}
+        ai_response = rag_service.get_response(
+            user_message,
+            retrieval_mode=serializer.validated_data.get('retrieval_mode'),
+            fusion=serializer.validated_data.get('fusion'),
+            timings=rag_timings,
+            history=history
+        )
         rag_time = time.time() - rag_start
         
         # Save to database
@@ -79,6 +105,7 @@ def chat(request):
             user_message=user_message,
             ai_response=ai_response
         )
+        remember_turn(conversation, rag_service)
         db_time = time.time() - db_start
         
         total_time = time.time() - start_time
@@ -87,6 +114,9 @@ def chat(request):
         response_serializer = ChatMessageSerializer(chat_message)
         data = response_serializer.data
         data['conversation_id'] = conversation.id
+        data['collection'] = rag_service.collection
+        # Prompt token counts; None when the answer came from a cache
+        data['tokens'] = rag_timings.pop('tokens', None)
         data['latency'] = {
             'total_ms': round(total_time * 1000, 2),
             'rag_processing_ms': round(rag_time * 1000, 2),
@@ -95,8 +125,19 @@ def chat(request):
                 'conversation_setup_ms': round(conversation_time * 1000, 2),
                 'rag_query_ms': round(rag_time * 1000, 2),
                 'database_save_ms': round(db_time * 1000, 2)
-            }
+            },
+            'rag_breakdown': rag_timings
         }
+        # Answered from a cache: no retrieval or generation ran
+        cache_source = next(
+            (name for name in ('response', 'semantic') if f'{name}_cache_hit_ms' in rag_timings),
+            None
+        )
+        data['from_cache'] = cache_source is not None
+        data['cache'] = cache_source
+        if cache_source:
+            breakdown = data['latency']['breakdown']
+            breakdown[f'{cache_source}_cache_ms'] = breakdown.pop('rag_query_ms')
         return Response(data, status=status.HTTP_201_CREATED)
         
     except Exception as e:
@@ -106,6 +147,202 @@ def chat(request):
         )
 
 
+def _submit_chat_job(request, validated_data):
+    """Queue a chat for the background workers and answer 202 Accepted"""
+    data, status_code, headers = queue_chat_job(request.user, validated_data)
+    return Response(data, status=status_code, headers=headers)
+
+
+def queue_chat_job(user, validated_data):
+    """
+    Queue a chat for the background workers (shared by the sync and async chat views)
+    
+    Returns:
+        tuple: (response body, HTTP status, response headers): 202 with the
+            job and its status URL, or 503 when the queue is full
+    """
+    job_queue = get_job_queue()
+    if job_queue.is_full():
+        return (
+            {'error': 'Too many chats are queued, please retry shortly'},
+            status.HTTP_503_SERVICE_UNAVAILABLE,
+            {'Retry-After': '5'}
+        )
+    
+    user_message = validated_data['message']
+    conversation = _get_or_create_conversation(user, validated_data.get('conversation_id'), user_message)
+    options = {
+        key: validated_data[key] for key in ('retrieval_mode', 'fusion', 'collection') if key in validated_data
+    }
+    job = job_queue.submit(conversation, user, user_message, options)
+    
+    status_url = f"/api/chat/jobs/{job.id}"
+    data = ChatJobSerializer(job).data
+    data['status_url'] = status_url
+    return data, status.HTTP_202_ACCEPTED, {'Location': status_url}
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def chat_job_status(request, job_id):
+    """
+    Get the status and result of a background chat
+    
+    GET /chat/jobs/<job_id>?wait=<seconds>
+    Returns: {"job_id": 7, "status": "pending|running|completed|failed", "conversation_id": 1,
+              "user_message": "...", "ai_response": "...", "error": "", "tokens": {...} | null,
+              "latency": {...}}
+    With wait > 0 the request blocks until the job finishes or wait seconds pass,
+    capped at RAG_JOB_SYNC_WAIT_MAX_SECONDS so a worker thread is not held for
+    long; an unfinished job comes back with Retry-After. Long-poll on
+    /async/chat/jobs/<job_id> instead.
+    """
+    job = get_object_or_404(ChatMessage, id=job_id, user=request.user)
+    
+    try:
+        wait = float(request.query_params.get('wait', 0))
+    except ValueError:
+        return Response({'error': 'wait must be a number of seconds'}, status=status.HTTP_400_BAD_REQUEST)
+    wait = min(max(wait, 0.0), settings.RAG_JOB_SYNC_WAIT_MAX_SECONDS)
+    
+    job_queue = get_job_queue()
+    # Restarted process with jobs still queued: make sure someone drains them
+    job_queue.start()
+    if wait and job.status in (ChatMessage.STATUS_PENDING, ChatMessage.STATUS_RUNNING):
+        job = job_queue.wait(job, wait)
+    
+    headers = None
+    if job.status in (ChatMessage.STATUS_PENDING, ChatMessage.STATUS_RUNNING):
+        headers = {'Retry-After': str(max(1, round(settings.RAG_JOB_POLL_SECONDS)))}
+    return Response(ChatJobSerializer(job).data, status=status.HTTP_200_OK, headers=headers)
+
+
+def _get_or_create_conversation(user, conversation_id, user_message):
+    """The user's conversation, or a new one titled after the first message"""
+    if conversation_id:
+        return get_object_or_404(Conversation, id=conversation_id, user=user)
+    
+    # Create new conversation with first message as title
+    title = user_message[:50] + ('...' if len(user_message) > 50 else '')
+    return Conversation.objects.create(user=user, title=title)
+
+
+def _sse_event(event, data):
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def chat_stream(request):
+    """
+    Streaming variant of /chat using Server-Sent Events
+    
+    POST /chat/stream
+    Body: same as /chat
+    Returns: text/event-stream with events
+        sources  {"conversation_id": 1, "sources": [{"rank": 1, "text": "..."}]}
+        token    {"text": "..."}  (repeated)
+        done     {"id": 7, "conversation_id": 1, "timestamp": "...", "from_cache": false,
+                  "cache": null, "tokens": {...} | null, "latency": {...}}
+        error    {"error": "..."}  (instead of done, e.g. when the model fails part-way)
+    The ChatMessage is saved once the answer is complete. A conversation created for
+    this message is deleted again if the answer fails or the client disconnects.
+    """
+    start_time = time.time()
+    
+    serializer = ChatRequestSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        rag_service = get_rag_service(serializer.validated_data.get('collection'))
+    except UnknownCollection as e:
+        return Response({'error': str(e)}, status=status.HTTP_404_NOT_FOUND)
+    
+    user_message = serializer.validated_data['message']
+    conversation_id = serializer.validated_data.get('conversation_id')
+    conversation_start = time.time()
+    conversation = _get_or_create_conversation(request.user, conversation_id, user_message)
+    history = conversation_history(conversation) if conversation_id else ''
+    conversation_time = time.time() - conversation_start
+    user = request.user
+    
+    def event_stream():
+        rag_timings = {}
+        pieces = []
+        chat_message = None
+        try:
+            rag_start = time.time()
+            events = rag_service.stream_response(
+                user_message,
+                retrieval_mode=serializer.validated_data.get('retrieval_mode'),
+                fusion=serializer.validated_data.get('fusion'),
+                timings=rag_timings,
+                history=history
+            )
+            for event, payload in events:
+                if event == 'sources':
+                    yield _sse_event('sources', {'conversation_id': conversation.id, 'sources': payload})
+                elif event == 'error':
+                    yield _sse_event('error', {'error': f'Failed to process chat: {payload}'})
+                    return
+                else:
+                    pieces.append(payload)
+                    yield _sse_event('token', {'text': payload})
+            rag_time = time.time() - rag_start
+            
+            db_start = time.time()
+            chat_message = ChatMessage.objects.create(
+                conversation=conversation,
+                user=user,
+                user_message=user_message,
+                ai_response=''.join(pieces)
+            )
+            db_time = time.time() - db_start
+        except Exception as e:
+            yield _sse_event('error', {'error': f'Failed to process chat: {str(e)}'})
+            return
+        finally:
+            # Failed, or the client went away: don't leave an empty new conversation behind
+            if chat_message is None and not conversation_id:
+                conversation.delete()
+        
+        cache_source = next(
+            (name for name in ('response', 'semantic') if f'{name}_cache_hit_ms' in rag_timings),
+            None
+        )
+        total_time = time.time() - start_time
+        yield _sse_event('done', {
+            'id': chat_message.id,
+            'conversation_id': conversation.id,
+            'timestamp': chat_message.timestamp.isoformat(),
+            'from_cache': cache_source is not None,
+            'cache': cache_source,
+            'tokens': rag_timings.pop('tokens', None),
+            'latency': {
+                'total_ms': round(total_time * 1000, 2),
+                'time_to_first_token_ms': rag_timings.get('first_token_ms'),
+                'rag_processing_ms': round(rag_time * 1000, 2),
+                'database_ms': round((conversation_time + db_time) * 1000, 2),
+                'breakdown': {
+                    'conversation_setup_ms': round(conversation_time * 1000, 2),
+                    'rag_query_ms': round(rag_time * 1000, 2),
+                    'database_save_ms': round(db_time * 1000, 2)
+                },
+                'rag_breakdown': rag_timings
+            }
+        })
+        # After 'done', so the client is not kept waiting for the summary
+        remember_turn(conversation, rag_service)
+    
+    response = StreamingHttpResponse(event_stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Disable proxy buffering (nginx) so events reach the client immediately
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def conversations_list(request):
@@ -301,3 +538,175 @@ def system_statistics(request):
             {'error': f'Failed to generate statistics: {str(e)}'},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
+
+
+# Admin-only knowledge base endpoints
+
+def _collection_service(collection, create=False):
+    """
+    (RAG service, None) for the collection an admin request names, or
+    (None, error response) for a malformed or unknown collection ID
+    """
+    try:
+        return get_rag_service(collection or None, create=create), None
+    except UnknownCollection as e:
+        return None, Response({'error': str(e)}, status=status.HTTP_404_NOT_FOUND)
+    except ValueError as e:
+        return None, Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def kb_document_upsert(request):
+    """
+    Add a knowledge base document or replace its content (Admin only)
+    
+    POST /admin/rag/documents
+    Body: {"document_id": "faq.txt", "text": "...", "collection": "acme" (optional)}
+    Returns: Counts of added, deleted and unchanged chunks
+    The first document added to a new collection creates it.
+    """
+    document_id = str(request.data.get('document_id', '')).strip()
+    text = request.data.get('text', '')
+    if not document_id or not isinstance(text, str):
+        return Response(
+            {'error': 'document_id and text are required'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    rag_service, error = _collection_service(request.data.get('collection'), create=True)
+    if error is not None:
+        return error
+    try:
+        result = rag_service.upsert_document(document_id, text)
+        return Response({
+            'document_id': document_id,
+            'collection': rag_service.collection,
+            'kb_version': rag_service.kb_version,
+            **result
+        }, status=status.HTTP_200_OK)
+    except RuntimeError as e:
+        return Response({'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+
+@api_view(['DELETE'])
+@permission_classes([IsAdminUser])
+def kb_document_delete(request, document_id):
+    """
+    Delete a knowledge base document and its chunks (Admin only)
+    
+    DELETE /admin/rag/documents/<document_id>/delete?collection=acme
+    Returns: Number of chunks deleted
+    """
+    rag_service, error = _collection_service(request.query_params.get('collection'))
+    if error is not None:
+        return error
+    try:
+        count = rag_service.delete_document(document_id)
+    except RuntimeError as e:
+        return Response({'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    
+    if count == 0:
+        return Response({'error': 'Document not found'}, status=status.HTTP_404_NOT_FOUND)
+    return Response({
+        'message': f'Deleted {count} chunks',
+        'deleted_count': count,
+        'kb_version': rag_service.kb_version
+    }, status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def kb_compact(request):
+    """
+    Compact the knowledge index now instead of waiting for the threshold (Admin only)
+    
+    POST /admin/rag/compact
+    Body: {"collection": "acme"} (optional)
+    Returns: Rows dropped and kept
+    """
+    rag_service, error = _collection_service(request.data.get('collection'))
+    if error is not None:
+        return error
+    try:
+        result = rag_service.compact_index()
+        return Response(result, status=status.HTTP_200_OK)
+    except RuntimeError as e:
+        return Response({'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def rag_status(request):
+    """
+    Get RAG service and index statistics (Admin only)
+    
+    GET /admin/rag/status?collection=acme
+    Returns: Index size, KB version, pending changes and chat job queue
+    """
+    rag_service, error = _collection_service(request.query_params.get('collection'))
+    if error is not None:
+        return error
+    data = rag_service.get_stats()
+    data['job_queue'] = get_job_queue().stats()
+    return Response(data, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def rag_collections(request):
+    """
+    Collections loaded in this worker and their memory use (Admin only)
+    
+    GET /admin/rag/collections
+    Returns: {"memory_budget_bytes": ..., "resident": 2, "resident_bytes": ..., "evictions": 0,
+              "collections": [{"collection": "acme", "resident": true, "memory_bytes": ...,
+                               "chunks": 120, "hits": 42, "loads": 1, "evictions": 0, ...}],
+              "available": ["default", "acme", ...]}
+    Resident collections come first, most recently used first. Counts are per worker process.
+    """
+    data = get_service_registry().stats()
+    data['available'] = list_collections()
+    return Response(data, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@authentication_classes([])
+@permission_classes([AllowAny])
+def health_live(request):
+    """
+    Liveness probe: the process is up and serving requests
+    
+    GET /healthz/live
+    Returns: {"status": "alive", "pid": 1234, "uptime_s": 12.3}
+    """
+    return Response({
+        'status': 'alive',
+        'pid': os.getpid(),
+        'uptime_s': round(time.time() - PROCESS_STARTED_AT, 1)
+    }, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@authentication_classes([])
+@permission_classes([AllowAny])
+def health_ready(request):
+    """
+    Readiness probe: the RAG service is initialized and can answer chats
+    
+    GET /healthz/ready
+    Returns: 200 {"status": "ready", "kb_version": "...", "index_size": 42,
+                  "model_load_ms": ..., "index_load_ms": ..., "initialize_ms": ...}
+             503 {"status": "starting" | "error", ...} while warming up or after a failed start
+    """
+    rag_service = get_rag_service()
+    if not rag_service.initialized:
+        # Warm-up is off or failed: start (or retry) it so the worker can become ready
+        rag_service.warm_up()
+    data = rag_service.readiness()
+    data['pid'] = os.getpid()
+    data['uptime_s'] = round(time.time() - PROCESS_STARTED_AT, 1)
+    return Response(
+        data,
+        status=status.HTTP_200_OK if data['ready'] else status.HTTP_503_SERVICE_UNAVAILABLE
+    )
@@ -127,3 +127,212 @@ EMAIL_PORT = int(os.getenv('EMAIL_PORT', '587'))
 EMAIL_USE_TLS = os.getenv('EMAIL_USE_TLS', 'True') == 'True'
 EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD')
+
+# RAG Configuration
+RAG_KNOWLEDGE_BASE_PATH = os.getenv('RAG_KNOWLEDGE_BASE_PATH', str(BASE_DIR / 'knowledge_base.txt'))
+RAG_EMBEDDING_MODEL = os.getenv('RAG_EMBEDDING_MODEL', 'all-MiniLM-L6-v2')
+# Embedding cache and versioned index snapshots
+RAG_INDEX_DIR = os.getenv('RAG_INDEX_DIR', str(BASE_DIR / 'rag_index'))
+# 'mmap' shares one read-only copy of the index between workers through the
+# OS page cache; 'memory' loads a private copy into every worker process
+RAG_INDEX_LAYOUT = os.getenv('RAG_INDEX_LAYOUT', 'mmap')
+# Compact the index once this fraction of its rows has been deleted
+RAG_COMPACTION_THRESHOLD = float(os.getenv('RAG_COMPACTION_THRESHOLD', '0.2'))
+# ...or once this many chunks were added since the last snapshot
+RAG_MAX_PENDING_CHUNKS = int(os.getenv('RAG_MAX_PENDING_CHUNKS', '10000'))
+# How often each worker checks for changes ingested by other processes
+RAG_INDEX_REFRESH_SECONDS = float(os.getenv('RAG_INDEX_REFRESH_SECONDS', '2'))
+# Vector index type: 'flat' (exact), 'ivf_flat', 'ivf_pq' or 'hnsw'.
+# Small corpora that cannot train IVF/PQ fall back to 'flat'.
+RAG_INDEX_TYPE = os.getenv('RAG_INDEX_TYPE', 'flat')
+RAG_INDEX_PARAMS = {
+    'nlist': int(os.getenv('RAG_IVF_NLIST', '0')),  # 0 = 4 * sqrt(num_chunks)
+    'nprobe': int(os.getenv('RAG_IVF_NPROBE', '8')),
+    'pq_m': int(os.getenv('RAG_PQ_M', '16')),
+    'pq_nbits': int(os.getenv('RAG_PQ_NBITS', '8')),
+    'hnsw_m': int(os.getenv('RAG_HNSW_M', '32')),
+    'ef_construction': int(os.getenv('RAG_HNSW_EF_CONSTRUCTION', '200')),
+    'ef_search': int(os.getenv('RAG_HNSW_EF_SEARCH', '64')),
+    'train_sample': int(os.getenv('RAG_TRAIN_SAMPLE_SIZE', '50000')),
+}
+# Retrieval mode: 'dense' (embeddings), 'lexical' (BM25) or 'hybrid' (both,
+# run concurrently and fused). Chat requests may override it per request.
+RAG_RETRIEVAL_MODE = os.getenv('RAG_RETRIEVAL_MODE', 'dense')
+# Hybrid fusion: 'rrf' (reciprocal rank) or 'weighted' (normalised scores)
+RAG_FUSION_METHOD = os.getenv('RAG_FUSION_METHOD', 'rrf')
+RAG_RRF_K = int(os.getenv('RAG_RRF_K', '60'))
+# Share of the fused score given to dense results (lexical gets the rest)
+RAG_HYBRID_DENSE_WEIGHT = float(os.getenv('RAG_HYBRID_DENSE_WEIGHT', '0.5'))
+# Candidates fetched from each retriever before fusion
+RAG_HYBRID_CANDIDATES = int(os.getenv('RAG_HYBRID_CANDIDATES', '20'))
+# In-process caches (per worker), bounded by approximate size in bytes.
+# Query embeddings are keyed by normalised query and model name; search
+# results are also keyed by KB version and dropped when it changes.
+RAG_QUERY_EMBEDDING_CACHE_BYTES = int(os.getenv('RAG_QUERY_EMBEDDING_CACHE_BYTES', str(8 * 1024 * 1024)))
+RAG_SEARCH_RESULT_CACHE_BYTES = int(os.getenv('RAG_SEARCH_RESULT_CACHE_BYTES', str(16 * 1024 * 1024)))
+# Optional entry lifetime in seconds (0 = until evicted)
+RAG_QUERY_CACHE_TTL = float(os.getenv('RAG_QUERY_CACHE_TTL', '0'))
+# Semantic answer cache: reuse an earlier answer when a new question's
+# embedding has at least this cosine similarity and the KB version, model
+# and prompt settings match. Off by default: a near-duplicate is not always
+# the same question, so enable it once the threshold suits your questions
+RAG_SEMANTIC_CACHE_ENABLED = os.getenv('RAG_SEMANTIC_CACHE_ENABLED', 'False') == 'True'
+RAG_SEMANTIC_CACHE_THRESHOLD = float(os.getenv('RAG_SEMANTIC_CACHE_THRESHOLD', '0.92'))
+RAG_SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv('RAG_SEMANTIC_CACHE_MAX_ENTRIES', '1000'))
+RAG_SEMANTIC_CACHE_TTL = float(os.getenv('RAG_SEMANTIC_CACHE_TTL', '3600'))
+# Gemini model used to generate answers
+RAG_GEMINI_MODEL = os.getenv('RAG_GEMINI_MODEL', 'gemini-2.5-flash')
+# Gemini client, created once per process and shared by all collections:
+# 'sdk' uses google-generativeai, 'rest' calls the REST API at
+# RAG_GEMINI_API_BASE over up to RAG_GEMINI_POOL_SIZE keep-alive connections
+RAG_GEMINI_TRANSPORT = os.getenv('RAG_GEMINI_TRANSPORT', 'sdk')
+RAG_GEMINI_API_BASE = os.getenv('RAG_GEMINI_API_BASE', 'https://generativelanguage.googleapis.com/v1beta')
+RAG_GEMINI_POOL_SIZE = int(os.getenv('RAG_GEMINI_POOL_SIZE', '8'))
+RAG_GEMINI_TIMEOUT = float(os.getenv('RAG_GEMINI_TIMEOUT', '60'))
+# Generation config; 0 / unset keeps the model's defaults
+RAG_GEMINI_MAX_OUTPUT_TOKENS = int(os.getenv('RAG_GEMINI_MAX_OUTPUT_TOKENS', '0'))
+RAG_GEMINI_TEMPERATURE = float(os.getenv('RAG_GEMINI_TEMPERATURE')) if os.getenv('RAG_GEMINI_TEMPERATURE') else None
+
+# Shared response and retrieval caches (all workers, survives restarts).
+# Keys include the normalised query, KB version, model names and prompt
+# template version. Point RAG_CACHE_BACKEND at Redis/Memcached/the database
+# cache to share across hosts.
+RAG_CACHE_ALIAS = 'rag'
+RAG_RESPONSE_CACHE_ENABLED = os.getenv('RAG_RESPONSE_CACHE_ENABLED', 'True') == 'True'
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    RAG_CACHE_ALIAS: {
+        'BACKEND': os.getenv('RAG_CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.getenv('RAG_CACHE_LOCATION', os.path.join(RAG_INDEX_DIR, 'response_cache')),
+        'TIMEOUT': int(os.getenv('RAG_CACHE_TIMEOUT', str(24 * 60 * 60))),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('RAG_CACHE_MAX_ENTRIES', '10000')),
+        },
+    },
+}
+
+# Micro-batching of query embeddings: concurrent requests are encoded in
+# one call of up to RAG_ENCODER_MAX_BATCH queries, waiting at most
+# RAG_ENCODER_MAX_WAIT_MS for more to arrive. False encodes each query alone.
+RAG_ENCODER_BATCHING = os.getenv('RAG_ENCODER_BATCHING', 'True') == 'True'
+RAG_ENCODER_MAX_BATCH = int(os.getenv('RAG_ENCODER_MAX_BATCH', '32'))
+RAG_ENCODER_MAX_WAIT_MS = float(os.getenv('RAG_ENCODER_MAX_WAIT_MS', '2'))
+# Answer generation backend: 'gemini', or 'fake' for a deterministic offline
+# backend that streams the retrieved context back (tests and benchmarks)
+RAG_LLM_BACKEND = os.getenv('RAG_LLM_BACKEND', 'gemini')
+RAG_FAKE_LLM_TOKEN_DELAY_MS = float(os.getenv('RAG_FAKE_LLM_TOKEN_DELAY_MS', '20'))
+# Fake LLM delay per 1000 prompt tokens, as a model reading its prompt
+RAG_FAKE_LLM_PROMPT_DELAY_MS = float(os.getenv('RAG_FAKE_LLM_PROMPT_DELAY_MS', '0'))
+# Threads for encoding and search on the async (ASGI) chat path; LLM calls
+# are awaited and do not use a thread
+RAG_ASYNC_EXECUTOR_WORKERS = int(os.getenv('RAG_ASYNC_EXECUTOR_WORKERS', '8'))
+
+# Background chat jobs (POST /api/chat with respond_async, polled via /api/chat/jobs/<id>)
+RAG_JOB_WORKERS = int(os.getenv('RAG_JOB_WORKERS', '2'))
+RAG_JOB_QUEUE_MAX_PENDING = int(os.getenv('RAG_JOB_QUEUE_MAX_PENDING', '100'))
+RAG_JOB_POLL_SECONDS = float(os.getenv('RAG_JOB_POLL_SECONDS', '1.0'))
+RAG_JOB_STALE_SECONDS = float(os.getenv('RAG_JOB_STALE_SECONDS', '600'))
+RAG_JOB_MAX_ATTEMPTS = int(os.getenv('RAG_JOB_MAX_ATTEMPTS', '3'))
+# Longest a status request on the async (ASGI) endpoint may long-poll; keep
+# below the load balancer's idle timeout
+RAG_JOB_LONG_POLL_MAX_SECONDS = float(os.getenv('RAG_JOB_LONG_POLL_MAX_SECONDS', '25'))
+# Longest a status request on /api/chat/jobs/<id> may block, holding a worker thread
+RAG_JOB_SYNC_WAIT_MAX_SECONDS = float(os.getenv('RAG_JOB_SYNC_WAIT_MAX_SECONDS', '1'))
+
+# Initialize the RAG service in the background when a server process starts,
+# so the first chat does not pay for model and index loading. /healthz/ready
+# answers 503 until it is done. Do not combine with gunicorn --preload.
+RAG_WARMUP = os.getenv('RAG_WARMUP', 'True') == 'True'
+
+# Knowledge base chunking: 'tokens' packs text into chunks of about
+# RAG_CHUNK_TOKENS estimated tokens, keeping headings and list items intact
+# and repeating RAG_CHUNK_OVERLAP_TOKENS when a paragraph is split;
+# 'paragraph' makes one chunk per blank-line separated paragraph
+RAG_CHUNKER = os.getenv('RAG_CHUNKER', 'tokens')
+RAG_CHUNK_TOKENS = int(os.getenv('RAG_CHUNK_TOKENS', '180'))
+RAG_CHUNK_OVERLAP_TOKENS = int(os.getenv('RAG_CHUNK_OVERLAP_TOKENS', '30'))
+RAG_CHUNK_MIN_TOKENS = int(os.getenv('RAG_CHUNK_MIN_TOKENS', '40'))
+
+# Bulk ingestion (manage.py ingest_docs): files are chunked by
+# RAG_INGEST_WORKERS processes (0 = one per core) and embedded
+# RAG_INGEST_BATCH_SIZE chunks at a time, in this process or split across
+# RAG_INGEST_EMBED_PROCESSES model replicas
+RAG_INGEST_WORKERS = int(os.getenv('RAG_INGEST_WORKERS', '0'))
+RAG_INGEST_BATCH_SIZE = int(os.getenv('RAG_INGEST_BATCH_SIZE', '1024'))
+RAG_INGEST_EMBED_PROCESSES = int(os.getenv('RAG_INGEST_EMBED_PROCESSES', '1'))
+
+# Storage of the embeddings searched by the flat index: 'float32' (exact),
+# 'float16' (half the memory), 'int8' (a quarter) or 'pq' (RAG_PQ_M bytes
+# per vector). Lossy storage re-ranks RAG_RESCORE_FACTOR * k candidates by
+# exact distance over the float32 rows kept on disk; 0 turns that off
+RAG_EMBEDDING_STORAGE = os.getenv('RAG_EMBEDDING_STORAGE', 'float32')
+RAG_RESCORE_FACTOR = int(os.getenv('RAG_RESCORE_FACTOR', '4'))
+
+# Embedding backend: 'sentence-transformers' (RAG_EMBEDDING_MODEL in
+# PyTorch), 'onnx' (the model exported by manage.py export_onnx_model to
+# RAG_ONNX_MODEL_DIR and run by onnxruntime, int8-quantized when
+# RAG_ONNX_QUANTIZED) or 'hashing' (deterministic, no model; for tests).
+# RAG_EMBEDDING_THREADS caps the backend's thread pool, 0 = one per core
+RAG_EMBEDDING_BACKEND = os.getenv('RAG_EMBEDDING_BACKEND', 'sentence-transformers')
+RAG_EMBEDDING_THREADS = int(os.getenv('RAG_EMBEDDING_THREADS', '0'))
+RAG_EMBEDDING_BATCH_SIZE = int(os.getenv('RAG_EMBEDDING_BATCH_SIZE', '32'))
+RAG_ONNX_MODEL_DIR = os.getenv('RAG_ONNX_MODEL_DIR', os.path.join(RAG_INDEX_DIR, 'onnx'))
+RAG_ONNX_QUANTIZED = os.getenv('RAG_ONNX_QUANTIZED', 'False') == 'True'
+RAG_HASHING_DIMENSION = int(os.getenv('RAG_HASHING_DIMENSION', '384'))
+
+# Collections (tenants): each has its own knowledge index under
+# RAG_COLLECTIONS_DIR, created by its first ingestion; the default one
+# serves RAG_KNOWLEDGE_BASE_PATH from RAG_INDEX_DIR. Each worker keeps
+# recently used collections loaded and evicts the least recently used
+# beyond RAG_COLLECTION_MEMORY_BUDGET_MB or RAG_MAX_RESIDENT_COLLECTIONS
+RAG_DEFAULT_COLLECTION = os.getenv('RAG_DEFAULT_COLLECTION', 'default')
+RAG_COLLECTIONS_DIR = os.getenv('RAG_COLLECTIONS_DIR', os.path.join(RAG_INDEX_DIR, 'collections'))
+RAG_COLLECTION_MEMORY_BUDGET_MB = int(os.getenv('RAG_COLLECTION_MEMORY_BUDGET_MB', '1024'))
+RAG_MAX_RESIDENT_COLLECTIONS = int(os.getenv('RAG_MAX_RESIDENT_COLLECTIONS', '16'))
+
+# Optional cross-encoder re-ranking: retrieve RAG_RERANK_CANDIDATES hits,
+# score them in batches of RAG_RERANK_BATCH_SIZE and keep the best top_k.
+# RAG_RERANKER is 'cross-encoder' (RAG_RERANKER_MODEL), 'fake' (word
+# overlap, for tests) or empty to turn re-ranking off. A request waits at
+# most RAG_RERANK_BUDGET_MS for the scores (0 = no limit), then keeps
+# retrieval order. RAG_RERANK_WORKERS scoring threads are shared by all requests
+RAG_RERANKER = os.getenv('RAG_RERANKER', '')
+RAG_RERANKER_MODEL = os.getenv('RAG_RERANKER_MODEL', 'cross-encoder/ms-marco-MiniLM-L-6-v2')
+RAG_RERANK_CANDIDATES = int(os.getenv('RAG_RERANK_CANDIDATES', '20'))
+RAG_RERANK_BATCH_SIZE = int(os.getenv('RAG_RERANK_BATCH_SIZE', '16'))
+RAG_RERANK_BUDGET_MS = float(os.getenv('RAG_RERANK_BUDGET_MS', '200'))
+RAG_RERANK_WORKERS = int(os.getenv('RAG_RERANK_WORKERS', '2'))
+RAG_FAKE_RERANKER_DELAY_MS = float(os.getenv('RAG_FAKE_RERANKER_DELAY_MS', '0'))
+
+# Diversification of the retrieved chunks before prompt construction:
+# retrieve RAG_MMR_CANDIDATES hits and pick top_k by Maximal Marginal
+# Relevance over their stored embeddings. RAG_MMR_LAMBDA trades relevance
+# (1.0) against novelty (0.0); candidates whose cosine similarity to a
+# picked chunk reaches RAG_DUPLICATE_THRESHOLD are dropped as near-duplicates
+RAG_MMR_ENABLED = os.getenv('RAG_MMR_ENABLED', 'True') == 'True'
+RAG_MMR_CANDIDATES = int(os.getenv('RAG_MMR_CANDIDATES', '12'))
+RAG_MMR_LAMBDA = float(os.getenv('RAG_MMR_LAMBDA', '0.7'))
+RAG_DUPLICATE_THRESHOLD = float(os.getenv('RAG_DUPLICATE_THRESHOLD', '0.95'))
+
+# Prompt token budget (estimated tokens, see chat/chunking.count_tokens):
+# the prompt template, the question, the context and RAG_ANSWER_TOKEN_RESERVE
+# tokens for the answer must fit in RAG_PROMPT_TOKEN_BUDGET (0 = no limit).
+# Context chunks go in best first; the first that does not fit is cut if
+# RAG_MIN_CONTEXT_CHUNK_TOKENS of it fit, and the rest are dropped. Conversation
+# memory that does not fit loses its oldest lines
+RAG_PROMPT_TOKEN_BUDGET = int(os.getenv('RAG_PROMPT_TOKEN_BUDGET', '2048'))
+RAG_ANSWER_TOKEN_RESERVE = int(os.getenv('RAG_ANSWER_TOKEN_RESERVE', '512'))
+RAG_MIN_CONTEXT_CHUNK_TOKENS = int(os.getenv('RAG_MIN_CONTEXT_CHUNK_TOKENS', '32'))
+
+# Conversation memory for follow-up questions (chat/memory.py): prompts
+# carry a rolling summary of older turns (at most RAG_MEMORY_SUMMARY_TOKENS)
+# plus the last RAG_MEMORY_RECENT_TURNS turns, each clipped to
+# RAG_MEMORY_TURN_TOKENS. RAG_MEMORY_SUMMARIZER is 'extractive' (no LLM
+# call) or 'llm' (one extra LLM call per turn that leaves the window)
+RAG_MEMORY_ENABLED = os.getenv('RAG_MEMORY_ENABLED', 'True') == 'True'
+RAG_MEMORY_RECENT_TURNS = int(os.getenv('RAG_MEMORY_RECENT_TURNS', '3'))
+RAG_MEMORY_TURN_TOKENS = int(os.getenv('RAG_MEMORY_TURN_TOKENS', '200'))
+RAG_MEMORY_SUMMARY_TOKENS = int(os.getenv('RAG_MEMORY_SUMMARY_TOKENS', '300'))
+RAG_MEMORY_SUMMARIZER = os.getenv('RAG_MEMORY_SUMMARIZER', 'extractive')